@@ -0,0 +1,713 @@
+#!./bin/python3
+""" Benchmark harness for the DriveInspector hot paths
+
+Started 2026-10-19
+
+Copyright (C) 2018-2026 Marc Donner
+
+Runs the expensive operations of DriveFileCached and DriveReport
+against synthetic caches (see drivefake.py) so that regressions can
+be measured offline, without credentials and without the network.
+
+Each (size, operation) pair runs in a fresh child process so that
+the peak RSS reported for it belongs to that operation alone.  The
+results can be saved as JSON and compared against a saved baseline:
+
+    ./bin/python3 drivebench.py --sizes 10000,100000 --save base.json
+    ... change some code ...
+    ./bin/python3 drivebench.py --sizes 10000,100000 --compare base.json
+
+With --compare the exit status is 1 if any operation got slower
+than the baseline by more than --threshold.
+
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from drivefake import FakeDriveService
+from drivefake import ROOT_ID
+from drivefake import make_file_data
+from drivefake import make_nodes
+from drivefake import make_shared_drives
+from drivenode import OwnerTable
+from drivenode import compact_node
+from drivetrie import PathTrie
+
+APPLICATION_NAME = 'Drive Bench'
+
+OPERATIONS = [
+    'dump_cache',
+    'load_cache',
+    'load_mapped_cache',
+    'get_path',
+    'register_node',
+    'list_children',
+    'resolve_path',
+    'canonicalize_path',
+    'canonicalize_path_cold',
+    'canonicalize_path_legacy',
+    'list_all_children',
+    'query_under',
+    'scan_drives',
+    'render_items_tsv',
+    'node_memory',
+    ]
+
+# Operations on the warm synthetic cache, which must be answered
+# without a single Drive API call
+WARM_OPERATIONS = [
+    'get_path',
+    'list_children',
+    'resolve_path',
+    'list_all_children',
+    'query_under',
+    'render_items_tsv',
+    ]
+
+# The number of shared drives for scan_drives
+SHARED_DRIVES = 8
+
+REPORT_FIELDS = [
+    'id',
+    'name',
+    'path',
+    'mimeType',
+    'size',
+    'owners',
+    'createdTime',
+    'shared',
+    'ownedByMe',
+    'parents',
+    'parentCount',
+    ]
+
+
+def legacy_canonicalize_path(cwd, path):
+    """canonicalize_path() as it was before the single-pass rewrite,
+       kept to time against and to check the rewrite with.
+       Returns: string
+    """
+    cwd_parts = cwd.split('/')[:-1]
+    path_parts = path.split('/')
+    new = path_parts if path and path[0] == '/' else cwd_parts + path_parts
+    while '..' in new:
+        where = new.index('..')
+        new = new[:where-1] + new[where+1:] if where >= 2 else new[where+1:]
+    while '.' in new:
+        where = new.index('.')
+        new = new[:where] + new[where+1:] if where >= 1 else new[where+1:]
+    while new and new[-1] == "":
+        new = new[:-1]
+    while '' in new[1:-1]:
+        where = new[1:-1].index('')
+        new = new[:where+1] + new[where+2:]
+    if new and new[0] != '':
+        new.insert(0, "")
+    new_path = '/'.join(new)
+    if not new_path:
+        new_path = '/'
+    return new_path
+
+
+def peak_rss_kb():
+    """Return the peak resident set size of this process.
+       Returns: integer (KiB)
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, MacOS reports bytes
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def api_calls(drive_file):
+    """Return the total number of Drive API calls made so far.
+       Returns: integer
+    """
+    return sum(drive_file.call_count.values())
+
+
+class Bench():
+    """Set up one synthetic Drive and time one operation against it."""
+
+    def __init__(self, size, seed, samples):
+        self.size = size
+        self.seed = seed
+        self.samples = samples
+        self.rng = random.Random(seed)
+        self.nodes = make_nodes(size, seed)
+        self.service = FakeDriveService(self.nodes)
+        self.workdir = tempfile.mkdtemp(prefix='drivebench-')
+        self.drive_file = None
+        self.notes = {}
+
+    def new_drive_file(self, report=False):
+        """Construct a DriveFileCached (or DriveReport) bound to the
+           fake service, with the full synthetic cache loaded.
+           Returns: DriveFileCached
+        """
+        # Imported here so that the parent process, which only
+        # spawns children, does not pay for them.
+        # pylint: disable=import-outside-toplevel
+        if report:
+            from drivereport import DriveReport
+            drive_file = DriveReport(False, self.service)
+        else:
+            from drivefilecached import DriveFileCached
+            drive_file = DriveFileCached(False, self.service)
+        drive_file.df_set_output(os.devnull)
+        drive_file.cache['path'] = \
+            os.path.join(self.workdir, '.filedata-cache.json')
+        drive_file.file_data = make_file_data(self.nodes)
+        # As load_cache() leaves it
+        drive_file.file_data['path'] = \
+            PathTrie(drive_file.file_data['path'])
+        if drive_file.COMPACT_NODES:
+            metadata = drive_file.file_data['metadata']
+            for node_id in metadata:
+                metadata[node_id] = \
+                    compact_node(metadata[node_id], drive_file.owner_table)
+        self.drive_file = drive_file
+        return drive_file
+
+    def sample(self, population):
+        """Return a deterministic sample from population.
+           Returns: list
+        """
+        count = min(self.samples, len(population))
+        return self.rng.sample(population, count)
+
+    def folder_ids(self):
+        """Return the node_ids of folders in the synthetic Drive."""
+        return [node['id'] for node in self.nodes \
+            if node['mimeType'] == 'application/vnd.google-apps.folder']
+
+    def linked_ids(self):
+        """Return the node_ids of nodes beneath My Drive."""
+        return [node['id'] for node in self.nodes if 'parents' in node]
+
+    def prepare(self, operation):
+        """Do the untimed setup for operation.
+           Returns: a callable that performs the timed work and
+           returns the number of calls it made.
+        """
+        return getattr(self, 'prepare_' + operation)()
+
+    def prepare_dump_cache(self):
+        """Time writing the whole cache out."""
+        drive_file = self.new_drive_file()
+        drive_file.file_data['dirty'] = True
+
+        def work():
+            drive_file.dump_cache()
+            return 1
+        return work
+
+    def prepare_load_cache(self):
+        """Time reading the whole cache in."""
+        drive_file = self.new_drive_file()
+        drive_file.file_data['dirty'] = True
+        drive_file.dump_cache()
+        drive_file.file_data = {}
+        self.nodes = []
+        gc.collect()
+
+        def work():
+            drive_file.load_cache()
+            return 1
+        return work
+
+    def prepare_load_mapped_cache(self):
+        """Time opening the mapped cache and looking up sampled nodes."""
+        drive_file = self.new_drive_file()
+        drive_file.cache['mapped_path'] = \
+            os.path.join(self.workdir, '.filedata-cache.mmap')
+        drive_file.cache['write_mapped'] = True
+        drive_file.file_data['dirty'] = True
+        drive_file.dump_cache()
+        drive_file.file_data = {}
+        node_ids = self.sample(self.linked_ids())
+        self.nodes = []
+        gc.collect()
+
+        def work():
+            drive_file.load_mapped_cache()
+            for node_id in node_ids:
+                drive_file.get(node_id)
+                drive_file.get_path(node_id)
+            return 1 + len(node_ids)
+        return work
+
+    def prepare_get_path(self):
+        """Time building every path from an empty path cache."""
+        drive_file = self.new_drive_file()
+        node_ids = [node['id'] for node in self.nodes]
+        drive_file.file_data['path'] = PathTrie({'<none>': "", 'root': "/"})
+
+        def work():
+            for node_id in node_ids:
+                drive_file.get_path(node_id)
+            return len(node_ids)
+        return work
+
+    def prepare_register_node(self):
+        """Time registering every node into an empty cache, as
+           list_all() does, with debugging off."""
+        drive_file = self.new_drive_file()
+        drive_file.file_data = make_file_data(self.nodes[:1])
+        drive_file.file_data['path'] = PathTrie(drive_file.file_data['path'])
+        register = getattr(drive_file, '_DriveFileCached__register_node')
+        nodes = self.nodes[1:]
+
+        def work():
+            register(nodes)
+            return len(nodes)
+        return work
+
+    def prepare_list_children(self):
+        """Time listing folders that are already in the cache."""
+        drive_file = self.new_drive_file()
+        folders = self.sample(self.folder_ids())
+
+        def work():
+            for node_id in folders:
+                drive_file.list_children(node_id)
+            return len(folders)
+        return work
+
+    def prepare_resolve_path(self):
+        """Time path => node_id lookups for cached nodes."""
+        drive_file = self.new_drive_file()
+        paths = [drive_file.file_data['path'][node_id].rstrip('/') \
+            for node_id in self.sample(self.linked_ids())]
+
+        def work():
+            for path in paths:
+                drive_file.resolve_path(path)
+            return len(paths)
+        return work
+
+    def canonical_cases(self):
+        """Build a mix of absolute and relative paths to canonicalize.
+           Returns: list of (cwd, path)
+        """
+        drive_file = self.new_drive_file()
+        paths = [drive_file.file_data['path'][node_id] \
+            for node_id in self.sample(self.linked_ids())]
+        cases = []
+        for path in paths:
+            parts = path.rstrip('/').split('/')
+            cwd = '/'.join(parts[:-1]) + '/'
+            cases.append(('/', path))
+            cases.append((cwd, parts[-1]))
+            cases.append((cwd, '../' + parts[-1] + '/./'))
+            cases.append((cwd, './/' + parts[-1]))
+        return cases
+
+    def prepare_canonicalize_path(self):
+        """Time canonicalizing a mix of absolute and relative paths,
+           as the shell does, with repeats answered from the memo."""
+        # pylint: disable=import-outside-toplevel
+        from drivefilecached import canonicalize_path
+        cases = self.canonical_cases()
+        repeat = 100
+
+        def work():
+            for _ in range(repeat):
+                for cwd, path in cases:
+                    canonicalize_path(cwd, path, False)
+            return repeat * len(cases)
+        return work
+
+    def prepare_canonicalize_path_cold(self):
+        """Time the canonicalizer itself, without the memo."""
+        # pylint: disable=import-outside-toplevel
+        from drivefilecached import canonical_path
+        uncached = canonical_path.__wrapped__
+        cases = self.canonical_cases()
+        repeat = 100
+
+        def work():
+            for _ in range(repeat):
+                for cwd, path in cases:
+                    uncached(cwd, path)
+            return repeat * len(cases)
+        return work
+
+    def prepare_canonicalize_path_legacy(self):
+        """Time the canonicalizer that the single-pass one replaced."""
+        cases = self.canonical_cases()
+        repeat = 100
+
+        def work():
+            for _ in range(repeat):
+                for cwd, path in cases:
+                    legacy_canonicalize_path(cwd, path)
+            return repeat * len(cases)
+        return work
+
+    def prepare_list_all_children(self):
+        """Time a find -a from the root on a warm cache."""
+        drive_file = self.new_drive_file()
+
+        def work():
+            drive_file.list_all_children(ROOT_ID, True)
+            return 1
+        return work
+
+    def prepare_query_under(self):
+        """Time under: queries (everything beneath a folder) on a warm
+           cache."""
+        drive_file = self.new_drive_file()
+        queries = ['under:' + drive_file.get_path(node_id) \
+            for node_id in self.sample(self.folder_ids())[:20]]
+        drive_file.list_query(queries[0])
+
+        def work():
+            for query in queries:
+                drive_file.list_query(query)
+            return len(queries)
+        return work
+
+    def prepare_scan_drives(self):
+        """Time scanning SHARED_DRIVES shared drives, with size nodes
+           between them, into an empty cache."""
+        # pylint: disable=import-outside-toplevel
+        from drivefilecached import DriveFileCached
+        drives, nodes = make_shared_drives(
+            SHARED_DRIVES, max(1, self.size // SHARED_DRIVES), self.seed)
+        self.service = FakeDriveService(self.nodes + nodes, drives=drives)
+        drive_file = DriveFileCached(False, self.service)
+        drive_file.df_set_output(os.devnull)
+        drive_file.init_cache()
+        self.drive_file = drive_file
+
+        def work():
+            drive_file.show_drives()
+            return len(nodes)
+        return work
+
+    def prepare_render_items_tsv(self):
+        """Time rendering the standard inventory report."""
+        drive_report = self.new_drive_file(report=True)
+        drive_report.set_render_fields(REPORT_FIELDS)
+        node_ids = [node['id'] for node in self.nodes]
+
+        def work():
+            drive_report.render_items_tsv(node_ids)
+            return len(node_ids)
+        return work
+
+    def prepare_node_memory(self):
+        """Measure the memory held by the cached nodes as the dicts
+           that json.load() produces and as DriveNodes.
+        """
+        self.new_drive_file()
+        text = json.dumps(self.nodes)
+        self.nodes = []
+        gc.collect()
+
+        def work():
+            tracemalloc.start()
+            loaded = json.loads(text)
+            as_dicts = tracemalloc.get_traced_memory()[0]
+            owner_table = OwnerTable()
+            compacted = [compact_node(node, owner_table) for node in loaded]
+            del loaded
+            gc.collect()
+            as_nodes = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            self.notes['dict_kb'] = as_dicts // 1024
+            self.notes['compact_kb'] = as_nodes // 1024
+            self.notes['saved_pct'] = \
+                round(100.0 * (as_dicts - as_nodes) / as_dicts, 1)
+            return len(compacted)
+        return work
+
+    def run(self, operation):
+        """Set up and time operation.
+           Returns: dict
+        """
+        work = self.prepare(operation)
+        gc.collect()
+        rss_before = peak_rss_kb()
+        calls_before = api_calls(self.drive_file)
+        requests_before = self.service.request_count
+        t_start = time.perf_counter()
+        count = work()
+        wall = time.perf_counter() - t_start
+        calls = api_calls(self.drive_file) - calls_before
+        if operation in WARM_OPERATIONS and calls:
+            # Timing a relist, not the cache
+            raise AssertionError(operation + " made " + str(calls) \
+                + " API calls on a warm cache")
+        return {
+            'operation': operation,
+            'size': self.size,
+            'wall_s': wall,
+            'count': count,
+            'per_call_us': 1e6 * wall / count if count else 0.0,
+            'rss_setup_kb': rss_before,
+            'rss_peak_kb': peak_rss_kb(),
+            'api_calls': calls,
+            'api_requests': self.service.request_count - requests_before,
+            'notes': self.notes,
+            }
+
+
+def run_child(args):
+    """Run a single (size, operation) pair and write the result."""
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+    bench = Bench(args.size, args.seed, args.samples)
+    result = bench.run(args.one)
+    with open(args.result, "w", encoding="utf-8") as result_file:
+        json.dump(result, result_file)
+
+
+def spawn(size, operation, args):
+    """Run one (size, operation) pair in a child process.
+       Returns: dict
+    """
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as tmp:
+        result_path = tmp.name
+    command = [
+        sys.executable, os.path.abspath(__file__),
+        '--one', operation,
+        '--size', str(size),
+        '--seed', str(args.seed),
+        '--samples', str(args.samples),
+        '--result', result_path,
+        ]
+    try:
+        child = subprocess.run(
+            command,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            check=False
+            )
+        if child.returncode != 0:
+            return {
+                'operation': operation,
+                'size': size,
+                'error': child.stderr.decode('utf-8', 'replace')[-2000:],
+                }
+        with open(result_path, "r", encoding="utf-8") as result_file:
+            return json.load(result_file)
+    finally:
+        os.unlink(result_path)
+
+
+def best_of(size, operation, args):
+    """Run (size, operation) args.repeat times and keep the fastest.
+       Returns: dict
+    """
+    best = None
+    for _ in range(args.repeat):
+        result = spawn(size, operation, args)
+        if 'error' in result:
+            return result
+        if best is None or result['wall_s'] < best['wall_s']:
+            best = result
+    return best
+
+
+def git_commit():
+    """Return the current git commit, if we can find it.
+       Returns: string
+    """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+            ).stdout.decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "?"
+
+
+def format_result(result):
+    """Render one result as a table row.
+       Returns: string
+    """
+    if 'error' in result:
+        return "%-26s %9d  ERROR: %s" % (
+            result['operation'], result['size'],
+            result['error'].strip().split('\n')[-1])
+    line = "%-26s %9d %10.4f %12.2f %10d %10d %8d" % (
+        result['operation'],
+        result['size'],
+        result['wall_s'],
+        result['per_call_us'],
+        result['rss_setup_kb'],
+        result['rss_peak_kb'],
+        result['api_calls'],
+        )
+    for key, value in sorted(result.get('notes', {}).items()):
+        line += "  " + key + ": " + str(value)
+    return line
+
+
+def compare(results, baseline, threshold):
+    """Compare results against a baseline run.
+       Returns: list of string (one per regression)
+    """
+    previous = {}
+    for result in baseline['results']:
+        if 'error' not in result:
+            previous[(result['operation'], result['size'])] = result
+    regressions = []
+    for result in results:
+        key = (result['operation'], result['size'])
+        if 'error' in result or key not in previous:
+            continue
+        old = previous[key]['wall_s']
+        new = result['wall_s']
+        # Ignore timings too small to measure reliably
+        if max(old, new) < 0.001:
+            continue
+        ratio = new / old if old else float('inf')
+        line = "%-26s %9d %10.4f -> %10.4f  x%.2f" % (
+            key[0], key[1], old, new, ratio)
+        if ratio > 1.0 + threshold:
+            regressions.append(line)
+            line += "  REGRESSION"
+        print(line)
+    return regressions
+
+
+def setup_parser():
+    """Set up the arguments parser.
+       Returns: parser
+    """
+    parser = argparse.ArgumentParser(
+        description=\
+        "Benchmark the DriveInspector hot paths against synthetic " + \
+        "caches, offline."\
+        )
+    parser.add_argument(
+        '--sizes',
+        type=str,
+        default='10000',
+        help='Comma-separated cache sizes in nodes (e.g. 10000,100000,1000000).'
+        )
+    parser.add_argument(
+        '--ops',
+        type=str,
+        default=','.join(OPERATIONS),
+        help='Comma-separated operations to run.  Default: all of ' + \
+            ', '.join(OPERATIONS) + '.'
+        )
+    parser.add_argument(
+        '--samples',
+        type=int,
+        default=200,
+        help='Number of folders or paths to sample for lookup operations.'
+        )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=2018,
+        help='Random seed for the synthetic Drive.'
+        )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=1,
+        help='Run each operation this many times and keep the fastest.'
+        )
+    parser.add_argument(
+        '--save',
+        type=str,
+        help='Write the results as JSON to the specified file.'
+        )
+    parser.add_argument(
+        '--compare',
+        type=str,
+        help='Compare against results previously saved with --save.'
+        )
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.25,
+        help='(Modifier) Slowdown fraction that counts as a regression.'
+        )
+    # Internal: run one operation in this process
+    parser.add_argument('--one', type=str, help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result', type=str, help=argparse.SUPPRESS)
+    return parser
+
+
+def do_work():
+    """Parse arguments and run the benchmarks."""
+    parser = setup_parser()
+    args = parser.parse_args()
+
+    if args.one:
+        run_child(args)
+        return 0
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    operations = [op for op in args.ops.split(',') if op]
+    for operation in operations:
+        if operation not in OPERATIONS:
+            parser.error("unknown operation: " + operation)
+
+    print("# commit: " + git_commit())
+    print("%-26s %9s %10s %12s %10s %10s %8s" % (
+        'operation', 'size', 'wall_s', 'per_call_us',
+        'setup_kb', 'peak_kb', 'api'))
+    results = []
+    for size in sizes:
+        for operation in operations:
+            result = best_of(size, operation, args)
+            results.append(result)
+            print(format_result(result))
+            sys.stdout.flush()
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as save_file:
+            json.dump(
+                {
+                    'commit': git_commit(),
+                    'time': time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'results': results,
+                },
+                save_file, indent=3, separators=(',', ': ')
+                )
+        print("# Wrote " + str(len(results)) + " results to " + args.save)
+
+    status = 0
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        print("# compared with " + args.compare \
+            + " (commit " + str(baseline.get('commit', '?')) + ")")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("# " + str(len(regressions)) + " regression(s) over " \
+                + str(int(args.threshold * 100)) + "%")
+            status = 1
+    if any('error' in result for result in results):
+        status = 1
+    return status
+
+
+def main():
+    """Run the benchmarks."""
+    sys.exit(do_work())
+
+
+if __name__ == '__main__':
+    main()
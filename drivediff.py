@@ -0,0 +1,99 @@
+""" Tree diff between two snapshots of the DriveFileCached cache
+
+Started 2026-10-19
+
+Copyright (C) 2018-2026 Marc Donner
+
+An old cache file (e.g. one kept by make snapshot) and the current
+cache are compared node by node, on node_id, with a hash join: the
+old snapshot's metadata is already a dict, so each current node is
+looked up in it once, and the old nodes never seen are the ones that
+have gone.  Two passes, no sorting, so the time is linear in the
+sizes of the two snapshots.
+
+Each difference is one of:
+
+    added :: in the current cache only
+    removed :: in the old snapshot only
+    renamed :: its name has changed
+    moved :: its parents have changed
+    resized :: its size has changed
+
+A node that has been both renamed and moved is reported once for
+each.  A node whose path changed only because a folder above it was
+renamed or moved is not reported; the folder is.
+
+"""
+
+import gzip
+import json
+
+from driveoutput import compression_for
+from drivequery import node_size
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# The kinds of difference, in the order they are counted
+CHANGES = ('added', 'removed', 'renamed', 'moved', 'resized')
+
+
+def load_snapshot(path):
+    """Read a cache file, which may be compressed like --output files.
+       Returns: dict (the file_data written by dump_cache())
+    """
+    compression = compression_for(path)
+    if compression == 'gzip':
+        with gzip.open(path, "rb") as snapshot_file:
+            return json.load(snapshot_file)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError("reading " + path \
+                + " needs the zstandard package")
+        with open(path, "rb") as raw, \
+                zstandard.ZstdDecompressor().stream_reader(raw) \
+                as snapshot_file:
+            return json.load(snapshot_file)
+    with open(path, "r", encoding="utf-8") as snapshot_file:
+        return json.load(snapshot_file)
+
+
+def is_node(node, node_id):
+    """Is node the node filed under node_id, rather than an alias
+       (such as 'root'), a placeholder or a dropped node?
+       Returns: Boolean
+    """
+    return bool(node) and node.get('id') == node_id
+
+
+def diff_nodes(old_nodes, new_nodes, old_path, new_path):
+    """Compare two snapshots of the cache.
+       old_nodes :: dict of node_id => node
+       new_nodes :: iterable of (node_id, node)
+       old_path, new_path :: functions of node_id returning its path
+            in that snapshot
+       Yields: (change, node_id, old path, new path, detail)
+    """
+    seen = set()
+    for node_id, node in new_nodes:
+        seen.add(node_id)
+        old = old_nodes.get(node_id)
+        if not is_node(old, node_id):
+            yield ('added', node_id, '', new_path(node_id), '')
+            continue
+        if old['name'] != node['name']:
+            yield ('renamed', node_id, old_path(node_id), new_path(node_id),
+                   '')
+        if list(old.get('parents', [])) != list(node.get('parents', [])):
+            yield ('moved', node_id, old_path(node_id), new_path(node_id),
+                   '')
+        old_size = node_size(old)
+        size = node_size(node)
+        if old_size != size:
+            yield ('resized', node_id, old_path(node_id), new_path(node_id),
+                   str(old_size) + ' => ' + str(size))
+    for node_id, old in old_nodes.items():
+        if node_id not in seen and is_node(old, node_id):
+            yield ('removed', node_id, old_path(node_id), '', '')
@@ -0,0 +1,83 @@
+""" Duplicate file detection for the DriveFileCached cache
+
+Started 2026-10-19
+
+Copyright (C) 2018-2026 Marc Donner
+
+Two files hold the same content when they have the same size and the
+same md5Checksum.  The Drive only returns md5Checksum when it is asked
+for (see DriveFileRaw.OPTIONAL_FIELDS and --checksums), and only for
+files with binary content: Google Docs, Sheets and the like have no
+checksum and are never reported.
+
+DuplicateIndex keeps the cached nodes in a size => md5Checksum =>
+node_ids table, so finding every group of duplicates is one pass over
+the nodes to build it and one pass over the sizes to read it out.
+
+"""
+
+from drivequery import node_size
+
+# Native Google files (Docs, Sheets, ...) never have an md5Checksum
+GOOGLE_APPS = 'application/vnd.google-apps.'
+
+
+def node_checksum(node):
+    """Returns: string, or None if the node has no md5Checksum"""
+    return node.get('md5Checksum') or None
+
+
+class DuplicateIndex():
+    """Cached nodes by size and md5Checksum."""
+
+    def __init__(self):
+        self.by_size = {}
+        # node_ids with content (a size) but no md5Checksum
+        self.unchecked = set()
+
+    def build(self, metadata):
+        """Index every node in metadata, in one pass."""
+        for node_id, node in metadata.items():
+            if node and node['id'] == node_id:
+                self.add(node_id, node)
+
+    def add(self, node_id, node):
+        """Index node under node_id."""
+        size = node_size(node)
+        if not size or node.get('trashed'):
+            return
+        checksum = node_checksum(node)
+        if checksum is None:
+            if not str(node.get('mimeType')).startswith(GOOGLE_APPS):
+                self.unchecked.add(node_id)
+            return
+        self.by_size.setdefault(size, {}) \
+            .setdefault(checksum, set()).add(node_id)
+
+    def remove(self, node_id, node):
+        """Take node (as it was indexed) out of the index."""
+        self.unchecked.discard(node_id)
+        size = node_size(node)
+        checksum = node_checksum(node)
+        by_checksum = self.by_size.get(size)
+        if by_checksum is None or checksum not in by_checksum:
+            return
+        by_checksum[checksum].discard(node_id)
+        if not by_checksum[checksum]:
+            del by_checksum[checksum]
+            if not by_checksum:
+                del self.by_size[size]
+
+    def groups(self):
+        """Find the sets of nodes with identical content, most wasted
+           bytes ((copies - 1) * size) first.
+           Returns: list of (size, md5Checksum, sorted list of node_id)
+        """
+        result = []
+        for size, by_checksum in self.by_size.items():
+            for checksum, node_ids in by_checksum.items():
+                if len(node_ids) > 1:
+                    result.append((size, checksum, sorted(node_ids)))
+        result.sort(key=lambda group: (-(len(group[2]) - 1) * group[0],
+                                       group[1]))
+        return result
@@ -0,0 +1,488 @@
+""" Synthetic Drive trees and a stand-in for the Drive API service
+
+Started 2026-10-19
+
+Copyright (C) 2018-2026 Marc Donner
+
+This module lets us exercise DriveFileRaw, DriveFileCached and
+DriveReport without credentials or a network.  It has two parts:
+
+    make_nodes() :: build a deterministic synthetic collection of
+            nodes shaped like the ones the Drive API returns.
+    make_shared_drives() :: build shared drives and the nodes in
+            them, to hand to FakeDriveService with drives=.
+    make_file_data() :: turn that collection into the structure that
+            DriveFileCached keeps in self.file_data (and writes to
+            the cache file).
+    FakeDriveService :: an object with the same call shape as the
+            service built by googleapiclient.discovery.build(), i.e.
+            service.files().list(...).execute(), answering queries
+            from a list of nodes.  Nodes in shared drives (those with
+            a driveId) are only returned to calls that ask for them,
+            as the Drive API does.  new_batch_http_request() batches
+            are run one request at a time.
+
+"""
+
+import random
+import time
+
+import httplib2
+from googleapiclient import errors
+
+FOLDERMIMETYPE = 'application/vnd.google-apps.folder'
+
+ROOT_ID = '0ROOT'
+
+FILE_MIMETYPES = [
+    'application/pdf',
+    'application/vnd.google-apps.document',
+    'application/vnd.google-apps.spreadsheet',
+    'application/vnd.google-apps.presentation',
+    'image/jpeg',
+    'image/png',
+    'text/plain',
+    'application/zip',
+    ]
+
+NAME_STEMS = [
+    'notes', 'budget', 'draft', 'photo', 'report', 'minutes',
+    'plan', 'invoice', 'scan', 'letter', 'slides', 'data',
+    ]
+
+
+def make_owner(email, me):
+    """Construct an owner record like the ones in node['owners'].
+       Returns: dict
+    """
+    return {
+        'kind': 'drive#user',
+        'displayName': email.split('@')[0],
+        'me': me,
+        'permissionId': str(abs(hash(email)) % 10**20),
+        'emailAddress': email,
+        }
+
+
+def make_time(rng):
+    """Construct a plausible RFC 3339 timestamp.
+       Returns: string
+    """
+    return "%04d-%02d-%02dT%02d:%02d:%02d.%03dZ" % (
+        rng.randint(2010, 2025),
+        rng.randint(1, 12),
+        rng.randint(1, 28),
+        rng.randint(0, 23),
+        rng.randint(0, 59),
+        rng.randint(0, 59),
+        rng.randint(0, 999),
+        )
+
+
+def make_nodes(num_nodes, seed=2018, folder_ratio=0.1, shared_ratio=0.02):
+    """Build a synthetic Drive of num_nodes nodes under a My Drive root.
+       About folder_ratio of the nodes are folders and about
+       shared_ratio are files shared to us by others with no parents.
+       Returns: list of node (the root first, parents before children)
+    """
+    rng = random.Random(seed)
+    my_email = 'me@example.com'
+    me = make_owner(my_email, True)
+    others = [make_owner('user%d@example.org' % i, False) for i in range(50)]
+
+    root = {
+        'id': ROOT_ID,
+        'name': 'My Drive',
+        'mimeType': FOLDERMIMETYPE,
+        'owners': [me],
+        'trashed': False,
+        'modifiedTime': make_time(rng),
+        'createdTime': make_time(rng),
+        'ownedByMe': True,
+        'shared': False,
+        }
+    nodes = [root]
+    folders = [ROOT_ID]
+    for i in range(1, num_nodes):
+        node_id = 'N%07d' % i
+        is_shared = rng.random() < shared_ratio
+        is_folder = not is_shared and \
+            (rng.random() < folder_ratio or len(folders) < 2)
+        created = make_time(rng)
+        node = {
+            'id': node_id,
+            'trashed': rng.random() < 0.01,
+            'modifiedTime': max(created, make_time(rng)),
+            'createdTime': created,
+            }
+        if is_folder:
+            node['name'] = 'folder-%d' % i
+            node['mimeType'] = FOLDERMIMETYPE
+        else:
+            node['name'] = '%s-%d.dat' % (rng.choice(NAME_STEMS), i)
+            node['mimeType'] = rng.choice(FILE_MIMETYPES)
+            node['size'] = str(rng.randint(0, 50 * 1024 * 1024))
+        if is_shared:
+            owner = rng.choice(others)
+            node['owners'] = [owner]
+            node['ownedByMe'] = False
+            node['shared'] = True
+        else:
+            node['parents'] = [folders[rng.randrange(len(folders))]]
+            node['owners'] = [me]
+            node['ownedByMe'] = True
+            node['shared'] = rng.random() < 0.1
+        nodes.append(node)
+        if is_folder:
+            folders.append(node_id)
+    return nodes
+
+
+def make_shared_drives(num_drives, nodes_per_drive, seed=2019,
+                       folder_ratio=0.1):
+    """Build num_drives shared drives of nodes_per_drive nodes each.
+       Nodes in a shared drive carry its driveId and, like those the
+       Drive returns, have no owners.
+       Returns: (list of drive, list of node), the node for the top
+       folder of each drive first in its drive
+    """
+    rng = random.Random(seed)
+    drives = []
+    nodes = []
+    for d in range(num_drives):
+        drive_id = '0D%03d' % d
+        drive = {'id': drive_id, 'name': 'Team %d' % d}
+        drives.append(drive)
+        nodes.append({
+            'id': drive_id,
+            'name': drive['name'],
+            'mimeType': FOLDERMIMETYPE,
+            'driveId': drive_id,
+            'trashed': False,
+            'modifiedTime': make_time(rng),
+            'createdTime': make_time(rng),
+            })
+        folders = [drive_id]
+        for i in range(1, nodes_per_drive):
+            node_id = 'D%03dN%06d' % (d, i)
+            created = make_time(rng)
+            node = {
+                'id': node_id,
+                'parents': [folders[rng.randrange(len(folders))]],
+                'driveId': drive_id,
+                'trashed': False,
+                'modifiedTime': max(created, make_time(rng)),
+                'createdTime': created,
+                'shared': True,
+                }
+            if rng.random() < folder_ratio:
+                node['name'] = 'folder-%d' % i
+                node['mimeType'] = FOLDERMIMETYPE
+                folders.append(node_id)
+            else:
+                node['name'] = '%s-%d.dat' % (rng.choice(NAME_STEMS), i)
+                node['mimeType'] = rng.choice(FILE_MIMETYPES)
+                node['size'] = str(rng.randint(0, 50 * 1024 * 1024))
+            nodes.append(node)
+    return drives, nodes
+
+
+def make_file_data(nodes):
+    """Build the DriveFileCached file_data structure for a list of
+       nodes produced by make_nodes(), with every path computed and
+       every folder marked as listed, as a warm cache would be.
+       Returns: dict
+    """
+    file_data = {}
+    file_data['path'] = {'<none>': "", 'root': "/"}
+    file_data['time'] = {'<none>': 0}
+    file_data['ref_count'] = {'<none>': 0}
+    file_data['cwd'] = '/'
+    file_data['metadata'] = {'<none>': {}}
+    file_data['dirty'] = False
+    file_data['listed'] = {}
+    file_data['partial'] = {}
+    file_data['negative'] = {}
+    file_data['fetched'] = {}
+    paths = file_data['path']
+    now = time.time()
+    for node in nodes:
+        node_id = node['id']
+        file_data['metadata'][node_id] = node
+        file_data['ref_count'][node_id] = 1
+        is_folder = node['mimeType'] == FOLDERMIMETYPE
+        if is_folder:
+            file_data['listed'][node_id] = now
+        if node_id == ROOT_ID:
+            paths[node_id] = "/"
+            continue
+        if 'parents' in node:
+            parent_path = paths[node['parents'][0]]
+        else:
+            parent_path = '~' + node['owners'][0]['emailAddress'] + '/.../'
+            paths[parent_path] = parent_path
+        paths[node_id] = parent_path + node['name'] + \
+            ('/' if is_folder else '')
+    file_data['metadata']['root'] = nodes[0]
+    file_data['ref_count']['root'] = 1
+    return file_data
+
+
+class FakeRequest():
+    """A deferred call, like googleapiclient's HttpRequest."""
+
+    def __init__(self, function, kwargs):
+        self.function = function
+        self.kwargs = kwargs
+
+    def execute(self):
+        """Perform the call.
+           Returns: dict
+        """
+        return self.function(**self.kwargs)
+
+
+class FakeBatch():
+    """A batch of requests, like googleapiclient's BatchHttpRequest."""
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        """Add request to the batch."""
+        request_id = request_id if request_id is not None \
+            else str(len(self.requests) + 1)
+        self.requests.append((request_id, request, callback))
+
+    def execute(self):
+        """Perform each call, handing its response or error to the
+           callback."""
+        for request_id, request, callback in self.requests:
+            callback = callback if callback else self.callback
+            try:
+                response, exception = request.execute(), None
+            except errors.HttpError as error:
+                response, exception = None, error
+            callback(request_id, response, exception)
+
+
+class FakeFiles():
+    """The files() collection of FakeDriveService."""
+
+    def __init__(self, service):
+        self.service = service
+
+    def get(self, **kwargs):
+        """files().get(fileId=..., fields=...)"""
+        return FakeRequest(self.service.do_get, kwargs)
+
+    def list(self, **kwargs):
+        """files().list(q=..., pageToken=..., fields=...)"""
+        return FakeRequest(self.service.do_list, kwargs)
+
+
+class FakeDrives():
+    """The drives() collection of FakeDriveService."""
+
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, **kwargs):
+        """drives().list(pageToken=..., pageSize=..., fields=...)"""
+        return FakeRequest(self.service.do_list_drives, kwargs)
+
+
+class FakeDriveService():
+    """Answer Drive API v3 files().get() and files().list() calls from
+       an in-memory list of nodes.  Only the query forms that the
+       DriveFile classes generate are understood.
+    """
+
+    PAGE_SIZE = 100
+
+    def __init__(self, nodes, page_size=None, drives=None):
+        self.nodes = {}
+        self.children = {}
+        self.order = []
+        self.page_size = page_size if page_size else self.PAGE_SIZE
+        self.request_count = 0
+        self.drive_list = list(drives) if drives else []
+        # driveId => node_ids in that shared drive, but for its top folder
+        self.in_drive = {}
+        for node in nodes:
+            self.update_node(node)
+        self.root_id = nodes[0]['id'] if nodes else ROOT_ID
+
+    def files(self):
+        """Return the files() collection."""
+        return FakeFiles(self)
+
+    def drives(self):
+        """Return the drives() collection."""
+        return FakeDrives(self)
+
+    def new_batch_http_request(self, callback=None):
+        """Return an empty batch."""
+        return FakeBatch(callback)
+
+    def update_node(self, node):
+        """Add node, or replace the node with its id, as a change made
+           in the Drive since it was cached."""
+        node_id = node['id']
+        if node_id in self.nodes:
+            self.remove_node(node_id)
+        self.nodes[node_id] = node
+        self.order.append(node_id)
+        for parent_id in node.get('parents', []):
+            self.children.setdefault(parent_id, []).append(node_id)
+        if node.get('driveId', node_id) != node_id:
+            self.in_drive.setdefault(node['driveId'], []).append(node_id)
+
+    def remove_node(self, node_id):
+        """Delete node_id from the Drive."""
+        node = self.nodes.pop(node_id)
+        self.order.remove(node_id)
+        for parent_id in node.get('parents', []):
+            self.children[parent_id].remove(node_id)
+        if node.get('driveId', node_id) != node_id:
+            self.in_drive[node['driveId']].remove(node_id)
+
+    def do_get(self, fileId, fields=None, supportsAllDrives=False):
+        """Implement files().get()."""
+        # pylint: disable=invalid-name,unused-argument
+        self.request_count += 1
+        node_id = self.root_id if fileId == 'root' else fileId
+        if node_id not in self.nodes \
+                or ('driveId' in self.nodes[node_id] and not supportsAllDrives):
+            raise errors.HttpError(
+                httplib2.Response({'status': 404}),
+                b'{"error": {"message": "File not found."}}'
+                )
+        return answer(self.nodes[node_id], fields)
+
+    def do_list(self, q=None, pageToken=None, fields=None, pageSize=None,
+                corpora=None, driveId=None, includeItemsFromAllDrives=False,
+                supportsAllDrives=False):
+        """Implement files().list()."""
+        # pylint: disable=invalid-name,unused-argument,too-many-arguments
+        self.request_count += 1
+        if corpora == 'drive':
+            if not (driveId and includeItemsFromAllDrives \
+                    and supportsAllDrives):
+                raise errors.HttpError(
+                    httplib2.Response({'status': 400}),
+                    b'{"error": {"message": "Invalid Value"}}'
+                    )
+            candidates = self.in_drive.get(driveId, []) if not q \
+                else [node_id for node_id in self.match(q) \
+                    if self.nodes[node_id].get('driveId') == driveId \
+                    and node_id != driveId]
+        elif corpora == 'allDrives' and includeItemsFromAllDrives:
+            # Everything but the top folders of the shared drives
+            candidates = [node_id for node_id in self.match(q) \
+                if self.nodes[node_id].get('driveId') != node_id]
+        elif self.drive_list:
+            candidates = [node_id for node_id in self.match(q) \
+                if 'driveId' not in self.nodes[node_id]]
+        else:
+            candidates = self.match(q)
+        start = int(pageToken) if pageToken else 0
+        size = pageSize if pageSize else self.page_size
+        page = candidates[start:start + size]
+        response = {'files': [answer(self.nodes[node_id], fields) \
+            for node_id in page]}
+        if start + size < len(candidates):
+            response['nextPageToken'] = str(start + size)
+        return response
+
+    def do_list_drives(self, pageToken=None, pageSize=None, fields=None):
+        """Implement drives().list()."""
+        # pylint: disable=invalid-name,unused-argument
+        self.request_count += 1
+        start = int(pageToken) if pageToken else 0
+        size = pageSize if pageSize else self.page_size
+        response = {'drives': [dict(drive, kind='drive#drive') \
+            for drive in self.drive_list[start:start + size]]}
+        if start + size < len(self.drive_list):
+            response['nextPageToken'] = str(start + size)
+        return response
+
+    def match(self, query):
+        """Evaluate a (very) small subset of the Drive query language.
+           Returns: list of node_id
+        """
+        if not query:
+            return self.order
+        candidates = None
+        tests = []
+        for clause in split_query(query):
+            if clause.endswith(' in parents'):
+                parent_id = unquote(clause[:-len(' in parents')])
+                if parent_id == 'root':
+                    parent_id = self.root_id
+                candidates = self.children.get(parent_id, [])
+            elif clause.startswith('name = '):
+                name = unquote(clause[len('name = '):])
+                tests.append(lambda node, name=name: node['name'] == name)
+            elif clause.startswith('modifiedTime > '):
+                date = unquote(clause[len('modifiedTime > '):])
+                tests.append(
+                    lambda node, date=date: node['modifiedTime'] > date)
+            elif clause == 'trashed = false':
+                tests.append(lambda node: not node['trashed'])
+            else:
+                raise ValueError("FakeDriveService: can not parse '" \
+                    + clause + "'")
+        if candidates is None:
+            candidates = self.order
+        return [node_id for node_id in candidates \
+            if all(test(self.nodes[node_id]) for test in tests)]
+
+
+def answer(node, fields):
+    """Copy node for a response, leaving out the optional fields (see
+       DriveFileRaw.OPTIONAL_FIELDS) that were not asked for.
+       Returns: dict
+    """
+    result = dict(node)
+    if 'md5Checksum' in result and 'md5Checksum' not in (fields or ""):
+        del result['md5Checksum']
+    return result
+
+
+def split_query(query):
+    """Split a query on ' and ' outside of quoted strings.
+       Returns: list of string
+    """
+    clauses = []
+    current = ""
+    quoted = False
+    i = 0
+    while i < len(query):
+        char = query[i]
+        if char == '\\' and quoted:
+            current += query[i:i+2]
+            i += 2
+            continue
+        if char == "'":
+            quoted = not quoted
+        if not quoted and query[i:i+5].lower() == ' and ':
+            clauses.append(current.strip())
+            current = ""
+            i += 5
+            continue
+        current += char
+        i += 1
+    clauses.append(current.strip())
+    return [clause for clause in clauses if clause]
+
+
+def unquote(literal):
+    """Turn a quoted query literal back into a string.
+       Returns: string
+    """
+    literal = literal.strip()
+    if literal[:1] == "'" and literal[-1:] == "'":
+        literal = literal[1:-1]
+    return literal.replace("\\'", "'").replace("\\\\", "\\")
@@ -15,18 +15,72 @@ design conventions for this code.
 
 import argparse
 import datetime
+import functools
+import hashlib
 import json
+import logging
 import os
+import re
 # import sys
 import time
-
+from collections import ChainMap
+from collections import deque
+
+from googleapiclient import errors
+
+from drivefresh import EXPIRED
+from drivefresh import FRESH
+from drivefresh import STALE
+from drivefresh import FreshnessPolicy
+from drivefresh import parse_max_age
+from drivediff import CHANGES
+from drivediff import diff_nodes
+from drivediff import load_snapshot
+from drivedupes import DuplicateIndex
+from drivelock import CacheLock
+from drivelog import debug_enabled
+from drivelog import get_logger
+from drivelog import parse_log_levels
+from drivelog import set_debug_logging
+from drivelog import setup_logging
+from drivelru import BoundedStore
+from drivelru import dump_json
+from drivelru import parse_size
+from drivequery import QueryError
+from drivequery import QueryIndex
+from drivequery import parse_query
+from drivequery import run_query
+from drivepaths import SHARED_DRIVES
+from drivepaths import PathIndex
+from drivetrie import PathTrie
+from drivetrie import path_table
+from driverollup import RollupIndex
+from drivenode import OwnerTable
+from drivenode import compact_node
+from drivenode import date_to_millis
+from drivenode import millis_to_time
+from drivenode import node_millis
+from drivenode import plain
+from drivemmap import MappedCache
+from drivemmap import MappedFetched
+from drivemmap import MappedMetadata
+from drivemmap import MappedPaths
+from drivemmap import write_mapped_cache
+from driveoutput import OutputFile
+from driveoutput import read_checksum
+from driveoutput import write_checksum
+from driveprofile import WorkProfiler
+from driveprofile import profile_prefix
 from drivefileraw import DriveFileRaw
+from drivefileraw import LazyJSON
+from drivefileraw import drive_root_node
 from drivefileraw import handle_find
 from drivefileraw import handle_ls
 from drivefileraw import handle_newer
 from drivefileraw import handle_showall
 from drivefileraw import handle_stat
 from drivefileraw import handle_status
+from drivefileraw import is_pruned
 from drivefileraw import pretty_json
 from drivefileraw import TestStats
 
@@ -36,6 +90,92 @@ from drivefileraw import TestStats
 
 APPLICATION_NAME = 'Drive Inspector'
 
+LOG = get_logger('cached')
+
+# The environment variable that names the cache file, for --cache
+CACHE_ENV = 'DRIVE_INSPECTOR_CACHE'
+
+# Members of file_data added since the first cache format, which older
+# cache files lack.
+INDEX_KEYS = ['listed', 'partial', 'negative', 'fetched']
+
+# What resolve_path() returns, instead of a node_id, when a path does
+# not lead to exactly one node
+LOOKUP_FAILURES = ('<not_found>', '<error>', '<too_many_matches>')
+
+# What check_cache() looks for, in the order --fsck reports it
+FSCK_PROBLEMS = [
+    ('bad_id', "nodes filed under another node's id"),
+    ('missing_parent', "parents that are not in the cache"),
+    ('bad_path', "nodes whose path does not follow from their parent's"),
+    ('ref_count', "nodes without a ref_count, or ref_counts without a node"),
+    ('stray', "path, fetched, listed or partial entries without a node"),
+]
+
+# An absolute path with no empty, '.' or '..' components, which is
+# canonical as it stands (but for a trailing '/')
+CANONICAL_PATH = re.compile(r'(?:/(?!\.\.?(?:/|$))[^/]+)+/?|/')
+
+# The start of a path beneath one of the synthetic roots: a shared
+# drive (~drives/NAME/...) or another user's files (~EMAIL/.../...).
+# Any other path that begins with '~' is a name relative to the cwd.
+SYNTHETIC_ROOT = re.compile(
+    re.escape(SHARED_DRIVES[:-1]) + r'(?:/|$)|~[^/]+@[^/]+/\.\.\.(?:/|$)')
+
+
+@functools.lru_cache(maxsize=4096)
+def canonical_path(cwd, path):
+    """The work of canonicalize_path(), in one pass over the
+       components with a stack, remembered for the most recent
+       (cwd, path) pairs.
+       Returns: string
+    """
+    if CANONICAL_PATH.fullmatch(path):
+        return path[:-1] if len(path) > 1 and path[-1] == '/' else path
+    # Since we construct cwd from a node_id now, it always ends in /,
+    # so trim off the last empty string in its parts
+    parts = path.split('/') \
+        if path[:1] == '/' or SYNTHETIC_ROOT.match(path) \
+        else cwd.split('/')[:-1] + path.split('/')
+    stack = []
+    for part in parts:
+        if part == '..':
+            if stack:
+                stack.pop()
+        elif part and part != '.':
+            stack.append(part)
+    if parts[0][:1] == '~' and stack and stack[0] == parts[0]:
+        # Beneath a shared drive or another user's files, not /
+        return '/'.join(stack)
+    return '/' + '/'.join(stack)
+
+
+def parents_first(node_list):
+    """Order node_list so that every node comes after its parent, when
+       the parent is also in node_list.
+       Returns: list of node
+    """
+    in_list = {node['id'] for node in node_list}
+    children = {}
+    result = []
+    for node in node_list:
+        parents = [parent_id for parent_id in node.get('parents', []) \
+            if parent_id in in_list]
+        if parents:
+            children.setdefault(parents[0], []).append(node)
+        else:
+            result.append(node)
+    # Each node is placed once, so a cycle of parents is left out here
+    # and put on the end below
+    i = 0
+    while i < len(result):
+        result += children.pop(result[i]['id'], [])
+        i += 1
+    for stranded in children.values():
+        result += stranded
+    return result
+
+
 def canonicalize_path(cwd, path, debug):
     """Given a path composed by concatenating two or more parts,
        clean up and canonicalize the path."""
@@ -45,44 +185,11 @@ def canonicalize_path(cwd, path, debug):
     #   /foo/bar => /foo/bar [done]
     #   foo/bar => cwd/foo/bar [done]
     #   <empty_path> => cwd [done]
-
-    # Since we construct cwd from a node_id now, it always ends in /,
-    # so trim off the last empty string in cwd_parts
-    cwd_parts = cwd.split('/')[:-1]
-    path_parts = path.split('/')
-
-    new = path_parts if path and path[0] == '/' else cwd_parts + path_parts
-
-    if debug:
-        print("# canonicalize_path(cwd: '" + cwd \
-            + "', path: '" + path + "')")
-        print("#   cwd_parts: " + str(cwd_parts))
-        print("#   path_parts: " + str(path_parts))
-        print("#   new (before): '" + str(new) + "'")
-
-    # Now we will do some canonicalization ...
-    while '..' in new:
-        where = new.index('..')
-        new = new[:where-1] + new[where+1:] if where >= 2 else new[where+1:]
-    while '.' in new:
-        where = new.index('.')
-        new = new[:where] + new[where+1:] if where >= 1 else new[where+1:]
-    # Get rid of trailing slashes
-    while new and new[-1] == "":
-        new = new[:-1]
-    # Get rid of double slashes (an empty string in the middle of new)
-    while '' in new[1:-1]:
-        where = new[1:-1].index('')
-        new = new[:where+1] + new[where+2:]
-    # Make sure it's not empty
-    if new and new[0] != '':
-        new.insert(0, "")
-    new_path = '/'.join(new)
-    if not new_path:
-        new_path = '/'
+    #   /.. => / [done]
+    new_path = canonical_path(cwd, path)
     if debug:
-        print("# new (after): '" + str(new) + "'")
-        print("# new_path: '" + new_path + "'")
+        LOG.debug("canonicalize_path(cwd: '%s', path: '%s')", cwd, path)
+        LOG.debug("new_path: '%s'", new_path)
     return new_path
 
 
@@ -91,9 +198,23 @@ class DriveFileCached(DriveFileRaw):
 
     STRMODE = 'full'
 
-    def __init__(self, debug):
+    # Hold cached nodes as DriveNode (slots, interned strings, shared
+    # owners) rather than as the dicts the API returns.
+    COMPACT_NODES = True
+
+    # Seconds for which a failed name lookup is remembered
+    NEGATIVE_TTL = 3600
+
+    # Refresh the stale entries once this many have been queued
+    REFRESH_BATCH = 100
+
+    # Where the cache lives unless --cache or $DRIVE_INSPECTOR_CACHE say
+    CACHE_PATH = "./.filedata-cache.json"
+
+    def __init__(self, debug, service=None, service_factory=None):
+        self.owner_table = OwnerTable()
         self.file_data = {}
-        self.file_data['path'] = {}
+        self.file_data['path'] = PathTrie()
         self.file_data['path']['<none>'] = ""
         self.file_data['path']['root'] = "/"
         self.file_data['time'] = {}
@@ -101,18 +222,63 @@ class DriveFileCached(DriveFileRaw):
         self.file_data['ref_count'] = {}
         self.file_data['ref_count']['<none>'] = 0
         self.file_data['cwd'] = '/'
+        # folder node_id => time its children were listed from the API
+        self.file_data['listed'] = {}
+        # folders whose cached children came from name lookups only
+        self.file_data['partial'] = {}
+        # 'folder_id/name' => time a name lookup found nothing
+        self.file_data['negative'] = {}
+        # node_id => time (integer seconds) it was fetched from the API
+        self.file_data['fetched'] = {}
+        # modifiedTime up to which every change is in the cache
+        self.file_data['high_water'] = millis_to_time(int(time.time() * 1000))
+        # folder node_id => list of child node_id, built on demand
+        self.children = None
+        # QueryIndex over the cached nodes, built on demand
+        self.query_index = None
+        # DuplicateIndex over the cached nodes, built on demand
+        self.duplicate_index = None
+        # RollupIndex (per-folder totals), built on demand
+        self.rollup_index = None
+        # PathIndex (every path to every node), built on demand
+        self.path_index = None
+        self.negative_ttl = self.NEGATIVE_TTL
+        self.policy = FreshnessPolicy()
+        # fetch time assumed for nodes the cache has no time for
+        self.fetched_default = time.time()
+        # node_id => True for entries served stale, to be refreshed
+        self.stale_nodes = {}
+        self.stale_folders = {}
+        # (max_nodes, max_bytes) when metadata and path are bounded
+        self.memory_bound = None
+        # node_id => time we registered, changed or dropped it, since
+        # the cache was read; dump_cache() merges these into the file
+        self.changed = {}
         self.cache = {}
-        self.cache['path'] = "./.filedata-cache.json"
         self.cache['mtime'] = "?"
+        self.cache['write_mapped'] = False
+        # What the cache file looked like when we read or wrote it
+        self.cache['stamp'] = None
+        # Did the cache match its checksum file: 'ok', 'mismatch',
+        # 'missing' (no checksum file) or None (no cache read)
+        self.cache['checksum'] = None
+        self.set_cache_path(os.environ.get(CACHE_ENV) or self.CACHE_PATH)
+        self.mapped = None
         # super(DriveFileCached, self).__init__(debug)
-        super().__init__(debug)
+        super().__init__(debug, service, service_factory)
+
+    def set_cache_path(self, path):
+        """Keep the cache in path, and its mapped form beside it."""
+        self.cache['path'] = path
+        self.cache['mapped_path'] = \
+            (path[:-len('.json')] if path.endswith('.json') else path) \
+            + '.mmap'
 
     def df_status(self):
         """Get status of DriveFileCached instance.
            Returns: List of String
         """
-        if self.debug:
-            print("# df_status()")
+        LOG.debug("df_status()")
         # result = super(DriveFileCached, self).df_status()
         result = super().df_status()
         result.append("# ========== Cache STATUS ==========\n")
@@ -129,6 +295,18 @@ class DriveFileCached(DriveFileRaw):
             result.append("# cache size: 0\n")
         result.append("# path cache size: " + \
             str(len(self.file_data['path'])) + " paths\n")
+        for key in ['metadata', 'path']:
+            table = self.file_data.get(key)
+            if isinstance(table, ChainMap):
+                table = table.maps[0]
+            if isinstance(table, BoundedStore):
+                result.append("# bounded " + key + ": " + table.report() + "\n")
+            elif isinstance(table, PathTrie):
+                result.append("# path trie: " + table.report() + "\n")
+        result.append("# freshness: " + str(self.policy) + "\n")
+        result.append("# stale queue: " + str(len(self.stale_nodes)) \
+            + " nodes, " + str(len(self.stale_folders)) + " folders\n")
+        result += self.stats.cache_report()
         result.append("# ========== Cache STATUS ==========\n")
         return result
 
@@ -136,13 +314,26 @@ class DriveFileCached(DriveFileRaw):
         """Get the node for node_id.
            Returns: node
         """
-        if self.debug:
-            print("# get(node_id: " + node_id + ")")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get(node_id: %s)", node_id)
+
+        # If node_id is in the cache but too old, fetch it again
+        if node_id in self.file_data['metadata']:
+            state = self.__freshness('get', self.__fetched(node_id))
+            if state == EXPIRED:
+                self.stats.miss('get')
+                self.__refetch(node_id)
+            else:
+                self.stats.hit('get')
+                if state == STALE:
+                    self.__queue_stale(self.stale_nodes, node_id)
+            if node_id in self.file_data['metadata']:
+                return self.file_data['metadata'][node_id]
 
         # If node_id is not in the cache, go to Raw to get it
         if node_id not in self.file_data['metadata']:
-            if self.debug:
-                print("# calling Google ...")
+            self.stats.miss('get')
+            LOG.debug("calling Google ...")
             t_start = time.time()
 #            node = super(DriveFileCached, self).get(node_id)
             node = super().get(node_id)
@@ -150,7 +341,8 @@ class DriveFileCached(DriveFileRaw):
             self.__register_node([node])
             if node_id == "root":
                 # very special case!
-                self.file_data['metadata'][node_id] = node
+                self.file_data['metadata'][node_id] = \
+                    self.file_data['metadata'][node['id']]
                 self.file_data['ref_count'][node_id] = 1
                 self.get_path(node_id)
 
@@ -161,129 +353,535 @@ class DriveFileCached(DriveFileRaw):
         """Given a node_id, construct the path back to root.
            Returns: string
         """
-        if self.debug:
-            print("# get_path(" + node_id + ")")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_path(%s)", node_id)
 
         if node_id in self.file_data['path']:
+            self.stats.hit('get_path')
             result = self.file_data['path'][node_id]
         else:
             # If we got here, then the path is not cached
-            node = self.file_data['metadata'][node_id] \
-                   if node_id in self.file_data['metadata'] \
-                   else self.get(node_id)
+            self.stats.miss('get_path')
+            result = self.__compute_path(node_id)
 
-            node_name = node['name']
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   => %s", result)
+        return result
 
-            if 'parents' not in node:
-                # If there is no parent AND the file is not owned by
-                # me, then create a synthetic root for it.
-                if 'ownedByMe' in node \
-                       and not node['ownedByMe']:
-                    parent = "unknown/"
-                    if 'owners' in node:
-                        parent = \
-                            '~' \
-                            + node['owners'][0]['emailAddress'] + \
-                            '/.../'
-                    # Note that we're using the parent path as the fake
-                    # FileID for the parent's root.
-                    self.file_data['path'][parent] = parent
-                else:
-                    parent = 'root'
-            else:
-                parent = node['parents'][0]
-            # when we get here parent is either a real FileID or the
-            # thing we use to refer to the My Drive of another user
-            if node_name == "My Drive":
-                self.file_data['path'][node_id] = "/"
-                self.file_data['path']["root"] = "/"
-                self.file_data['dirty'] = True
-                result = ""
-            else:
-                # Recursion ... upward!
-                new_path = self.get_path(parent) + node_name
-                self.file_data['path'][node_id] = \
-                    new_path + '/' if self.__is_folder(node) else new_path
-                result = self.file_data['path'][node_id]
-
-        if self.debug:
-            print("#    => " + result)
+    def cached_path(self, node_id):
+        """Given a node_id, find its path from the cache alone, neither
+           asking the Drive for a missing ancestor nor adding the path
+           to the path cache, for reports over the whole cache.
+           Returns: string, or None if node_id or an ancestor of it is
+               not cached
+        """
+        paths = self.file_data['path']
+        metadata = self.file_data['metadata']
+        names = []
+        seen = set()
+        path = paths.get(node_id)
+        while path is None:
+            if node_id not in metadata or node_id in seen:
+                return None
+            seen.add(node_id)
+            node = metadata[node_id]
+            if node['name'] == "My Drive":
+                path = "/"
+                break
+            name = node['name']
+            names.append(name + '/' if self.__is_folder(node) else name)
+            parent, synthetic = self.__path_parent(node_id, node)
+            node_id = parent
+            path = parent if synthetic else paths.get(parent)
+        return path + ''.join(reversed(names))
+
+    def __compute_path(self, node_id):
+        """Construct the path of node_id from the path of its parent
+           and store it in the path cache.
+           Returns: string
+        """
+        node = self.file_data['metadata'][node_id] \
+               if node_id in self.file_data['metadata'] \
+               else self.get(node_id)
+
+        node_name = node['name']
+
+        parent, synthetic = self.__path_parent(node_id, node)
+        if synthetic:
+            # Note that we're using the parent path as the fake
+            # FileID for the parent's root.
+            self.file_data['path'][parent] = parent
+        # when we get here parent is either a real FileID or the
+        # thing we use to refer to the My Drive of another user
+        if node_name == "My Drive":
+            self.file_data['path'][node_id] = "/"
+            self.file_data['path']["root"] = "/"
+            self.file_data['dirty'] = True
+            result = "/"
+        else:
+            # Recursion ... upward!
+            new_path = self.get_path(parent) + node_name
+            self.file_data['path'][node_id] = \
+                new_path + '/' if self.__is_folder(node) else new_path
+            result = self.file_data['path'][node_id]
+
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   __compute_path => %s", result)
         return result
 
+    def __path_parent(self, node_id, node):
+        """Find what the path of node_id is built on: its first parent,
+           'root', or a synthetic root whose FileID is its own path.
+           Returns: (string, Boolean True if the parent is synthetic)
+        """
+        if 'parents' in node:
+            return node['parents'][0], False
+        # If there is no parent AND the file is not owned by
+        # me, then create a synthetic root for it.
+        if node.get('driveId') == node_id:
+            # The top folder of a shared drive
+            return SHARED_DRIVES, True
+        if 'ownedByMe' in node and not node['ownedByMe']:
+            if 'owners' in node:
+                return '~' + node['owners'][0]['emailAddress'] + '/.../', True
+            return "unknown/", True
+        return 'root', False
+
+    def __expected_path(self, node_id, node):
+        """Work out the path of node_id from the cached path of its
+           parent, without changing anything.
+           Returns: string, or None if the parent has no path
+        """
+        if node['name'] == "My Drive":
+            return "/"
+        parent, synthetic = self.__path_parent(node_id, node)
+        parent_path = parent if synthetic else self.file_data['path'].get(parent)
+        if parent_path is None:
+            return None
+        path = parent_path + node['name']
+        return path + '/' if self.__is_folder(node) else path
+
     def __register_node(self, node_list):
         """Accept a list of node and register them in
            self.file_data.
            Returns: array of node_id
         """
-        if self.debug:
-            print("# __register_node(len: " \
-                    + str(len(node_list)) + ")")
+        # Tested once, not once per node
+        debug = LOG.isEnabledFor(logging.DEBUG)
+        if debug:
+            LOG.debug("__register_node(len: %d)", len(node_list))
 
         # Now comb through and put everything in file_data.
         i = 0
         results = []
+        fetched = self.file_data['fetched']
+        now = int(time.time())
         for node in node_list:
             node_id = node['id']
             node_name = node['name']
-            if self.debug:
-                print("#    __register_node: i: " + str(i) \
-                      + " (" + node_id + ") '" + node_name + "'")
+            if debug:
+                LOG.debug("   __register_node: i: %d (%s) '%s'",
+                          i, node_id, node_name)
             if node_id not in self.file_data['metadata']:
-                if self.debug:
-                    print("#    __register_node: adding " + node_id)
-                self.file_data['metadata'][node_id] = node
+                if debug:
+                    LOG.debug("   __register_node: adding %s", node_id)
+                self.file_data['metadata'][node_id] = \
+                    compact_node(node, self.owner_table) \
+                    if self.COMPACT_NODES else node
                 self.file_data['dirty'] = True
                 self.file_data['ref_count'][node_id] = 1
+                if self.children is not None:
+                    for parent_id in node.get('parents', []):
+                        self.children.setdefault(parent_id, []) \
+                            .append(node_id)
+                if self.query_index is not None:
+                    self.query_index.add(node_id, node)
+                if self.duplicate_index is not None:
+                    self.duplicate_index.add(node_id, node)
+                if self.rollup_index is not None:
+                    self.rollup_index.add(node_id, node)
+                for parent_id in node.get('parents', []):
+                    self.file_data['negative'].pop(
+                        parent_id + '/' + node_name, None)
                 self.get_path(node_id)
+                if self.path_index is not None \
+                        and not self.path_index.add(node_id):
+                    self.path_index = None
+            else:
+                self.__update_node(node_id, node)
+            fetched[node_id] = now
+            self.changed[node_id] = now
             results.append(node_id)
             i += 1
 
-        if self.debug:
-            print("# __register_node results: " + str(len(results)))
+        LOG.debug("__register_node results: %s", len(results))
 
         return results
 
+    def __update_node(self, node_id, node):
+        """Replace the cached copy of node_id with a freshly fetched
+           node.  If it has been renamed or moved, fix up the children
+           index and the paths of the node and everything beneath it.
+        """
+        metadata = self.file_data['metadata']
+        old = metadata[node_id]
+        if old and 'md5Checksum' in old and 'md5Checksum' not in node \
+                and old.get('modifiedTime') == node.get('modifiedTime') \
+                and old.get('size') == node.get('size'):
+            # Fetched without --checksums, but the content is unchanged
+            node = dict(node, md5Checksum=old['md5Checksum'])
+        if old and 'driveId' in old and 'driveId' not in node:
+            # Fetched without asking which shared drive it is in
+            node = dict(node, driveId=old['driveId'])
+        if old and old == node:
+            # Fetched again, unchanged: nothing to index or to write
+            return
+        metadata[node_id] = compact_node(node, self.owner_table) \
+            if self.COMPACT_NODES else node
+        if 'root' in metadata and metadata['root'] is old:
+            metadata['root'] = metadata[node_id]
+        if self.query_index is not None:
+            if old:
+                self.query_index.remove(node_id, old)
+            self.query_index.add(node_id, node)
+        if self.duplicate_index is not None:
+            if old:
+                self.duplicate_index.remove(node_id, old)
+            self.duplicate_index.add(node_id, node)
+        if self.rollup_index is not None:
+            if old:
+                self.rollup_index.remove(node_id, old)
+            self.rollup_index.add(node_id, node)
+        self.file_data['dirty'] = True
+        old_parents = list(old.get('parents', [])) if old else []
+        new_parents = list(node.get('parents', []))
+        if old and old['name'] == node['name'] and old_parents == new_parents:
+            return
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   __update_node: moved or renamed %s", node_id)
+        if self.path_index is not None:
+            self.path_index.remove(node_id)
+        if self.children is not None:
+            for parent_id in old_parents:
+                if node_id in self.children.get(parent_id, []):
+                    self.children[parent_id].remove(node_id)
+            for parent_id in new_parents:
+                self.children.setdefault(parent_id, []).append(node_id)
+        for parent_id in new_parents:
+            self.file_data['negative'].pop(parent_id + '/' + node['name'], None)
+        paths = self.file_data['path']
+        old_path = paths.get(node_id)
+        new_path = self.__compute_path(node_id)
+        if old_path and old_path != new_path and old_path.endswith('/'):
+            # A folder: move everything that was beneath it
+            if isinstance(paths, PathTrie):
+                paths.move(old_path, new_path)
+                for other_id in paths.under(new_path):
+                    if other_id != node_id:
+                        self.changed[other_id] = time.time()
+            else:
+                for other_id, other_path in list(paths.items()):
+                    if other_path.startswith(old_path) \
+                            and other_id != node_id:
+                        paths[other_id] = \
+                            new_path + other_path[len(old_path):]
+                        self.changed[other_id] = time.time()
+        if self.path_index is not None and (
+                self.__is_folder(node) or not self.path_index.add(node_id)):
+            # The paths of everything beneath it have changed too
+            self.path_index = None
+
+    def __forget_node(self, node_id):
+        """Drop node_id, which is no longer in the Drive, from the cache."""
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   __forget_node: %s", node_id)
+        metadata = self.file_data['metadata']
+        old = metadata[node_id]
+        if self.children is not None and old:
+            for parent_id in old.get('parents', []):
+                if node_id in self.children.get(parent_id, []):
+                    self.children[parent_id].remove(node_id)
+        if self.query_index is not None and old:
+            self.query_index.remove(node_id, old)
+        if self.duplicate_index is not None and old:
+            self.duplicate_index.remove(node_id, old)
+        if self.rollup_index is not None and old:
+            self.rollup_index.remove(node_id, old)
+        if self.path_index is not None:
+            self.path_index.remove(node_id)
+            if old and self.__is_folder(old):
+                self.path_index = None
+        if isinstance(metadata, ChainMap):
+            # Can't delete from the mapped cache, so hide it instead
+            metadata[node_id] = {}
+        else:
+            del metadata[node_id]
+        for key in ['path', 'fetched', 'ref_count']:
+            table = self.file_data[key]
+            if isinstance(table, ChainMap):
+                table = table.maps[0]
+            table.pop(node_id, None)
+        self.changed[node_id] = time.time()
+        self.file_data['dirty'] = True
+
+    def __fetched(self, node_id):
+        """When was node_id last fetched from the API?
+           Returns: seconds since the epoch
+        """
+        return self.file_data['fetched'].get(
+            self.__real_id(node_id), self.fetched_default)
+
+    def __freshness(self, operation, fetched):
+        """Apply the freshness policy to an entry for operation.
+           Returns: FRESH, STALE or EXPIRED
+        """
+        if not self.policy.is_active():
+            return FRESH
+        return self.policy.classify(operation, fetched, time.time())
+
+    def __queue_stale(self, queue, node_id):
+        """Note that a stale entry was served, and refresh the stale
+           entries if enough of them have piled up."""
+        queue[self.__real_id(node_id)] = True
+        if len(self.stale_nodes) + len(self.stale_folders) \
+                >= self.REFRESH_BATCH:
+            self.refresh_stale()
+
+    def __refetch(self, node_id):
+        """Fetch node_id from the API again, dropping it from the cache
+           if it is gone."""
+        try:
+            node = super().get(node_id)
+        except errors.HttpError as error:
+            if error.resp.status == 404:
+                self.__forget_node(node_id)
+            else:
+                print("HttpError: " + str(error))
+            return
+        self.__register_node([node])
+
+    def __relist(self, node_id):
+        """List the children of node_id from the API again.
+           Returns: (list of node, set of node_id of the cached
+           children that are no longer in the folder)
+        """
+        if node_id == 'root' and node_id not in self.file_data['metadata']:
+            # Fetch My Drive itself, so the listing is recorded against
+            # the id its children name as their parent
+            self.get(node_id)
+        before = {child['id'] for child in self.__cached_children(node_id)}
+        children, complete = super().list_children_complete(
+            node_id, self.__drive_of(node_id))
+        self.__register_node(children)
+        node_id = self.__real_id(node_id)
+        if not complete:
+            # Marked as partial rather than listed, so that it will be
+            # listed again, and nothing can be said to have left it
+            self.file_data['listed'].pop(node_id, None)
+            self.file_data['partial'][node_id] = True
+            self.file_data['dirty'] = True
+            return children, set()
+        self.file_data['listed'][node_id] = time.time()
+        self.file_data['partial'].pop(node_id, None)
+        self.file_data['dirty'] = True
+        return children, before - {child['id'] for child in children}
+
+    def __drive_of(self, node_id):
+        """Returns: the id of the shared drive that node_id is in, or
+           None if it is not in one (or is not cached)"""
+        metadata = self.file_data['metadata']
+        node_id = self.__real_id(node_id)
+        node = metadata[node_id] if node_id in metadata else None
+        return node.get('driveId') if node else None
+
+    def set_memory_bound(self, max_nodes=None, max_bytes=None):
+        """Hold at most max_nodes nodes (or about max_bytes bytes of
+           them) in memory, spilling the least recently used to disk.
+           Applies to the cache loaded now and to any loaded later.
+        """
+        self.memory_bound = (max_nodes, max_bytes) \
+            if max_nodes or max_bytes else None
+        self.__apply_memory_bound()
+
+    def __apply_memory_bound(self):
+        """Move metadata and path into BoundedStores, if we have a
+           memory bound.  With the mapped cache only the nodes added
+           since it was opened need bounding.
+        """
+        if self.memory_bound is None:
+            return
+        max_nodes, max_bytes = self.memory_bound
+        owner_table = self.owner_table
+        # Paths are small next to nodes, so give them a quarter of the
+        # byte budget.
+        for key, budget, pack, restore in [
+                ('metadata', max_bytes * 3 // 4 if max_bytes else None,
+                 plain, lambda node: compact_node(node, owner_table)),
+                ('path', max_bytes // 4 if max_bytes else None,
+                 None, None)]:
+            if key not in self.file_data:
+                continue
+            table = self.file_data[key]
+            layered = isinstance(table, ChainMap)
+            current = table.maps[0] if layered else table
+            if isinstance(current, BoundedStore):
+                continue
+            store = BoundedStore(max_nodes, budget, pack, restore)
+            for item in list(current):
+                store[item] = current.pop(item)
+            if layered:
+                table.maps[0] = store
+            else:
+                self.file_data[key] = store
+        self.__pin_cwd()
+
+    def __pin_cwd(self):
+        """Keep the cwd and its ancestors resident in a bounded cache,
+           since every relative path goes through them."""
+        if self.memory_bound is None or 'metadata' not in self.file_data:
+            return
+        node_id = self.file_data.get('cwd_id')
+        if node_id is None and self.file_data['cwd'] != '/':
+            node_id = self.resolve_path(self.file_data['cwd'].rstrip('/'))
+        pinned = ['<none>', 'root']
+        metadata = self.file_data['metadata']
+        while node_id in metadata and node_id not in pinned:
+            pinned.append(node_id)
+            node = metadata[node_id]
+            node_id = node['parents'][0] if node and 'parents' in node \
+                else None
+        if 'root' in metadata and metadata['root']:
+            pinned.append(metadata['root']['id'])
+        for key in ['metadata', 'path']:
+            table = self.file_data[key]
+            if isinstance(table, ChainMap):
+                table = table.maps[0]
+            if isinstance(table, BoundedStore):
+                table.pin(pinned)
+
+    def set_policy(self, max_age=None, operation_max_ages=None, stale_ok=0):
+        """Set the freshness policy: max_age for every operation,
+           operation_max_ages a list of (operation, max_age) overrides,
+           and stale_ok the stale-while-revalidate window.  All in
+           seconds.
+        """
+        self.policy = FreshnessPolicy(max_age, stale_ok)
+        for operation, seconds in operation_max_ages or []:
+            self.policy.set_max_age(operation, seconds)
+
+    def refresh_stale(self):
+        """Refresh the entries that were served stale, in batches:
+           each stale folder is listed again, stale nodes that share a
+           parent are refreshed by one listing of the parent, and the
+           rest are fetched one by one.  Nodes that have left a folder
+           are fetched to find out where they went.
+           Returns: integer (number of entries refreshed)
+        """
+        folders = list(self.stale_folders)
+        nodes = list(self.stale_nodes)
+        self.stale_folders = {}
+        self.stale_nodes = {}
+        LOG.debug("refresh_stale(folders: %s, nodes: %s)",
+                  len(folders), len(nodes))
+        metadata = self.file_data['metadata']
+        departed = set()
+        for folder_id in folders:
+            departed |= self.__relist(folder_id)[1]
+        by_parent = {}
+        for node_id in nodes:
+            node = metadata.get(node_id)
+            parents = node.get('parents') if node else None
+            parent_id = parents[0] if parents else None
+            if parent_id not in folders:
+                by_parent.setdefault(parent_id, []).append(node_id)
+        for parent_id, node_ids in by_parent.items():
+            if parent_id is not None and len(node_ids) > 1:
+                departed |= self.__relist(parent_id)[1] & set(node_ids)
+            else:
+                departed |= set(node_ids)
+        for node_id in departed:
+            if node_id in metadata:
+                self.__refetch(node_id)
+        return len(folders) + len(nodes)
+
     def resolve_path(self, path):
         """Given a path, find and return the FileID matching the
            terminal node.  Like the namei() syscall in Unix.
            Returns: FileID
         """
-        if self.debug:
-            print("# resolve_path(" + str(path) + ")")
-
-        if path in self.file_data['path'].values():
-            # for node_id, test_path in self.file_data['path'].iteritems():
-            # dict.iteritems() in Pyton 2 becomes dict.items() in Python 3
-            for node_id, test_path in self.file_data['path'].items():
-                if test_path == path:
+        LOG.debug("resolve_path(%s)", path)
+
+        if self.mapped is not None:
+            # The mapped cache has an index of paths
+            for candidate in [path, path + '/']:
+                node_id = self.mapped.resolve(candidate)
+                if node_id is None:
+                    overlay = self.file_data['path'].maps[0]
+                    for test_id, test_path in overlay.items():
+                        if test_path == candidate:
+                            node_id = test_id
+                            break
+                if node_id is not None \
+                        and self.file_data['metadata'].get(node_id) \
+                        and self.file_data['path'].get(node_id) == candidate:
                     return node_id
-
-        # This is disgusting tech debt.  Got to handle the trailing '/'
-        # better.  TODO
-        if path + '/' in self.file_data['path'].values():
-            # for node_id, test_path in self.file_data['path'].iteritems():
-            # dict.iteritems() in Python 2 becomes dict.items() in Python 3
-            for node_id, test_path in self.file_data['path'].items():
-                if test_path == path + '/':
+        else:
+            if path == "/":
+                return "root"
+            if self.file_data['path'].get(path) == path:
+                # The synthetic root of another user's files
+                return path
+            paths = self.file_data['path']
+            if isinstance(paths, PathTrie):
+                # The path get_path() gives, without building the index
+                for candidate in [path, path + '/']:
+                    node_id = paths.resolve(candidate)
+                    if node_id is not None \
+                            and self.file_data['metadata'].get(node_id):
+                        return node_id
+            # Any path to the node will do, not just get_path()'s
+            path_index = self.__get_path_index()
+            for candidate in [path, path + '/']:
+                node_id = path_index.resolve(candidate)
+                if node_id is not None:
                     return node_id
 
         path_components = path.split("/")
-        # this pop drops the leading empty string
+        # this pop drops the leading empty string (or '~drives')
         path_components.pop(0)
-        if self.debug:
-            print("#    path_components: " + str(path_components))
+        LOG.debug("   path_components: %s", path_components)
 
-        node_id = self.get("root")['id']
+        if path.startswith(SHARED_DRIVES):
+            node_id = self.__shared_drive_id(path_components.pop(0))
+            if node_id is None:
+                print("# resolve_path(" + path + ") => not found.")
+                return "<not_found>"
+        else:
+            node_id = self.get("root")['id']
         for component in path_components:
             # if the component is a '.' (current directory) then skip it
             if component != ".":
                 node = self.__get_named_child(node_id, component)
-                if node in ["<not_found>", "<error"]:
-                    print("# resolve_path(" + path + ") => not found.")
+                if node in LOOKUP_FAILURES:
+                    print("# resolve_path(" + path + ") => " + node)
                     return node
                 node_id = node["id"]
-                if self.debug:
-                    print("# " + component + " => (" + node_id + ")")
+                LOG.debug("%s => (%s)", component, node_id)
+        return node_id
+
+    def __shared_drive_id(self, name):
+        """Find the shared drive called name, in the cache or else by
+           listing the shared drives.
+           Returns: node_id, or None if there is no such drive
+        """
+        path = SHARED_DRIVES + name + '/'
+        node_id = self.__get_path_index().resolve(path)
+        if node_id is None:
+            for drive in self.list_drives():
+                if drive['name'] == name:
+                    self.__register_node([drive_root_node(drive)])
+                    node_id = drive['id']
+                    break
         return node_id
 
     def __get_named_child(self, node_id, component):
@@ -292,11 +890,32 @@ class DriveFileCached(DriveFileRaw):
             Returns: node
             Returns: <not_found> if there is no child by that name
         """
-        if self.debug:
-            print("# __get_named_child[cached](node_id:" \
-                + str(node_id) + ", " + component + ")")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("__get_named_child[cached](node_id:%s, %s)",
+                      node_id, component)
 
-        children = self.list_children(node_id)
+        if self.__children_cached(node_id, self.__cached_children(node_id)):
+            children = self.list_children(node_id)
+        else:
+            # Ask the Drive for just this name rather than listing a
+            # folder that might hold thousands of children.
+            key = node_id + '/' + component
+            if self.__negative(key):
+                self.stats.hit('__get_named_child')
+                children = []
+            else:
+                self.stats.miss('__get_named_child')
+                children = super().list_named_children(
+                    node_id, component, self.__drive_of(node_id))
+                if children is None:
+                    # The query failed, so fall back to a full listing
+                    children = self.list_children(node_id)
+                elif children:
+                    self.__register_node(children)
+                    self.file_data['partial'][node_id] = True
+                else:
+                    self.file_data['negative'][key] = time.time()
+                    self.file_data['dirty'] = True
         results = [item for item in children \
             if ( \
                 'parents' in item \
@@ -317,55 +936,206 @@ class DriveFileCached(DriveFileRaw):
         else:
             response = results[0]
 
-        if self.debug:
-            print("#    __get_named_child[cached] => " \
-                + str(pretty_json(response)))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   __get_named_child[cached] => %s",
+                      LazyJSON(response))
         return response
 
+    def __negative(self, key):
+        """Is there an unexpired record that a name lookup for key
+           (folder_id/name) found nothing?  Expired records are dropped.
+           Returns: Boolean
+        """
+        stamp = self.file_data['negative'].get(key)
+        if stamp is None:
+            return False
+        if time.time() - stamp < self.negative_ttl:
+            return True
+        del self.file_data['negative'][key]
+        self.file_data['dirty'] = True
+        return False
+
+    def __expire_negative(self):
+        """Drop the expired negative lookup records."""
+        negative = self.file_data['negative']
+        cutoff = time.time() - self.negative_ttl
+        for key in [key for key, stamp in negative.items() if stamp <= cutoff]:
+            del negative[key]
+
+    def __real_id(self, node_id):
+        """Map an alias such as 'root' to the real node_id, if we have
+           it in the cache.
+           Returns: node_id
+        """
+        metadata = self.file_data['metadata']
+        if node_id in metadata and metadata[node_id] \
+                and metadata[node_id]['id'] != node_id:
+            return metadata[node_id]['id']
+        return node_id
+
+    def __children_cached(self, node_id, children):
+        """Does the cache hold all of the children of node_id?
+           children is what __cached_children() found.  A folder that
+           was listed in full is answered from the cache even if it is
+           empty.
+           Returns: Boolean
+        """
+        node_id = self.__real_id(node_id)
+        if node_id in self.file_data['listed']:
+            return True
+        if node_id in self.file_data['partial']:
+            return False
+        # Caches written before we kept the listed marker: assume a
+        # folder with any cached children was listed in full.
+        return bool(children)
+
+    def __cached_children(self, node_id):
+        """Find the children of node_id that are in the cache, using
+           the parent index of the mapped cache or the in-memory
+           children index.
+           Returns: list of node
+        """
+        metadata = self.file_data['metadata']
+        node_id = self.__real_id(node_id)
+        if self.mapped is not None:
+            # Use the parent index of the mapped cache, then look for
+            # children registered since it was opened.
+            children = [metadata[item] \
+                for item in self.mapped.children(node_id)]
+            overlay = metadata.maps[0]
+            children += [overlay[item] for item in overlay \
+                if (overlay[item] and 'parents' in overlay[item] \
+                    and node_id in overlay[item]['parents'] \
+                    and overlay[item]['id'] == item)]
+            return children
+        if self.children is None:
+            self.__index_children()
+        return [metadata[item] for item in self.children.get(node_id, [])]
+
+    def __reset_indexes(self):
+        """Forget the in-memory indexes, which are rebuilt on demand."""
+        self.children = None
+        self.query_index = None
+        self.duplicate_index = None
+        self.rollup_index = None
+        self.path_index = None
+
+    def __get_query_index(self):
+        """Returns: the QueryIndex, building it if need be"""
+        if self.query_index is None:
+            LOG.debug("__get_query_index: building")
+            self.query_index = QueryIndex()
+            self.query_index.build(self.file_data['metadata'])
+        return self.query_index
+
+    def __get_duplicate_index(self):
+        """Returns: the DuplicateIndex, building it if need be"""
+        if self.duplicate_index is None:
+            LOG.debug("__get_duplicate_index: building")
+            self.duplicate_index = DuplicateIndex()
+            self.duplicate_index.build(self.file_data['metadata'])
+        return self.duplicate_index
+
+    def __get_path_index(self):
+        """Returns: the PathIndex, building it if need be"""
+        if self.path_index is None:
+            LOG.debug("__get_path_index: building")
+            self.path_index = PathIndex(
+                self.file_data['metadata'], self.file_data['path'])
+            self.path_index.build()
+        return self.path_index
+
+    def get_all_paths(self, node_id):
+        """Find every path by which node_id can be reached, the one
+           get_path() returns first.
+           Returns: list of string
+        """
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_all_paths(%s)", node_id)
+        paths = self.__get_path_index().get(self.__real_id(node_id))
+        return paths if paths else [self.get_path(node_id)]
+
+    def get_parent_paths(self, node_id):
+        """Find the paths of the parents of node_id, every path of each.
+           Returns: list of string
+        """
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_parent_paths(%s)", node_id)
+        node = self.get(node_id)
+        results = []
+        for parent_id in node.get('parents', []):
+            results += self.get_all_paths(parent_id)
+        return results
+
+    def __get_rollup_index(self):
+        """Returns: the RollupIndex, building it if need be"""
+        if self.rollup_index is None:
+            LOG.debug("__get_rollup_index: building")
+            self.rollup_index = RollupIndex(self.file_data['metadata'])
+            self.rollup_index.build()
+        return self.rollup_index
+
+    def __index_children(self):
+        """Build self.children (folder => children) in one pass over
+           the cached nodes."""
+        LOG.debug("__index_children()")
+        self.children = {}
+        for node_id, node in self.file_data['metadata'].items():
+            if node and node['id'] == node_id:
+                for parent_id in node.get('parents', []):
+                    self.children.setdefault(parent_id, []).append(node_id)
+
     def __is_folder(self, node):
         """Test whether node represents a folder.
            Returns: Boolean
         """
-        node_id = node['id']
-        if self.debug:
-            print("# __is_folder(node_id: " + node_id + ")")
         result = node['mimeType'] == self.FOLDERMIMETYPE \
                  and ("fileExtension" not in node)
-        if self.debug:
-            # print("# node: " + pretty_json(node))
-            print("#    => " + str(result))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("__is_folder(node_id: %s) => %s", node['id'], result)
         return result
 
-    def list_children(self, node_id):
-        """Get the children of node_id.
+    def list_children(self, node_id, drive_id=None):
+        """Get the children of node_id.  The shared drive it is in, if
+           any, is looked up in the cache, so drive_id is not needed.
            Returns: array of node
         """
-        if self.debug:
-            print("# list_children[cached](node_id: " + node_id + ")")
+        # pylint: disable=unused-argument
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("list_children[cached](node_id: %s)", node_id)
 
         # Are there children of node_id in the cache?
 
-        children = [self.file_data['metadata'][item] \
-            for item in self.file_data['metadata'] \
-                if ('parents' in self.file_data['metadata'][item] \
-                    and node_id \
-                    in self.file_data['metadata'][item]['parents'])]
+        children = self.__cached_children(node_id)
+
+        state = EXPIRED
+        if self.__children_cached(node_id, children):
+            state = self.__freshness(
+                'list_children',
+                self.file_data['listed'].get(
+                    self.__real_id(node_id), self.fetched_default))
 
-        if not children:
+        if state != EXPIRED:
+            self.stats.hit('list_children')
+            if state == STALE:
+                self.__queue_stale(self.stale_folders, node_id)
+        else:
+            self.stats.miss('list_children')
 #            children = super(DriveFileCached, self).list_children(node_id)
-            children = super().list_children(node_id)
-            self.__register_node(children)
+            children, departed = self.__relist(node_id)
+            # Find out later where the departed children went
+            for child_id in departed:
+                self.stale_nodes[child_id] = True
 
-        if self.debug:
-            print("#    children: " + str(len(children)))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   children: %s", len(children))
         return children
 
     def list_all(self):
         """Get all of the files to which I have access.
            Returns: list of node
         """
-        if self.debug:
-            print("# list_all[cached]()")
+        LOG.debug("list_all[cached]()")
 
 #        node_list = super(DriveFileCached, self).list_all()
         node_list = super().list_all()
@@ -373,18 +1143,25 @@ class DriveFileCached(DriveFileRaw):
         if node_list:
             self.__register_node(node_list)
 
-        if self.debug:
-            print("# list_all node_list[cached]: " + str(len(node_list)))
+        LOG.debug("list_all node_list[cached]: %s", len(node_list))
 
         return node_list
 
+    def __list_all_pages(self):
+        """Like list_all(), but registering and yielding one page of
+           results at a time.
+           Returns: iterator of list of node
+        """
+        for node_list in super().list_all_pages():
+            self.__register_node(node_list)
+            yield node_list
+
     def list_newer(self, date):
         """Find nodes that are modified more recently that
            the provided date.
            Returns: list of node
         """
-        if self.debug:
-            print("# list_newer[cached](date: " + str(date) + ")")
+        LOG.debug("list_newer[cached](date: %s)", date)
 #        results = super(DriveFileCached, self).list_newer(date)
         results = super().list_newer(date)
 
@@ -392,79 +1169,264 @@ class DriveFileCached(DriveFileRaw):
 
     def show_newer(self, date, refresh):
         """ Display paths to all nodes newer than a given date. """
-        if self.debug:
-            print("# show_newer[cached](")
-            print("#    date: '" + str(date) + "'")
-            print("#    refresh: '" + str(refresh) + "'")
-            print("# )")
+        LOG.debug("show_newer[cached](")
+        LOG.debug("   date: '%s'", date)
+        LOG.debug("   refresh: '%s'", refresh)
+        LOG.debug(")")
         newer_nodes = self.list_newer(date)
         if refresh:
             self.__register_node(newer_nodes)
+            self.__advance_high_water(date, newer_nodes)
         for node in newer_nodes:
             node_id = node['id']
             path = self.get_path(node_id)
             self.df_print(str(path) + '\n')
 
+    def get_high_water(self):
+        """The modifiedTime up to which every change in the Drive is
+           known to be in the cache.  --dirty asks for what is newer.
+           Returns: string (RFC 3339 timestamp)
+        """
+        return self.file_data['high_water']
+
+    def __advance_high_water(self, date, nodes):
+        """After nodes, the result of a query for everything modified
+           since date, have been registered, move the high-water mark
+           up to the newest of them.  Only a query that reaches back
+           to the mark can move it.
+        """
+        mark = date_to_millis(self.file_data['high_water'])
+        since = date_to_millis(date)
+        if mark is None or since is None or since > mark:
+            return
+        newest = max([node_millis(node) or mark for node in nodes] + [mark])
+        if newest > mark:
+            self.file_data['high_water'] = millis_to_time(newest)
+            self.file_data['dirty'] = True
+        LOG.debug("   high_water => %s", self.file_data['high_water'])
+
+    def list_local_newer(self, date):
+        """Find the cached nodes modified more recently than date,
+           without asking the Drive.
+           Returns: list of node
+        """
+        LOG.debug("list_local_newer(date: %s)", date)
+        millis = date_to_millis(date)
+        if millis is None:
+            print("# Not a date: '" + str(date) + "'")
+            return []
+        metadata = self.file_data['metadata']
+        return [metadata[node_id] \
+            for node_id in self.__get_query_index().newer(millis)]
+
+    def show_local_newer(self, date):
+        """ Display paths to the cached nodes newer than a given date. """
+        LOG.debug("show_local_newer(date: '%s')", date)
+        for node in self.list_local_newer(date):
+            self.df_print(str(self.get_path(node['id'])) + '\n')
+
+    def list_query(self, text):
+        """Find the cached nodes that match a query (see drivequery),
+           without asking the Drive.
+           Returns: list of node
+        """
+        LOG.debug("list_query(%s)", text)
+        try:
+            terms = parse_query(text)
+        except QueryError as error:
+            print("# query: " + str(error))
+            return []
+        for term in terms:
+            if term.field == 'under':
+                term.value = canonicalize_path(
+                    self.get_cwd(), term.value, self.debug)
+        paths = self.file_data['path']
+        node_ids = run_query(
+            terms, self.__get_query_index(), self.get_path,
+            paths.under if isinstance(paths, PathTrie) else None)
+        metadata = self.file_data['metadata']
+        return [metadata[node_id] for node_id in node_ids]
+
+    def show_query(self, text):
+        """ Display the paths of the cached nodes matching a query. """
+        LOG.debug("show_query(%s)", text)
+        paths = sorted(self.get_path(node['id']) \
+            for node in self.list_query(text))
+        for path in paths:
+            self.df_print(path + '\n')
+        self.df_print("# matches: " + str(len(paths)) + '\n')
+
+    def list_diff(self, old_cache):
+        """Compare the cache with an older snapshot of it, the cache
+           file old_cache, by node_id.  The differences are produced as
+           they are found, not collected, and the paths on both sides
+           come from the cache alone.
+           Returns: iterator of (change, node_id, old path, new path,
+           detail), see drivediff.diff_nodes()
+        """
+        LOG.debug("list_diff(%s)", old_cache)
+        old = load_snapshot(old_cache)
+        old_metadata = old.get('metadata', {})
+        old_paths = path_table(old.get('path'))
+        metadata = self.file_data['metadata']
+        return diff_nodes(
+            old_metadata,
+            ((node_id, metadata[node_id]) for node_id in self.df_node_ids()),
+            lambda node_id: old_paths.get(node_id) \
+                or old_metadata[node_id]['name'],
+            lambda node_id: self.cached_path(node_id) \
+                or metadata[node_id]['name']
+            )
+
+    def show_diff(self, old_cache):
+        """Display, a tab-separated line each, the nodes added,
+           removed, renamed, moved or resized since old_cache."""
+        LOG.debug("show_diff(%s)", old_cache)
+        try:
+            changes = self.list_diff(old_cache)
+        except (IOError, ValueError) as error:
+            print("# Can't read " + old_cache + ": " + str(error))
+            return
+        counts = dict.fromkeys(CHANGES, 0)
+        self.df_print("# change\tid\told path\tnew path\tdetail\n")
+        for change, node_id, old_path, new_path, detail in changes:
+            counts[change] += 1
+            self.df_print(change + "\t" + node_id + "\t" + old_path + "\t" \
+                + new_path + "\t" + detail + "\n")
+        self.df_print("# " + " ".join(change + ": " + str(counts[change]) \
+            for change in CHANGES) + "\n")
+
+    def list_duplicates(self):
+        """Find the cached files with identical content (the same size
+           and md5Checksum), without asking the Drive.
+           Returns: list of (size, md5Checksum, list of node)
+        """
+        LOG.debug("list_duplicates()")
+        metadata = self.file_data['metadata']
+        return [(size, checksum, [metadata[node_id] for node_id in node_ids]) \
+            for size, checksum, node_ids \
+            in self.__get_duplicate_index().groups()]
+
+    def get_du(self, node_id):
+        """Total up the cached nodes beneath node_id.
+           Returns: (bytes, files, folders)
+        """
+        LOG.debug("get_du(%s)", node_id)
+        return self.__get_rollup_index().get(self.__real_id(node_id))
+
+    def show_du(self, node_id):
+        """ Display the totals beneath node_id and each of its folders,
+            from the cache. """
+        LOG.debug("show_du(%s)", node_id)
+        if node_id is None:
+            return
+        real_id = self.__real_id(node_id)
+        folders = [child for child in self.__cached_children(real_id) \
+            if child and self.__is_folder(child) and not child.get('trashed')]
+        for child in sorted(folders, key=lambda child: child['name']):
+            self.df_print(self.__du_line(child['id']))
+        self.df_print(self.__du_line(real_id))
+
+    def __du_line(self, node_id):
+        """Returns: string (bytes, files, folders and path of node_id)"""
+        total_bytes, files, folders = self.get_du(node_id)
+        return str(total_bytes) + "\t" + str(files) + "\t" + str(folders) \
+            + "\t" + self.get_path(node_id) + '\n'
+
+    def show_duplicates(self):
+        """ Display each group of duplicate files and the bytes wasted. """
+        LOG.debug("show_duplicates()")
+        wasted = 0
+        groups = self.list_duplicates()
+        for size, checksum, nodes in groups:
+            group_wasted = (len(nodes) - 1) * size
+            wasted += group_wasted
+            self.df_print("# " + str(len(nodes)) + " copies of " \
+                + str(size) + " bytes (md5 " + checksum + "), wasted: " \
+                + str(group_wasted) + '\n')
+            for path in sorted(self.get_path(node['id']) for node in nodes):
+                self.df_print("   " + path + '\n')
+        self.df_print("# duplicate groups: " + str(len(groups)) \
+            + " wasted bytes: " + str(wasted) + '\n')
+        unchecked = len(self.__get_duplicate_index().unchecked)
+        if unchecked:
+            self.df_print("# files with no md5Checksum in the cache: " \
+                + str(unchecked) + " (run --showall --checksums)" + '\n')
+
     def show_node(self, node_id):
         """ Display a node."""
-        if self.debug:
-            print("# show_node[cached](node_id: (" + node_id + "))")
+        LOG.debug("show_node[cached](node_id: (%s))", node_id)
         self.df_print(pretty_json(self.get(node_id)))
 
     def show_children(self, node_id):
         """ Display the names of the children of a node.
             This is the core engine of the --ls function.
         """
-        if self.debug:
-            print("# show_children[cached](node_id: (" \
-                + str(node_id) + "))")
+        LOG.debug("show_children[cached](node_id: (%s))", node_id)
         children = self.list_children(node_id)
-        if self.debug:
-            print("# show_children[cached]: len(children): " \
-                + str(len(children)))
+        LOG.debug("show_children[cached]: len(children): %s", len(children))
+        debug = LOG.isEnabledFor(logging.DEBUG)
         for child in children:
             child_id = child['id']
-            if self.debug:
-                print("# child_id: " + str(child_id))
+            if debug:
+                LOG.debug("child_id: %s", child_id)
             child_name = child['name']
             if self.__is_folder(child):
                 child_name += "/"
             self.df_print(child_name + '\n')
 
-    def list_all_children(self, node_id, show_all=False):
-        """Return the list of FileIDs beneath a given node.
+    def list_all_children(self, node_id, show_all=False,
+                          max_depth=None, prune=None, limit=None):
+        """Return the list of nodes beneath a given node, breadth
+           first.  The limits are applied during the walk, so a folder
+           that is pruned (its name matches a glob in prune) or more
+           than max_depth levels down is never listed, and nothing is
+           listed once limit nodes have been found.
            Return: list of node
         """
-        if self.debug:
-            print("# list_all_children[cached](" \
-                + "node_id: " + str(node_id) \
-                + ", show_all: " + str(show_all) + ")")
+        debug = LOG.isEnabledFor(logging.DEBUG)
+        if debug:
+            LOG.debug("list_all_children[cached](node_id: %s, show_all: %s,"
+                      " max_depth: %s, prune: %s, limit: %s)",
+                      node_id, show_all, max_depth, prune, limit)
         result = []
-        queue = self.list_children(node_id)
+        if (limit is not None and limit <= 0) \
+                or (max_depth is not None and max_depth < 1):
+            return result
+        queue = deque((child, 1) for child in self.list_children(node_id))
         while queue:
-            node = queue.pop(0)
+            node, depth = queue.popleft()
             node_id = node['id']
-            if self.debug:
-                print("#    node_id: (" + node_id + ")")
-            if self.__is_folder(node):
-                children = self.list_children(node_id)
-                queue += children
-                result.append(node)
-            elif show_all:
-                result.append(node)
+            if debug:
+                LOG.debug("   node_id: (%s)", node_id)
+            if prune and is_pruned(node, prune):
+                continue
+            is_folder = self.__is_folder(node)
+            if not is_folder and not show_all:
+                continue
+            result.append(node)
+            if limit is not None and len(result) >= limit:
+                break
+            if is_folder and (max_depth is None or depth < max_depth):
+                queue.extend((child, depth + 1) \
+                    for child in self.list_children(node_id))
         return result
 
-    def show_all_children(self, node_id, show_all=False):
+    def show_all_children(self, node_id, show_all=False,
+                          max_depth=None, prune=None, limit=None):
         """ Display all child directories of a node
             show_all:
                 True: display all files.
                 False: show just the folder structure.
+            max_depth, prune, limit: as for list_all_children()
         """
-        if self.debug:
-            print("# show_all_children[cached](node_id: (" + node_id + "))")
-            print("#    show_all: " + str(show_all))
+        debug = LOG.isEnabledFor(logging.DEBUG)
+        if debug:
+            LOG.debug("show_all_children[cached](node_id: (%s))", node_id)
+            LOG.debug("   show_all: %s", show_all)
 
-        children = self.list_all_children(node_id, show_all)
+        children = self.list_all_children(
+            node_id, show_all, max_depth, prune, limit)
 
         num_files = 0
         num_folders = 0
@@ -473,9 +1435,8 @@ class DriveFileCached(DriveFileRaw):
             child_id = child['id']
             child_name = child['name']
             num_files += 1
-            if self.debug:
-                print("#    child_id: (" + child_id + ") '" \
-                      + child_name + "'")
+            if debug:
+                LOG.debug("   child_id: (%s) '%s'", child_id, child_name)
             if self.__is_folder(child):
                 num_folders += 1
                 self.df_print(self.get_path(child_id) + '\n')
@@ -489,22 +1450,66 @@ class DriveFileCached(DriveFileRaw):
         """Display the paths to all files available in My Drive
            Returns: nothing
         """
-        if self.debug:
-            print("# show_all[cached]()")
+        debug = LOG.isEnabledFor(logging.DEBUG)
+        if debug:
+            LOG.debug("show_all[cached]()")
 
-        node_list = self.list_all()
         num_folders = 0
         num_files = 0
-        for node in node_list:
-            node_id = node['id']
-            node_name = node['name']
-            num_files += 1
-            if self.debug:
-                print("#    node_id: (" + node_id + ") '" \
-                      + node_name + "'")
-            if self.__is_folder(node):
-                num_folders += 1
-            self.df_print(self.get_path(node_id) + '\n')
+        if self.memory_bound is None:
+            pages = [self.list_all()]
+        else:
+            # A page at a time, so that a bounded cache stays bounded,
+            # at the price of fetching parents we have not seen yet
+            pages = self.__list_all_pages()
+        for node_list in pages:
+            for node in node_list:
+                node_id = node['id']
+                node_name = node['name']
+                num_files += 1
+                if debug:
+                    LOG.debug("   node_id: (%s) '%s'", node_id, node_name)
+                if self.__is_folder(node):
+                    num_folders += 1
+                self.df_print(self.get_path(node_id) + '\n')
+        self.df_print("#    num_folders: " + str(num_folders) + '\n')
+        self.df_print("#    num_files: " + str(num_files) + '\n')
+
+    def show_drives(self, workers=None):
+        """Scan every shared drive into the cache, workers of them at
+           once, and display the paths of the nodes in them.
+           Returns: nothing
+        """
+        debug = LOG.isEnabledFor(logging.DEBUG)
+        if debug:
+            LOG.debug("show_drives[cached](workers: %s)", workers)
+
+        drives = self.list_drives()
+        self.__register_node([drive_root_node(drive) for drive in drives])
+        # A drive's pages are held until the last one arrives, so that
+        # parents can be registered before their children
+        pending = {}
+        num_folders = 0
+        num_files = 0
+        for drive, page in self.list_all_drive_pages(drives, workers):
+            drive_id = drive['id']
+            if page is not None:
+                pending.setdefault(drive_id, []).extend(page)
+                continue
+            node_list = parents_first(pending.pop(drive_id, []))
+            self.__register_node(node_list)
+            # Every folder in the drive now has all its children cached
+            now = time.time()
+            self.file_data['listed'][drive_id] = now
+            for node in node_list:
+                num_files += 1
+                if self.__is_folder(node):
+                    num_folders += 1
+                    self.file_data['listed'][node['id']] = now
+                self.df_print(self.get_path(node['id']) + '\n')
+            self.df_print("# " + self.get_path(drive_id) + " " \
+                + str(len(node_list)) + " nodes\n")
+        self.df_print("#    num_drives: " + str(len(drives)) + '\n')
         self.df_print("#    num_folders: " + str(num_folders) + '\n')
         self.df_print("#    num_files: " + str(num_files) + '\n')
 
@@ -512,26 +1517,24 @@ class DriveFileCached(DriveFileRaw):
         """Set the current working directory string
            Returns: nothing
         """
-        if self.debug:
-            print("# set_cwd: " + node_id)
+        LOG.debug("set_cwd: %s", node_id)
         path = self.get_path(node_id)
         self.file_data['cwd'] = path
+        self.file_data['cwd_id'] = node_id
         self.file_data['dirty'] = True
-        if self.debug:
-            print("#    => " + path)
+        self.__pin_cwd()
+        LOG.debug("   => %s", path)
 
     def get_cwd(self):
         """Return the value of the current working directory
            Returns: string
         """
-        if self.debug:
-            print("# get_cwd => " + self.file_data['cwd'])
+        LOG.debug("get_cwd => %s", self.file_data['cwd'])
         return self.file_data['cwd']
 
     def load_cache(self):
         """Load the cache from stable storage."""
-        if self.debug:
-            print("# load_cache: " + str(self.cache['path']))
+        LOG.debug("load_cache: %s", self.cache['path'])
         try:
             mtime = os.path.getmtime(self.cache['path'])
             self.cache['mtime'] = \
@@ -544,36 +1547,270 @@ class DriveFileCached(DriveFileRaw):
             self.init_cache()
             return
         try:
-            with open(self.cache['path'], "r", encoding="utf-8") as cache_file:
-                self.file_data = json.load(cache_file)
-                for node_id in self.file_data['metadata'].keys():
+            with CacheLock(self.cache['path']), \
+                    open(self.cache['path'], "rb") as cache_file:
+                data = cache_file.read()
+                self.cache['checksum'] = self.__verify_checksum(data)
+                self.file_data = json.loads(data)
+                self.file_data['path'] = PathTrie(self.file_data.get('path'))
+                self.cache['stamp'] = self.__cache_stamp()
+                self.changed = {}
+                for key in INDEX_KEYS:
+                    self.file_data.setdefault(key, {})
+                self.__expire_negative()
+                self.fetched_default = mtime
+                # Caches from before the high-water mark: fall back on
+                # the time the cache was written, as --dirty used to.
+                self.file_data.setdefault(
+                    'high_water', millis_to_time(int(mtime * 1000)))
+                self.__reset_indexes()
+                metadata = self.file_data['metadata']
+                for node_id in metadata.keys():
                     self.file_data['ref_count'][node_id] = 0
+                    if self.COMPACT_NODES:
+                        metadata[node_id] = \
+                            compact_node(metadata[node_id], self.owner_table)
                 print("# Loaded " + str(len(self.file_data['metadata'])) \
                       + " cached nodes.")
                 self.file_data['dirty'] = False
+                self.__apply_memory_bound()
         except IOError as error:
             print("# Starting with empty cache. IOError: " + str(error))
             self.init_cache()
+        except ValueError as error:
+            # Keep what is left of it out of the way of dump_cache()
+            corrupt_path = self.cache['path'] + '.corrupt'
+            print("# Cache is not valid JSON, moved to " + corrupt_path \
+                + ".  Starting with empty cache. ValueError: " + str(error))
+            os.replace(self.cache['path'], corrupt_path)
+            self.init_cache()
+
+    def __verify_checksum(self, data):
+        """Compare data, as read from the cache file, with the checksum
+           dump_cache() recorded for it.
+           Returns: 'ok', 'mismatch' or 'missing'
+        """
+        recorded = read_checksum(self.cache['path'])
+        if recorded is None:
+            return 'missing'
+        if hashlib.sha256(data).hexdigest() != recorded:
+            print("# Checksum mismatch on " + self.cache['path'] \
+                + ", check it with --fsck.")
+            return 'mismatch'
+        return 'ok'
+
+    def load_mapped_cache(self):
+        """Open the memory-mapped form of the cache, if it is up to date
+           with the JSON cache, so that only the nodes we touch are
+           decoded.  Otherwise load the JSON cache as usual.  Either
+           way, dump_cache() will (re)write the mapped form.
+           Returns: Boolean (True if the mapped cache is in use)
+        """
+        LOG.debug("load_mapped_cache: %s", self.cache['mapped_path'])
+        self.cache['write_mapped'] = True
+        try:
+            mapped = MappedCache(self.cache['mapped_path'])
+        except (OSError, ValueError) as error:
+            print("# Mapped cache not available: " + str(error))
+            self.load_cache()
+            return False
+        if not mapped.is_current(self.cache['path']):
+            print("# Mapped cache is out of date, loading JSON cache.")
+            mapped.close()
+            self.load_cache()
+            return False
+        self.mapped = mapped
+        self.cache['stamp'] = self.__cache_stamp()
+        self.changed = {}
+        self.cache['mtime'] = datetime.datetime.utcfromtimestamp(
+            mapped.meta['source_mtime']).isoformat()
+        self.file_data = {}
+        self.file_data['metadata'] = ChainMap({}, MappedMetadata(mapped))
+        self.file_data['path'] = ChainMap({}, MappedPaths(mapped))
+        self.file_data['time'] = {}
+        self.file_data['time']['<none>'] = 0
+        self.file_data['ref_count'] = {}
+        self.file_data['ref_count']['<none>'] = 0
+        self.file_data['fetched'] = ChainMap({}, MappedFetched(mapped))
+        self.file_data.update(mapped.meta['file_data'])
+        for key in INDEX_KEYS:
+            self.file_data.setdefault(key, {})
+        self.__expire_negative()
+        self.fetched_default = mapped.meta['source_mtime']
+        self.file_data.setdefault('high_water', millis_to_time(
+            int(mapped.meta['source_mtime'] * 1000)))
+        self.file_data['dirty'] = False
+        self.__reset_indexes()
+        self.__apply_memory_bound()
+        print("# Mapped " + str(mapped.count) + " cached nodes.")
+        return True
+
+    def dump_mapped_cache(self):
+        """Write the memory-mapped form of the cache."""
+        LOG.debug("dump_mapped_cache: %s", self.cache['mapped_path'])
+        try:
+            count = write_mapped_cache(
+                self.file_data,
+                self.cache['mapped_path'],
+                self.cache['path']
+                )
+            print("# Wrote " + str(count) + " nodes to " \
+                + self.cache['mapped_path'] + ".")
+        except IOError as error:
+            print("IOError: " + str(error))
+
+    def df_node_ids(self):
+        """Return the node_ids of every node in the cache, without
+           going to the API.
+           Returns: list of node_id
+        """
+        LOG.debug("df_node_ids()")
+        metadata = self.file_data['metadata']
+        if self.mapped is not None:
+            result = list(self.mapped.node_ids())
+            overlay = metadata.maps[0]
+            result += [node_id for node_id in overlay \
+                if overlay[node_id] and overlay[node_id]['id'] == node_id \
+                    and self.mapped.find(node_id) is None]
+            return result
+        return [node_id for node_id in metadata \
+            if metadata[node_id] and metadata[node_id]['id'] == node_id]
 
     def init_cache(self):
         """Initialize the self.file_data cache['metadata']."""
-        if self.debug:
-            print("# init_cache()")
+        LOG.debug("init_cache()")
         self.file_data['metadata'] = {}
         self.file_data['metadata']['<none>'] = {}
         self.file_data['dirty'] = False
+        for key in INDEX_KEYS:
+            self.file_data.setdefault(key, {})
+        self.file_data.setdefault('high_water', millis_to_time(
+            int(time.time() * 1000)))
+        self.changed = {}
+        self.cache['stamp'] = None
+        self.__reset_indexes()
+        self.__apply_memory_bound()
+
+    def __cache_stamp(self):
+        """Identify the current contents of the cache file, cheaply.
+           Returns: tuple, or None if there is no cache file
+        """
+        try:
+            stat = os.stat(self.cache['path'])
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def __merge_cache(self):
+        """Fold in what other processes have written to the cache file
+           since we read it.  Their nodes are taken unless we have
+           registered, changed or dropped the node since they fetched
+           it, and nodes they dropped that we have not touched go.
+           Returns: integer (number of nodes taken from the file)
+        """
+        try:
+            with open(self.cache['path'], "r", encoding="utf-8") \
+                    as cache_file:
+                other = json.load(cache_file)
+        except (IOError, ValueError) as error:
+            print("# Not merging with " + self.cache['path'] + ": " \
+                + str(error))
+            return 0
+        metadata = self.file_data['metadata']
+        fetched = self.file_data['fetched']
+        paths = self.file_data['path']
+        other_metadata = other.get('metadata', {})
+        other_fetched = other.get('fetched', {})
+        other_paths = path_table(other.get('path'))
+        taken = 0
+        for node_id, node in other_metadata.items():
+            if not node or node.get('id') != node_id:
+                # '<none>' and aliases such as 'root'
+                continue
+            when = other_fetched.get(node_id, 0)
+            if node_id in self.changed:
+                if when <= self.changed[node_id]:
+                    continue
+            elif metadata.get(node_id) \
+                    and when <= fetched.get(node_id, self.fetched_default):
+                continue
+            metadata[node_id] = compact_node(node, self.owner_table) \
+                if self.COMPACT_NODES else node
+            fetched[node_id] = when
+            self.file_data['ref_count'].setdefault(node_id, 0)
+            if node_id in other_paths:
+                paths[node_id] = other_paths[node_id]
+            else:
+                # Worked out again when it is next needed
+                paths.pop(node_id, None)
+            taken += 1
+        # The cache file held every node we have not touched when we
+        # read it, so one it no longer holds was dropped by another
+        dropped = [node_id for node_id in self.df_node_ids() \
+            if node_id not in other_metadata and node_id not in self.changed]
+        for node_id in dropped:
+            self.__forget_node(node_id)
+            del self.changed[node_id]
+        if 'root' in other_metadata and 'root' not in metadata \
+                and other_metadata['root'].get('id') in metadata:
+            metadata['root'] = metadata[other_metadata['root']['id']]
+        # Paths we have not changed may have been moved by the other
+        for key, path in other_paths.items():
+            if key not in self.changed and paths.get(key) != path:
+                paths[key] = path
+        for key in ['listed', 'negative']:
+            table = self.file_data[key]
+            for item, when in other.get(key, {}).items():
+                table[item] = max(when, table.get(item, 0))
+        for item in other.get('partial', {}):
+            if item not in self.file_data['listed']:
+                self.file_data['partial'][item] = True
+        for node_id, elapsed in other.get('time', {}).items():
+            self.file_data['time'].setdefault(node_id, elapsed)
+        # Every change up to the earlier of the two marks is in both
+        if 'high_water' in other:
+            self.file_data['high_water'] = \
+                min(self.file_data['high_water'], other['high_water'])
+        self.__reset_indexes()
+        print("# Merged " + str(taken) + " nodes (and dropped " \
+            + str(len(dropped)) + ") written by another process to " \
+            + self.cache['path'] + ".")
+        return taken
 
     def dump_cache(self):
-        """Write the cache out to a file. """
+        """Write the cache out to a file, first merging in whatever
+           other processes have written to it since we read it.  The
+           file is locked from the merge to the end of the write, is
+           written beside the cache and renamed over it, so that an
+           interrupted write leaves the old cache in place, and is
+           given a checksum file."""
         if self.file_data['dirty']:
             try:
-                with open(self.cache['path'], "w", encoding="utf-8") \
-                     as cache_file:
-                    json.dump(
-                        self.file_data,
-                        cache_file, indent=3,
-                        separators=(',', ': ')
-                    )
+                with CacheLock(self.cache['path'], exclusive=True):
+                    if self.__cache_stamp() != self.cache['stamp']:
+                        self.__merge_cache()
+                    cache_file = OutputFile(self.cache['path'])
+                    written = False
+                    try:
+                        if self.memory_bound is None:
+                            json.dump(
+                                self.file_data,
+                                cache_file, indent=3,
+                                separators=(',', ': '),
+                                default=plain
+                            )
+                        else:
+                            # Don't pull the spilled nodes back into memory
+                            dump_json(self.file_data, cache_file,
+                                      default=plain)
+                        written = True
+                    finally:
+                        cache_file.close(keep=written)
+                    write_checksum(self.cache['path'],
+                                   cache_file.digest.hexdigest())
+                    self.cache['checksum'] = 'ok'
+                    self.cache['stamp'] = self.__cache_stamp()
+                    self.changed = {}
                 print("# Wrote " \
                     + str(len(self.file_data['metadata'])) \
                     + " nodes to " + self.cache['path'] + ".")
@@ -581,20 +1818,183 @@ class DriveFileCached(DriveFileRaw):
                 print("IOError: " + str(error))
         else:
             print("Cache clean, not rewritten.")
+        if self.cache['write_mapped'] or \
+                os.path.exists(self.cache['mapped_path']):
+            try:
+                mapped = MappedCache(self.cache['mapped_path'])
+                current = mapped.is_current(self.cache['path'])
+                mapped.close()
+            except (OSError, ValueError):
+                current = False
+            if not current:
+                self.dump_mapped_cache()
+
+    def check_cache(self):
+        """Check the cache for internal consistency: every node filed
+           under its own id, every parent in the cache, every path the
+           path of the node's parent plus its name, and a node for
+           every ref_count, path, fetched, listed and partial entry.
+           Returns: dict of problem (see FSCK_PROBLEMS) => list
+        """
+        LOG.debug("check_cache()")
+        metadata = self.file_data['metadata']
+        paths = self.file_data['path']
+        problems = {problem: [] for problem, _ in FSCK_PROBLEMS}
+        node_ids = set(self.df_node_ids())
+        for key, node in metadata.items():
+            if key == 'root':
+                if not node or node.get('id') not in node_ids:
+                    problems['bad_id'].append(key)
+            elif node and node.get('id') != key:
+                problems['bad_id'].append(key)
+        missing = set()
+        for node_id in node_ids:
+            node = metadata[node_id]
+            for parent_id in node.get('parents', []):
+                if parent_id not in node_ids:
+                    missing.add(parent_id)
+            expected = self.__expected_path(node_id, node)
+            actual = paths.get(node_id)
+            if actual is None or (expected is not None and actual != expected):
+                problems['bad_path'].append(node_id)
+        problems['missing_parent'] = sorted(missing)
+        ref_count = self.file_data['ref_count']
+        if self.mapped is None:
+            # The mapped cache only counts the nodes it has decoded
+            problems['ref_count'] += [node_id for node_id in node_ids \
+                if node_id not in ref_count]
+        problems['ref_count'] += [key for key in ref_count \
+            if key not in node_ids and key not in ['root', '<none>']]
+        for table in ['path', 'fetched', 'listed', 'partial']:
+            for key in self.file_data[table]:
+                if key in node_ids or key in ['root', '<none>'] \
+                        or (table == 'path' and paths[key] == key):
+                    continue
+                problems['stray'].append((table, key))
+        return problems
+
+    def repair_cache(self, problems):
+        """Repair what check_cache() found.  The nodes involved (and
+           any of their ancestors missing from the cache) are fetched
+           again in batches, nodes that are gone are dropped, and the
+           paths of the nodes fetched and everything beneath them are
+           worked out again.  ref_counts and stray entries are fixed
+           without going to the API.
+           Returns: integer (number of nodes fetched)
+        """
+        LOG.debug("repair_cache()")
+        metadata = self.file_data['metadata']
+        paths = self.file_data['path']
+        node_ids = set(self.df_node_ids())
+        for key in problems['bad_id']:
+            if isinstance(metadata, ChainMap):
+                metadata[key] = {}
+            else:
+                metadata.pop(key, None)
+            node_ids.discard(key)
+        wanted = set(problems['bad_id']) | set(problems['missing_parent']) \
+            | set(problems['bad_path'])
+        found = {}
+        gone = set()
+        root = None
+        while wanted:
+            batch, missing = self.get_batch(sorted(wanted))
+            gone |= set(missing)
+            if 'root' in batch:
+                root = batch.pop('root')
+                batch[root['id']] = root
+            found.update(batch)
+            wanted = set()
+            for node in batch.values():
+                for parent_id in node.get('parents', []):
+                    if parent_id not in node_ids and parent_id not in found \
+                            and parent_id not in gone:
+                        wanted.add(parent_id)
+        for node_id in gone:
+            if node_id in node_ids:
+                self.__forget_node(node_id)
+        self.__register_node(parents_first(list(found.values())))
+        if root is not None and root['id'] in metadata:
+            metadata['root'] = metadata[root['id']]
+        # The paths beneath a node fetched again may have been built
+        # on a bad one, so work them all out again
+        self.__reset_indexes()
+        self.__index_children()
+        queue = deque(set(found) | set(problems['bad_path']))
+        beneath = set()
+        while queue:
+            node_id = queue.popleft()
+            if node_id not in beneath:
+                beneath.add(node_id)
+                queue.extend(self.children.get(node_id, []))
+        for node_id in beneath:
+            paths.pop(node_id, None)
+        for node_id in beneath:
+            if metadata.get(node_id):
+                try:
+                    self.get_path(node_id)
+                except errors.HttpError as error:
+                    print("HttpError: " + str(error))
+                self.changed[node_id] = time.time()
+        ref_count = self.file_data['ref_count']
+        for key in problems['ref_count']:
+            if key in metadata:
+                ref_count.setdefault(key, 0)
+            else:
+                ref_count.pop(key, None)
+        for table, key in problems['stray']:
+            if metadata.get(key):
+                # Its node has been fetched again
+                continue
+            table = self.file_data[table]
+            if isinstance(table, ChainMap):
+                table = table.maps[0]
+            table.pop(key, None)
+        self.__reset_indexes()
+        self.file_data['dirty'] = True
+        return len(found)
+
+    def show_fsck(self, repair):
+        """Check the cache and print what is wrong with it; if repair,
+           repair it and check it again.
+           Returns: dict of problem => list, as check_cache()
+        """
+        LOG.debug("show_fsck(repair: %s)", repair)
+        self.df_print("# checksum: " + str(self.cache['checksum']) + "\n")
+        problems = self.check_cache()
+        self.__show_problems(problems)
+        if repair and any(problems.values()):
+            fetched = self.repair_cache(problems)
+            self.df_print("# repaired, fetching " + str(fetched) \
+                + " nodes\n")
+            problems = self.check_cache()
+            self.__show_problems(problems)
+        if repair and self.cache['checksum'] == 'mismatch':
+            # Rewrite it, with a checksum that matches
+            self.file_data['dirty'] = True
+        return problems
+
+    def __show_problems(self, problems):
+        """Print the problems found by check_cache()."""
+        for problem, description in FSCK_PROBLEMS:
+            self.df_print("# " + problem + ": " \
+                + str(len(problems[problem])) + " (" + description + ")\n")
+            for item in problems[problem]:
+                if isinstance(item, tuple):
+                    item = item[0] + " " + item[1]
+                self.df_print("   " + item + "\n")
 
     def set_debug(self, debug):
         """Set the debug flag."""
-        if self.debug:
-            print("set_debug[cached](" + str(debug) + ")")
+        LOG.debug("set_debug[cached](%s)", debug)
         self.debug = debug
-        if self.debug:
-            print("set_debug => debug:" + str(self.debug))
+        set_debug_logging(debug)
+        LOG.debug("set_debug => debug:%s", self.debug)
         return self.debug
 
     def get_debug(self):
         """Return the debug flag."""
-        if self.debug:
-            print("# get_debug[cached] => debug:" + str(self.debug))
+        LOG.debug("get_debug[cached] => debug:%s", self.debug)
         return self.debug
 
     def __str__(self):
@@ -617,6 +2017,66 @@ class DriveFileCached(DriveFileRaw):
 
 
 # Helper functions - framework for the main() function
+def handle_local_newer(drive_file, arg, show_all):
+    """Handle the --newer --local operation."""
+    LOG.debug("handle_local_newer(")
+    LOG.debug("   arg: '%s',", arg)
+    LOG.debug("   show_all: %s", show_all)
+    drive_file.show_local_newer(arg)
+
+
+def handle_drives(drive_file, arg, show_all):
+    """Handle the --drives operation."""
+    LOG.debug("handle_drives(arg: %s, show_all: %s)", arg, show_all)
+    drive_file.show_drives(arg)
+    return True
+
+
+def handle_fsck(drive_file, arg, repair):
+    """Handle the --fsck operation."""
+    LOG.debug("handle_fsck(")
+    LOG.debug("   arg: '%s',", arg)
+    LOG.debug("   repair: %s", repair)
+    drive_file.show_fsck(repair)
+    return True
+
+
+def handle_diff(drive_file, arg, show_all):
+    """Handle the --diff operation."""
+    LOG.debug("handle_diff(")
+    LOG.debug("   arg: '%s',", arg)
+    LOG.debug("   show_all: %s", show_all)
+    drive_file.show_diff(arg)
+    return True
+
+
+def handle_du(drive_file, node_id, show_all):
+    """Handle the --du operation."""
+    LOG.debug("handle_du(")
+    LOG.debug("   node_id: '%s',", node_id)
+    LOG.debug("   show_all: %s", show_all)
+    drive_file.show_du(node_id)
+    return True
+
+
+def handle_duplicates(drive_file, arg, show_all):
+    """Handle the --duplicates operation."""
+    LOG.debug("handle_duplicates(")
+    LOG.debug("   arg: '%s',", arg)
+    LOG.debug("   show_all: %s", show_all)
+    drive_file.show_duplicates()
+    return True
+
+
+def handle_query(drive_file, arg, show_all):
+    """Handle the --query operation."""
+    LOG.debug("handle_query(")
+    LOG.debug("   arg: '%s',", arg)
+    LOG.debug("   show_all: %s", show_all)
+    drive_file.show_query(arg)
+    return True
+
+
 def setup_parser():
     """Set up the arguments parser.
        Returns: parser
@@ -631,16 +2091,55 @@ def setup_parser():
         action='store_true',
         help='(Modifier)  When running a find, show all nodes.'
         )
+    parser.add_argument(
+        '--cache',
+        type=str,
+        metavar='PATH',
+        help='(Modifier) Keep the cache in PATH (default $' + CACHE_ENV + ' or ' + DriveFileCached.CACHE_PATH + ').'
+        )
     parser.add_argument(
         '--cd',
         type=str,
         help='Change the working directory.'
         )
+    parser.add_argument(
+        '--checksums',
+        action='store_true',
+        help='(Modifier) Also fetch md5Checksum for each file, for --duplicates.'
+        )
+    parser.add_argument(
+        '--diff',
+        type=str,
+        metavar='OLD_CACHE',
+        help='List the nodes added, removed, renamed, moved or resized since OLD_CACHE, an earlier copy of the cache file (it may be .gz or .zst).'
+        )
     parser.add_argument(
         '--dirty',
         action='store_true',
         help='List all nodes that have been modified since the cache file was written.'
         )
+    parser.add_argument(
+        '--drives',
+        action='store_true',
+        help='Scan every shared drive into the cache and list the nodes in them, under ' + SHARED_DRIVES + 'NAME/.'
+        )
+    parser.add_argument(
+        '--drive-workers',
+        type=int,
+        metavar='N',
+        help='(Modifier) Scan N shared drives at once for --drives (default ' \
+            + str(DriveFileCached.DRIVE_WORKERS) + ').'
+        )
+    parser.add_argument(
+        '--du',
+        type=str,
+        help='Show the bytes, files and folders in the cache beneath a folder and each of its subfolders.'
+        )
+    parser.add_argument(
+        '--duplicates',
+        action='store_true',
+        help='List cached files with identical content and the bytes they waste.'
+        )
     parser.add_argument(
         '-f',
         action='store_true',
@@ -651,16 +2150,87 @@ def setup_parser():
         type=str,
         help='Given a node, recursively list all subfolders (and contents if -a).'
         )
+    parser.add_argument(
+        '--fsck',
+        action='store_true',
+        help='Check the cache for consistency (and its checksum file); with -R, repair it, fetching only the nodes that need it.'
+        )
+    parser.add_argument(
+        '--limit',
+        type=int,
+        metavar='N',
+        help='(Modifier) Stop a find after N results.'
+        )
     parser.add_argument(
         '--ls',
         type=str,
         help='List a node or, if it represents a folder, the nodes in it.'
         )
+    parser.add_argument(
+        '--negative-ttl',
+        type=int,
+        metavar='SECONDS',
+        help='(Modifier) Remember failed path lookups for SECONDS (default ' \
+            + str(DriveFileCached.NEGATIVE_TTL) + ').'
+        )
     parser.add_argument(
         '--newer',
         type=str,
         help='List all nodes modified since the specified date.'
         )
+    parser.add_argument(
+        '--local',
+        action='store_true',
+        help='(Modifier) Answer --newer from the cache instead of asking the Drive.'
+        )
+    parser.add_argument(
+        '--log-file',
+        type=str,
+        metavar='PATH',
+        help='(Modifier) Write debugging and log output to PATH instead of stderr.'
+        )
+    parser.add_argument(
+        '--log-level',
+        type=parse_log_levels,
+        metavar='LEVEL',
+        help='(Modifier) Log at LEVEL (e.g. DEBUG), or per component (e.g. cached=DEBUG,raw=INFO).'
+        )
+    parser.add_argument(
+        '--max-age',
+        type=float,
+        metavar='SECONDS',
+        help='(Modifier) Fetch cached nodes and folder listings again once they are older than SECONDS.'
+        )
+    parser.add_argument(
+        '--max-age-for',
+        type=parse_max_age,
+        action='append',
+        metavar='OPERATION=SECONDS',
+        help='(Modifier) Override --max-age for one operation (get or list_children).'
+        )
+    parser.add_argument(
+        '--max-memory',
+        type=parse_size,
+        metavar='SIZE',
+        help='(Modifier) Keep about SIZE bytes (e.g. 200M) of the cache in memory, spilling the rest to disk.'
+        )
+    parser.add_argument(
+        '--max-nodes',
+        type=int,
+        metavar='N',
+        help='(Modifier) Keep at most N nodes of the cache in memory, spilling the rest to disk.'
+        )
+    parser.add_argument(
+        '--maxdepth',
+        type=int,
+        metavar='N',
+        help='(Modifier) Do not list folders more than N levels below the find.'
+        )
+    parser.add_argument(
+        '--mapped',
+        action='store_true',
+        help='(Modifier) Read the cache through its memory-mapped form, building it if needed.'
+        )
     parser.add_argument(
         '-n', '--nocache',
         action='store_true',
@@ -671,16 +2241,54 @@ def setup_parser():
         type=str,
         help='Send the output to the specified local file.'
         )
+    parser.add_argument(
+        '--output-buffer',
+        type=parse_size,
+        metavar='SIZE',
+        help='(Modifier) Collect SIZE bytes (default 1M) of output before writing to the --output file; 0 writes each line.'
+        )
+    parser.add_argument(
+        '--profile',
+        type=str,
+        nargs='?',
+        const='',
+        metavar='PREFIX',
+        help='(Modifier) Profile the work with cProfile and write PREFIX.pstats and PREFIX.txt.'
+        )
+    parser.add_argument(
+        '--profile-memory',
+        action='store_true',
+        help='(Modifier) With --profile, also take a tracemalloc snapshot.'
+        )
+    parser.add_argument(
+        '--prune',
+        type=str,
+        action='append',
+        metavar='GLOB',
+        help='(Modifier) Skip nodes, and whole folders, whose names match GLOB during a find (may be repeated).'
+        )
+    parser.add_argument(
+        '--query',
+        type=str,
+        help="Find cached nodes matching a query, e.g. 'name:*.pdf size:>10M'."
+        )
     parser.add_argument(
         '-R', '--refresh',
         action='store_true',
-        help='(Modifier) Update the cache.  For use with the --newer and --dirty operators.'
+        help='(Modifier) Update the cache.  For use with the --newer, --dirty and --fsck operators.'
         )
     parser.add_argument(
         '--showall',
         action='store_true',
         help="Show all files in My Drive."
         )
+    parser.add_argument(
+        '--stale-ok',
+        type=float,
+        default=0,
+        metavar='SECONDS',
+        help='(Modifier) Use entries up to SECONDS past their max-age, refreshing them in batches afterwards.'
+        )
     parser.add_argument(
         '--stat',
         type=str,
@@ -691,6 +2299,11 @@ def setup_parser():
         action='store_true',
         help="Display the status of the DriveFile object."
         )
+    parser.add_argument(
+        '--stats-json',
+        type=str,
+        help="(Modifier) On exit, write API and cache statistics as JSON to the specified file."
+        )
     parser.add_argument(
         '-D', '--DEBUG',
         action='store_true',
@@ -714,15 +2327,43 @@ def do_work(teststats):
 
     # Do the work ...
 
-    drive_file = DriveFileCached(True) if args.DEBUG \
+    _ = setup_logging(args.log_level, args.log_file) \
+            if args.log_level or args.log_file else False
+
+    drive_file = DriveFileCached(True) if args.DEBUG or debug_enabled() \
                  else DriveFileCached(False)
 
+    if args.output_buffer is not None:
+        drive_file.output_buffer = args.output_buffer
     _ = drive_file.df_set_output(args.output) if args.output else "stdout"
     drive_file.df_print(startup_report)
 
     print("# output going to: " + drive_file.output_path)
 
-    _ = drive_file.init_cache() if args.nocache else drive_file.load_cache()
+    if args.negative_ttl is not None:
+        drive_file.negative_ttl = args.negative_ttl
+
+    drive_file.set_policy(args.max_age, args.max_age_for, args.stale_ok)
+    _ = drive_file.set_cache_path(args.cache) if args.cache else False
+    drive_file.set_memory_bound(args.max_nodes, args.max_memory)
+    drive_file.set_find_limits(args.maxdepth, args.prune, args.limit)
+    _ = drive_file.df_set_extra_fields(["md5Checksum"]) \
+            if args.checksums else False
+
+    if args.nocache:
+        drive_file.init_cache()
+    elif args.mapped and not args.fsck:
+        drive_file.load_mapped_cache()
+    else:
+        drive_file.load_cache()
+
+    profiler = WorkProfiler(
+        profile_prefix(teststats.program_name, args.profile),
+        args.profile_memory
+        ) if args.profile is not None else None
+    _ = profiler.start() if profiler else False
+
+    _ = handle_fsck(drive_file, args.fsck, args.refresh) if args.fsck else False
 
     if args.cd:
         drive_file.set_cwd(args.cd)
@@ -746,29 +2387,58 @@ def do_work(teststats):
         drive_file.debug
         ) if args.find and not args.f else path
 
+    path = canonicalize_path(
+        drive_file.get_cwd(),
+        args.du,
+        drive_file.debug
+        ) if args.du and not args.f else path
+
     node_id = drive_file.resolve_path(path)
 
     node_id = args.stat if args.stat and args.f else node_id
     node_id = args.ls if args.ls and args.f else node_id
     node_id = args.find if args.find and args.f else node_id
+    node_id = args.du if args.du and args.f else node_id
 
-    _ = handle_newer(drive_file, drive_file.cache['mtime'], args.refresh) \
+    _ = handle_newer(drive_file, drive_file.get_high_water(), args.refresh) \
             if args.dirty else False
 
     _ = handle_find(drive_file, node_id, args.all) if args.find else False
 
     _ = handle_ls(drive_file, node_id, args.all) if args.ls else False
 
-    _ = handle_newer(drive_file, args.newer, args.refresh) if args.newer else False
+    _ = handle_du(drive_file, node_id, args.all) if args.du else False
+
+    _ = handle_diff(drive_file, args.diff, args.all) if args.diff else False
+
+    _ = handle_newer(drive_file, args.newer, args.refresh) \
+            if args.newer and not args.local else False
+
+    _ = handle_local_newer(drive_file, args.newer, args.all) \
+            if args.newer and args.local else False
+
+    _ = handle_query(drive_file, args.query, args.all) if args.query else False
 
     _ = handle_showall(drive_file, args.all) if args.showall else False
 
+    _ = handle_drives(drive_file, args.drive_workers, args.all) \
+            if args.drives else False
+
+    _ = handle_duplicates(drive_file, args.duplicates, args.all) \
+            if args.duplicates else False
+
     _ = handle_stat(drive_file, node_id, args.all) if args.stat else False
 
     _ = handle_status(drive_file, args.status, args.all) if args.status else False
 
+    if profiler:
+        for line in profiler.stop():
+            print(line, end='')
+
     # Done with the work
 
+    drive_file.refresh_stale()
+
     drive_file.df_print("# call_count: " + '\n')
     for call_type, count in drive_file.call_count.items():
         drive_file.df_print("#    " + call_type + ": " + str(count) + '\n')
@@ -778,8 +2448,11 @@ def do_work(teststats):
     else:
         print("# skip writing cache.")
 
+    _ = drive_file.df_dump_stats(args.stats_json) if args.stats_json else False
+
     wrapup_report = teststats.report_wrapup()
     drive_file.df_print(wrapup_report)
+    drive_file.df_close_output()
 
 
 def main():
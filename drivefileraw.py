@@ -28,16 +28,31 @@ Design and naming conventions:
 """
 
 import argparse
+import collections
+import fnmatch
 import json
+import logging
 import os
 import os.path
 import pickle
+import queue
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import psutil
 # import httplib2
 
+from drivelog import debug_enabled
+from drivelog import get_logger
+from drivelog import set_debug_logging
+from drivenode import plain
+from driveoutput import OUTPUT_BUFFER
+from driveoutput import OutputFile
+from drivestats import DriveStats
+from drivestats import response_bytes
+
 #
 # This disable is probably overkill.  It silences the pylint whining
 # about no-member when encountering references to
@@ -64,9 +79,89 @@ from oauth2client.file import Storage
 
 APPLICATION_NAME = 'Drive Inspector'
 
+LOG = get_logger('raw')
+
+def quote_query(value):
+    """Escape a string for use inside a quoted Drive query literal.
+       Returns: string
+    """
+    return value.replace('\\', '\\\\').replace("'", "\\'")
+
+
+def is_pruned(node, prune):
+    """Test a node's name against the --prune glob patterns.
+       Returns: Boolean
+    """
+    return any(fnmatch.fnmatchcase(node['name'], pattern) \
+        for pattern in prune)
+
+
 def pretty_json(json_object):
     """Return a pretty-printed string of a JSON object (string)."""
-    return json.dumps(json_object, indent=4, separators=(',', ': '))
+    return json.dumps(json_object, indent=4, separators=(',', ': '),
+                      default=plain)
+
+
+class LazyJSON():
+    """A log message argument that pretty-prints its object only when
+       the message is actually formatted."""
+
+    def __init__(self, json_object):
+        self.json_object = json_object
+
+    def __str__(self):
+        return pretty_json(self.json_object)
+
+
+def parent_corpus(drive_id):
+    """The corpus to query for the children of a folder: the shared
+       drive drive_id, or the default corpus (My Drive and what is
+       shared with me) for a folder that is not in a shared drive.
+       Not allDrives, which is slow and may answer with only some of
+       the children.
+       Returns: dict of keyword arguments for files().list()
+    """
+    if not drive_id:
+        return {}
+    return {
+        'corpora': 'drive',
+        'driveId': drive_id,
+        'includeItemsFromAllDrives': True,
+        'supportsAllDrives': True,
+        }
+
+
+def drive_root_node(drive):
+    """Construct the node for the top folder of a shared drive, which
+       the Drive does not list among the drive's files.
+       Returns: node
+    """
+    return {
+        'id': drive['id'],
+        'name': drive['name'],
+        'mimeType': DriveFileRaw.FOLDERMIMETYPE,
+        'driveId': drive['id'],
+        'trashed': False,
+        }
+
+
+def count_bytes(request, received):
+    """Have request add the size of its HTTP response body to
+       received[0] when the client library decodes it (which it does
+       for a request on its own and for each one in a batch), so the
+       bytes are counted as they came off the wire.
+       Returns: request
+    """
+    postproc = getattr(request, 'postproc', None)
+    if postproc is None:
+        # A stand-in for the API (see drivefake.py) has no HTTP response
+        return request
+
+    def counting(resp, content):
+        received[0] += response_bytes(resp, content)
+        return postproc(resp, content)
+    request.postproc = counting
+    return request
 
 
 class DriveFileRaw():
@@ -75,25 +170,64 @@ class DriveFileRaw():
     FOLDERMIMETYPE = 'application/vnd.google-apps.folder'
     STANDARD_FIELDS = "id, name, parents, mimeType, size, owners, "
     STANDARD_FIELDS += "trashed, modifiedTime, createdTime, ownedByMe, "
-    STANDARD_FIELDS += "shared"
+    STANDARD_FIELDS += "shared, driveId"
+
+    # Fields that cost extra to fetch, requested with df_set_extra_fields()
+    OPTIONAL_FIELDS = ["md5Checksum"]
 
-    def __init__(self, debug):
+    # Shared drives scanned at once by list_all_drive_pages()
+    DRIVE_WORKERS = 4
+
+    # Requests sent at once by get_batch() (the API allows 100)
+    BATCH_SIZE = 100
+
+    def __init__(self, debug, service=None, service_factory=None):
         self.time_data = {}
         self.call_count = {}
         self.call_count['get'] = 0
+        self.call_count['get_batch'] = 0
         self.call_count['list_children'] = 0
         self.call_count['list_all'] = 0
         self.call_count['list_modified'] = 0
         self.call_count['list_newer'] = 0
         self.call_count['__get_named_child'] = 0
+        self.call_count['list_drives'] = 0
+        self.call_count['list_drive'] = 0
+        self.stats = DriveStats()
+        # The shared drive scans record their calls from several threads
+        self.stats_lock = threading.Lock()
+        self.node_fields = self.STANDARD_FIELDS
+        # max_depth, prune and limit for handle_find()
+        self.find_limits = {}
         self.debug = debug
+        # Leave levels that --log-level has already set alone
+        _ = set_debug_logging(True) \
+            if debug and not debug_enabled() else False
+        # Bytes of df_print() output to collect before writing a file
+        self.output_buffer = OUTPUT_BUFFER
+        self.output_file = None
         self.df_set_output("stdout")
-        credentials = self.get_credentials()
-        self.service = discovery.build(
-            'drive',
-            'v3',
-            credentials=credentials
-            )
+        # A caller (e.g. the benchmark harness) may hand us a service
+        # object that stands in for the Drive API.  Otherwise we
+        # authenticate and build the real one.
+        if service is None:
+            credentials = self.get_credentials()
+            service = discovery.build(
+                'drive',
+                'v3',
+                credentials=credentials
+                )
+            if service_factory is None:
+                # The client library is not thread safe, so each
+                # shared drive scan builds a service of its own
+                service_factory = lambda: discovery.build(
+                    'drive',
+                    'v3',
+                    credentials=credentials
+                    )
+        self.service = service
+        self.service_factory = service_factory if service_factory \
+            else lambda: service
 
     def get_credentials(self):
         """Gets valid user credentials from storage.
@@ -191,14 +325,14 @@ class DriveFileRaw():
         """Get status of DriveFile instance.
            Returns: List of String
         """
-        if self.debug:
-            print("# df_status[raw]()")
+        LOG.debug("df_status[raw]()")
         result = []
         result.append("# ========== RAW STATUS ==========\n")
         result.append("# debug: " + str(self.debug) + "\n")
         result.append("# output_path: '" + str(self.output_path) + "'\n")
         for key, num in self.call_count.items():
             result.append("# call_count: " + key + ": " + str(num) + "\n")
+        result += self.stats.api_report()
         result.append("# ========== RAW STATUS ==========\n")
         return result
 
@@ -208,44 +342,78 @@ class DriveFileRaw():
 
     def df_set_output(self, path):
         """Assign an output file path."""
-        if self.debug:
-            print("# df_set_output[raw](" + str(path) + ")")
+        LOG.debug("df_set_output[raw](%s)", path)
+        self.df_close_output()
         self.output_path = path
         try:
             if path == 'stdout':
                 self.output_file = sys.stdout
             else:
                 self.output_file = \
-                    open(self.output_path, "w", encoding="utf-8")
+                    OutputFile(self.output_path, self.output_buffer)
             self.output_path = path
             print("# writing output to: " + str(self.output_path))
-        except IOError as error:
-            print("# Can not open" + self.output_path + ".")
-            print("#    IOError: " + str(error))
+        except (IOError, ValueError) as error:
+            print("# Can not open " + self.output_path + ".")
+            print("#    " + type(error).__name__ + ": " + str(error))
             self.output_file = sys.stdout
             self.output_path = 'stdout'
 
+    def df_flush_output(self):
+        """Write out any df_print() output that is still buffered."""
+        if self.output_file is not None:
+            self.output_file.flush()
+
+    def df_close_output(self):
+        """Finish the output file, renaming it into place, and go back
+           to stdout."""
+        if isinstance(self.output_file, OutputFile):
+            LOG.debug("df_close_output[raw](%s)", self.output_path)
+            self.output_file.close()
+        self.output_file = sys.stdout
+        self.output_path = 'stdout'
+
+    def df_dump_stats(self, path):
+        """Write the instrumentation counters to path as JSON."""
+        LOG.debug("df_dump_stats[raw](%s)", path)
+        try:
+            self.stats.dump(path, self.call_count)
+            print("# Wrote stats to " + str(path) + ".")
+        except IOError as error:
+            print("# Can not write stats to " + str(path) + ".")
+            print("#    IOError: " + str(error))
+        return True
+
     def df_field_list(self):
         """Report a list of available fields.
            Returns a list of strings.
         """
-        if self.debug:
-            print("df_field_list[raw]()")
-        return self.STANDARD_FIELDS.split(", ")
+        LOG.debug("df_field_list[raw]()")
+        return self.node_fields.split(", ")
+
+    def df_set_extra_fields(self, fields):
+        """Ask the Drive for some of the OPTIONAL_FIELDS (a list) as
+           well as the STANDARD_FIELDS, from now on.
+           Returns: string (the fields requested for each node)
+        """
+        LOG.debug("df_set_extra_fields[raw](%s)", fields)
+        for field in fields:
+            if field not in self.OPTIONAL_FIELDS:
+                raise ValueError("not an optional field: " + field)
+        self.node_fields = ", ".join([self.STANDARD_FIELDS] + list(fields))
+        return self.node_fields
 
     def set_debug(self, debug):
         """Set the debug flag."""
-        if self.debug:
-            print("set_debug[raw](" + str(debug) + ")")
+        LOG.debug("set_debug[raw](%s)", debug)
         self.debug = debug
-        if self.debug:
-            print("    => " + str(self.debug))
+        set_debug_logging(debug)
+        LOG.debug("    => %s", self.debug)
         return self.debug
 
     def get_debug(self):
         """Return the debug flag."""
-        if self.debug:
-            print("get_debug[raw]() => " + str(self.debug))
+        LOG.debug("get_debug[raw]() => %s", self.debug)
         return self.debug
 
     # Get methods
@@ -254,64 +422,132 @@ class DriveFileRaw():
         """Get the node for node_id.
            Returns: node
         """
-        if self.debug:
-            print("# get[raw](node_id: " + node_id + ")")
+        LOG.debug("get[raw](node_id: %s)", node_id)
         t_start = time.time()
-        node = \
+        node = self.__execute(
+            'get',
             self.service.files().get(
                 fileId=node_id,
-                fields=self.STANDARD_FIELDS
-                ).execute()
+                fields=self.node_fields,
+                supportsAllDrives=True
+                ))
         self.call_count['get'] += 1
         self.time_data[node_id] = time.time() - t_start
         return node
 
+    def get_batch(self, node_ids):
+        """Get the nodes for node_ids, BATCH_SIZE to each request to
+           the API's batch endpoint rather than one request apiece.
+           Returns: (dict of node_id => node, list of node_id not found)
+        """
+        LOG.debug("get_batch[raw](len: %s)", len(node_ids))
+        found = {}
+        missing = []
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                found[request_id] = response
+            elif isinstance(exception, errors.HttpError) \
+                    and exception.resp.status == 404:
+                missing.append(request_id)
+            else:
+                print("HttpError: " + str(exception))
+
+        node_ids = list(node_ids)
+        for start in range(0, len(node_ids), self.BATCH_SIZE):
+            chunk = node_ids[start:start + self.BATCH_SIZE]
+            batch = self.service.new_batch_http_request(callback=callback)
+            received = [0]
+            for node_id in chunk:
+                batch.add(
+                    count_bytes(
+                        self.service.files().get(
+                            fileId=node_id,
+                            fields=self.node_fields,
+                            supportsAllDrives=True
+                            ),
+                        received
+                        ),
+                    request_id=node_id
+                    )
+            t_start = time.time()
+            batch.execute()
+            with self.stats_lock:
+                self.stats.record(
+                    'get_batch', time.time() - t_start, received[0])
+            self.call_count['get_batch'] += 1
+        return found, missing
+
+    def __execute(self, call_type, request):
+        """Execute one Drive API request, recording its latency and
+           size in self.stats under call_type.
+           Returns: response
+        """
+        received = [0]
+        t_start = time.time()
+        response = count_bytes(request, received).execute()
+        with self.stats_lock:
+            self.stats.record(call_type, time.time() - t_start, received[0])
+        return response
 
-#    def __get_named_child(self, node_id, component):
-#        """ Given the node_id of a folder and a component name, find the
-#            matching child, if it exists.
-#            Returns: node
-#        """
-#        if self.debug:
-#            print("# __get_named_child[raw](node_id:" \
-#                + str(node_id) + ", " + component + ")")
-#
-#        # children = self.list_children(node_id)
-#        query = "'" + node_id + "' in parents"
-#        query += "and name = '" + component +"'"
-#        fields = "nextPageToken, "
-#        fields += "files(" + self.STANDARD_FIELDS + ")"0
-#
-#        if self.debug:
-#            print("# query: " + query)
-#            print("# fields: " + fields)
-#
-#        npt = "start"
-#        children = []
-#        while npt:
-#            if self.debug:
-#                print("# __get_named_child: npt: (" + npt + ")")
-#            try:
-#                if npt == "start":
-#                    response = self.service.files().list(
-#                        q=query,
-#                        fields=fields
-#                        ).execute()
-#                else:
-#                    response = self.service.files().list(
-#                        pageToken=npt,
-#                        q=query,
-#                        fields=fields
-#                        ).execute()
-#                self.call_count['__get_named_child'] += 1
-#                npt = response.get('nextPageToken')
-#                children += response.get('files', [])
-#            except errors.HttpError as error:
-#                print("HttpError: " + str(error))
-#                response = "not found."
-#                npt = None
-#
-#        return children
+
+    def list_named_children(self, node_id, name, drive_id=None):
+        """Ask the Drive for the children of node_id called name,
+           rather than listing every child and filtering here.  drive_id
+           is the shared drive node_id is in, if it is in one.
+           Returns: list of node, or None if the query failed
+        """
+        LOG.debug("list_named_children[raw](node_id: %s, name: '%s')",
+                  node_id, name)
+        query = "'" + quote_query(node_id) + "' in parents"
+        query += " and name = '" + quote_query(name) + "'"
+        try:
+            children, complete = self.__list_by_parent(
+                '__get_named_child', query, drive_id)
+        except errors.HttpError as error:
+            print("HttpError: " + str(error))
+            return None
+        LOG.debug("   => len: %s, complete: %s", len(children), complete)
+        # Finding nothing in an incomplete search proves nothing
+        return children if children or complete else None
+
+    def __list_by_parent(self, call_type, query, drive_id):
+        """Run query, a query by parent, a page at a time, in the corpus
+           of the parent (see parent_corpus()).
+           Raises errors.HttpError.
+           Returns: (list of node, Boolean False if the Drive said that
+               the results are incomplete)
+        """
+        fields = "nextPageToken, incompleteSearch, "
+        fields += "files(" + self.node_fields + ")"
+        corpus = parent_corpus(drive_id)
+        LOG.debug("query: %s", query)
+        LOG.debug("fields: %s", fields)
+        npt = "start"
+        children = []
+        complete = True
+        while npt:
+            LOG.debug("   %s: npt: (%s)", call_type, npt)
+            if npt == "start":
+                request = self.service.files().list(
+                    q=query,
+                    fields=fields,
+                    **corpus
+                    )
+            else:
+                request = self.service.files().list(
+                    pageToken=npt,
+                    q=query,
+                    fields=fields,
+                    **corpus
+                    )
+            response = self.__execute(call_type, request)
+            self.call_count[call_type] += 1
+            npt = response.get('nextPageToken')
+            children += response.get('files', [])
+            if response.get('incompleteSearch'):
+                complete = False
+        return children, complete
 
     # Logic methods
 
@@ -319,145 +555,275 @@ class DriveFileRaw():
         """Test whether node represents a folder.
            Returns: Boolean
         """
-        node_id = node['id']
-        if self.debug:
-            print("# __is_folder[raw](" + node_id + ")")
         result = node['mimeType'] == self.FOLDERMIMETYPE \
                  and ("fileExtension" not in node)
-        if self.debug:
-            print("# node: " + pretty_json(node))
-            print("#   => " + str(result))
+        # The node is only turned into JSON if the message is logged
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("__is_folder[raw](%s): %s => %s",
+                      node['id'], LazyJSON(node), result)
         return result
 
     # List methods
 
-    def list_children(self, node_id):
+    def list_children(self, node_id, drive_id=None):
         """Get the children of node_id.  Limited to immediate children.
+           drive_id is the shared drive node_id is in, if it is in one.
            Returns: list of node
         """
-        if self.debug:
-            print("# list_children[raw](node_id: " + node_id + ")")
-        query = "'" + node_id + "' in parents"
-        fields = "nextPageToken, "
-        fields += "files(" + self.STANDARD_FIELDS + ")"
-        if self.debug:
-            print("# query: " + query)
-            print("# fields: " + fields)
-        npt = "start"
-        children = []
-        while npt:
-            if self.debug:
-                print("#    list_children: npt: (" + npt + ")")
-            try:
-                if npt == "start":
-                    response = self.service.files().list(
-                        q=query,
-                        fields=fields
-                        ).execute()
-                else:
-                    response = self.service.files().list(
-                        pageToken=npt,
-                        q=query,
-                        fields=fields
-                        ).execute()
-                self.call_count['list_children'] += 1
-                npt = response.get('nextPageToken')
-                children += response.get('files', [])
-            except errors.HttpError as error:
-                print("HttpError: " + str(error))
-                response = "not found."
-                npt = None
-        if self.debug:
-            print("#    => len: " + str(len(children)))
-        return children
+        return self.list_children_complete(node_id, drive_id)[0]
 
-    def list_all_children(self, node_id, show_all=False):
-        """Return the entire list of nodes beneath a given node.
+    def list_children_complete(self, node_id, drive_id=None):
+        """Get the children of node_id, and whether they are all of
+           them: not if the query failed, or if the Drive said that its
+           results are incomplete.
+           Returns: (list of node, Boolean)
+        """
+        LOG.debug("list_children[raw](node_id: %s)", node_id)
+        query = "'" + quote_query(node_id) + "' in parents"
+        try:
+            children, complete = self.__list_by_parent(
+                'list_children', query, drive_id)
+        except errors.HttpError as error:
+            print("HttpError: " + str(error))
+            children, complete = [], False
+        LOG.debug("   => len: %s, complete: %s", len(children), complete)
+        return children, complete
+
+    def set_find_limits(self, max_depth=None, prune=None, limit=None):
+        """Set the limits handle_find() passes to show_all_children().
+           Returns: nothing
+        """
+        self.find_limits = {
+            'max_depth': max_depth,
+            'prune': prune,
+            'limit': limit,
+            }
+
+    def list_all_children(self, node_id, show_all=False,
+                          max_depth=None, prune=None, limit=None):
+        """Return the entire list of nodes beneath a given node,
+           breadth first.  Folders more than max_depth levels down are
+           not listed, nodes whose names match a glob in prune are
+           skipped (and folders not listed), and the walk stops once
+           limit nodes have been found.
            Return: list of node
         """
-        if self.debug:
-            print("# list_all_children[raw](" \
-                + "node_id: " + str(node_id) \
-                + ", show_all: " + str(show_all) + ")")
+        LOG.debug("list_all_children[raw](node_id: %s, show_all: %s,"
+                  " max_depth: %s, prune: %s, limit: %s)",
+                  node_id, show_all, max_depth, prune, limit)
         result = []
-        queue = self.list_children(node_id)
+        if (limit is not None and limit <= 0) \
+                or (max_depth is not None and max_depth < 1):
+            return result
+        debug = LOG.isEnabledFor(logging.DEBUG)
+        queue = collections.deque(
+            (child, 1) for child in self.list_children(node_id))
         while queue:
-            node = queue.pop(0)
+            node, depth = queue.popleft()
             node_id = node['id']
-            if self.debug:
-                print("#    node_id: (" + node_id + ")")
-            if self.__is_folder(node):
-                children = self.list_children(node_id)
-                queue += children
-                result.append(node)
-            elif show_all:
-                result.append(node)
+            if debug:
+                LOG.debug("   node_id: (%s)", node_id)
+            if prune and is_pruned(node, prune):
+                continue
+            is_folder = self.__is_folder(node)
+            if not is_folder and not show_all:
+                continue
+            result.append(node)
+            if limit is not None and len(result) >= limit:
+                break
+            if is_folder and (max_depth is None or depth < max_depth):
+                queue.extend((child, depth + 1) for child \
+                    in self.list_children(node_id, node.get('driveId')))
         return result
 
     def list_all(self):
         """Get all of the files to which I have access.
            Returns: list of node
         """
-        if self.debug:
-            print("# list_all[raw]()")
+        LOG.debug("list_all[raw]()")
+        node_list = []
+        for page in self.list_all_pages():
+            node_list += page
+        LOG.debug("    => len: %s", len(node_list))
+        return node_list
+
+    def list_all_pages(self):
+        """Get all of the files to which I have access, one page of
+           results at a time.
+           Returns: iterator of list of node
+        """
         fields = "nextPageToken, "
-        fields += "files(" + self.STANDARD_FIELDS + ")"
-        if self.debug:
-            print("# fields: " + fields)
+        fields += "files(" + self.node_fields + ")"
+        LOG.debug("fields: %s", fields)
         npt = "start"
-        node_list = []
         while npt:
-            if self.debug:
-                print("#    npt: (" + npt + ")")
+            LOG.debug("   npt: (%s)", npt)
             try:
                 if npt == "start":
-                    response = self.service.files().list(
-                        fields=fields
-                        ).execute()
+                    response = self.__execute(
+                        'list_all',
+                        self.service.files().list(
+                            fields=fields
+                            ))
                 else:
-                    response = self.service.files().list(
-                        pageToken=npt,
-                        fields=fields
-                        ).execute()
+                    response = self.__execute(
+                        'list_all',
+                        self.service.files().list(
+                            pageToken=npt,
+                            fields=fields
+                            ))
                 self.call_count['list_all'] += 1
                 npt = response.get('nextPageToken')
-                node_list += response.get('files', [])
             except errors.HttpError as error:
                 print("HttpError: " + str(error))
                 response = "not found."
                 npt = None
-        if self.debug:
-            print("#     => len: " + str(len(node_list)))
-        return node_list
+            else:
+                yield response.get('files', [])
+
+    def list_drives(self):
+        """Get the shared drives to which I have access.
+           Returns: list of dict (id, name)
+        """
+        LOG.debug("list_drives[raw]()")
+        drives = []
+        npt = "start"
+        while npt:
+            try:
+                if npt == "start":
+                    response = self.__execute(
+                        'list_drives',
+                        self.service.drives().list(
+                            pageSize=100,
+                            fields="nextPageToken, drives(id, name)"
+                            ))
+                else:
+                    response = self.__execute(
+                        'list_drives',
+                        self.service.drives().list(
+                            pageToken=npt,
+                            pageSize=100,
+                            fields="nextPageToken, drives(id, name)"
+                            ))
+                self.call_count['list_drives'] += 1
+                npt = response.get('nextPageToken')
+                drives += response.get('drives', [])
+            except errors.HttpError as error:
+                print("HttpError: " + str(error))
+                npt = None
+        LOG.debug("   => len: %s", len(drives))
+        return drives
+
+    def list_drive_pages(self, drive_id, service=None):
+        """Get all of the files in the shared drive drive_id, one page
+           of results at a time, using service (by default our own).
+           Raises errors.HttpError.
+           Returns: iterator of list of node
+        """
+        LOG.debug("list_drive_pages[raw](drive_id: %s)", drive_id)
+        service = service if service is not None else self.service
+        fields = "nextPageToken, "
+        fields += "files(" + self.node_fields + ")"
+        npt = "start"
+        while npt:
+            if npt == "start":
+                request = service.files().list(
+                    corpora='drive',
+                    driveId=drive_id,
+                    includeItemsFromAllDrives=True,
+                    supportsAllDrives=True,
+                    fields=fields
+                    )
+            else:
+                request = service.files().list(
+                    pageToken=npt,
+                    corpora='drive',
+                    driveId=drive_id,
+                    includeItemsFromAllDrives=True,
+                    supportsAllDrives=True,
+                    fields=fields
+                    )
+            response = self.__execute('list_drive', request)
+            with self.stats_lock:
+                self.call_count['list_drive'] += 1
+            npt = response.get('nextPageToken')
+            page = response.get('files', [])
+            for node in page:
+                # Not among the fields we ask for, but known here
+                node['driveId'] = drive_id
+            yield page
+
+    def list_all_drive_pages(self, drives, workers=None):
+        """Scan each of drives (from list_drives()) as a corpus of its
+           own, up to workers of them at once, each with its own
+           service.  A drive's pages arrive in order, followed by
+           (drive, None) once all of them have; a drive whose scan
+           fails is reported and has no (drive, None).
+           Returns: iterator of (drive, list of node)
+        """
+        workers = workers if workers else self.DRIVE_WORKERS
+        LOG.debug("list_all_drive_pages[raw](drives: %s, workers: %s)",
+                  len(drives), workers)
+        results = queue.Queue()
+
+        def scan(drive):
+            """Put the pages of drive on results, then a marker."""
+            done = False
+            try:
+                service = self.service_factory()
+                for page in self.list_drive_pages(drive['id'], service):
+                    results.put((drive, page))
+                done = True
+            except errors.HttpError as error:
+                print("HttpError: " + drive['name'] + ": " + str(error))
+            finally:
+                results.put((drive, None if done else False))
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(scan, drive) for drive in drives]
+            remaining = len(futures)
+            while remaining:
+                drive, page = results.get()
+                if page is False:
+                    remaining -= 1
+                    continue
+                if page is None:
+                    remaining -= 1
+                yield drive, page
+            for future in futures:
+                # Raise anything other than an HttpError here
+                future.result()
 
     def list_newer(self, date):
         """Find nodes that are modified more recently that
            the provided date.
            Returns: list of node
         """
-        if self.debug:
-            print("# list_newer[raw](date: " + str(date) + ")")
+        LOG.debug("list_newer[raw](date: %s)", date)
         newer_node_list = []
         fields = "nextPageToken, "
-        fields += "files(" + self.STANDARD_FIELDS + ")"
+        fields += "files(" + self.node_fields + ")"
         npt = "start"
         query = "modifiedTime > '" + str(date) + "'"
         while npt:
-            if self.debug:
-                print("# list_newer: npt: (" + npt + ")")
-                print("#    query: '" + str(query) + "'")
+            LOG.debug("list_newer: npt: (%s)", npt)
+            LOG.debug("   query: '%s'", query)
             try:
                 if npt == "start":
-                    response = self.service.files().list(
-                        q=query,
-                        fields=fields
-                        ).execute()
+                    response = self.__execute(
+                        'list_newer',
+                        self.service.files().list(
+                            q=query,
+                            fields=fields
+                            ))
                 else:
-                    response = self.service.files().list(
-                        pageToken=npt,
-                        q=query,
-                        fields=fields
-                        ).execute()
+                    response = self.__execute(
+                        'list_newer',
+                        self.service.files().list(
+                            pageToken=npt,
+                            q=query,
+                            fields=fields
+                            ))
                 self.call_count['list_newer'] += 1
                 npt = response.get('nextPageToken')
                 newer_node_list += response.get('files', [])
@@ -465,8 +831,7 @@ class DriveFileRaw():
                 print("HttpError: " + str(error))
                 response = "not found."
                 npt = None
-        if self.debug:
-            print("#    => len: " + str(len(newer_node_list)))
+        LOG.debug("   => len: %s", len(newer_node_list))
         return newer_node_list
 
     # Show methods
@@ -475,49 +840,49 @@ class DriveFileRaw():
 
     def show_node(self, node_id):
         """ Display the node for a node."""
-        if self.debug:
-            print("# show_node[raw](" + node_id + ")")
+        LOG.debug("show_node[raw](%s)", node_id)
         self.df_print(pretty_json(self.get(node_id)))
 
     def show_children(self, node_id):
         """ Display the names of the children of a node.
             This is the core engine of the --ls function.
         """
-        if self.debug:
-            print("# show_children[raw](" + str(node_id) + ")")
+        LOG.debug("show_children[raw](%s)", node_id)
         children = self.list_children(node_id)
-        if self.debug:
-            print("# show_children: len(children): " + str(len(children)))
+        LOG.debug("show_children: len(children): %s", len(children))
+        debug = LOG.isEnabledFor(logging.DEBUG)
         for child in children:
             child_id = child['id']
-            if self.debug:
-                print("# child: " + str(child_id))
+            if debug:
+                LOG.debug("child: %s", child_id)
             child_name = child['name']
             if self.__is_folder(child):
                 child_name += "/"
             self.df_print(child_name + '\n')
 
-    def show_all_children(self, node_id, show_all=False):
+    def show_all_children(self, node_id, show_all=False,
+                          max_depth=None, prune=None, limit=None):
         """ Display all child directories of a node
             If show_all is True, then display all files.  If False
-            then show only the folder structure.
+            then show only the folder structure.  max_depth, prune
+            and limit are as for list_all_children().
         """
-        if self.debug:
-            print("# show_all_children[raw](" + node_id + ",")
-            print("#    show_all: " + str(show_all) + ")")
+        LOG.debug("show_all_children[raw](%s,", node_id)
+        LOG.debug("   show_all: %s)", show_all)
 
-        children = self.list_all_children(node_id, show_all)
+        children = self.list_all_children(
+            node_id, show_all, max_depth, prune, limit)
 
         num_files = 0
         num_folders = 0
 
+        debug = LOG.isEnabledFor(logging.DEBUG)
         for child in children:
             child_id = child['id']
             child_name = child['name']
             num_files += 1
-            if self.debug:
-                print("# child_id: (" + child_id + ") '" \
-                      + child_name + "'")
+            if debug:
+                LOG.debug("child_id: (%s) '%s'", child_id, child_name)
             if self.__is_folder(child):
                 num_folders += 1
                 self.df_print(child_name + '/\n')
@@ -528,18 +893,17 @@ class DriveFileRaw():
         """Display the names of all files available in My Drive
            Returns: nothing
         """
-        if self.debug:
-            print("# show_all[raw]()")
+        LOG.debug("show_all[raw]()")
         node_list = self.list_all()
         num_folders = 0
         num_files = 0
+        debug = LOG.isEnabledFor(logging.DEBUG)
         for node in node_list:
             node_id = node['id']
             node_name = node['name']
             num_files += 1
-            if self.debug:
-                print("#    node_id: (" + node_id + ") '" \
-                      + node_name + "'")
+            if debug:
+                LOG.debug("   node_id: (%s) '%s'", node_id, node_name)
             if self.__is_folder(node):
                 num_folders += 1
                 self.df_print(node_name + '/\n')
@@ -604,16 +968,35 @@ def setup_parser():
         type=str,
         help='Given a fileid, recursively traverse all subfolders.'
         )
+    parser.add_argument(
+        '--limit',
+        type=int,
+        metavar='N',
+        help='(Modifier) Stop a find after N results.'
+        )
     parser.add_argument(
         '--ls',
         type=str,
         help='Given a fileid, list the files contained in it.'
         )
+    parser.add_argument(
+        '--maxdepth',
+        type=int,
+        metavar='N',
+        help='(Modifier) Do not list folders more than N levels below the find.'
+        )
     parser.add_argument(
         '--output', '-o',
         type=str,
         help='Send the output to a specific file.'
         )
+    parser.add_argument(
+        '--prune',
+        type=str,
+        action='append',
+        metavar='GLOB',
+        help='(Modifier) Skip nodes, and whole folders, whose names match GLOB during a find (may be repeated).'
+        )
     parser.add_argument(
         '--showall',
         action='store_const', const=True,
@@ -639,10 +1022,9 @@ def setup_parser():
 
 def handle_stat(drive_file, arg, show_all):
     """Handle the --stat operation."""
-    if drive_file.debug:
-        print("# handle_stat(")
-        print("#    arg: '" +  str(arg) + "',")
-        print("#    show_all: " +  str(show_all))
+    LOG.debug("handle_stat(")
+    LOG.debug("   arg: '%s',", arg)
+    LOG.debug("   show_all: %s", show_all)
     if arg is not None:
         drive_file.show_node(arg)
     return True
@@ -650,31 +1032,26 @@ def handle_stat(drive_file, arg, show_all):
 
 def handle_find(drive_file, arg, show_all):
     """Handle the --find operation."""
-    if drive_file.debug:
-        print("# handle_find(")
-        print("#    arg: '" +  str(arg) + "',")
-        print("#    show_all: " +  str(show_all))
+    LOG.debug("handle_find(")
+    LOG.debug("   arg: '%s',", arg)
+    LOG.debug("   show_all: %s", show_all)
     if arg is not None:
-        drive_file.show_all_children(arg, show_all)
+        drive_file.show_all_children(arg, show_all, **drive_file.find_limits)
     return True
 
 
 def handle_showall(drive_file, show_all):
     """Handle the --listall operation."""
-    if drive_file.debug:
-        print("# handle_showall(" + \
-            "show_all: " + str(show_all) + \
-            ")")
+    LOG.debug("handle_showall(show_all: %s)", show_all)
     drive_file.show_all()
     return True
 
 
 def handle_ls(drive_file, arg, show_all):
     """Handle the --ls operation."""
-    if drive_file.debug:
-        print("# handle_ls(")
-        print("#    arg: '" +  str(arg) + "',")
-        print("#    show_all: " + str(show_all))
+    LOG.debug("handle_ls(")
+    LOG.debug("   arg: '%s',", arg)
+    LOG.debug("   show_all: %s", show_all)
     if arg is not None:
         drive_file.show_children(arg)
     return True
@@ -682,19 +1059,17 @@ def handle_ls(drive_file, arg, show_all):
 
 def handle_newer(drive_file, arg, show_all):
     """Handle the --newer operation."""
-    if drive_file.debug:
-        print("# handle_newer(")
-        print("#    arg: '" +  str(arg) + "',")
-        print("#    show_all: " + str(show_all))
+    LOG.debug("handle_newer(")
+    LOG.debug("   arg: '%s',", arg)
+    LOG.debug("   show_all: %s", show_all)
     drive_file.show_newer(arg, show_all)
 
 
 def handle_status(drive_file, arg, show_all):
     """Handle the --status operation."""
-    if drive_file.debug:
-        print("# handle_status()")
-        print("#    arg: '" +  str(arg) + "',")
-        print("#    show_all: " + str(show_all))
+    LOG.debug("handle_status()")
+    LOG.debug("   arg: '%s',", arg)
+    LOG.debug("   show_all: %s", show_all)
     status = drive_file.df_status()
     for _ in status:
         drive_file.df_print(_)
@@ -721,6 +1096,8 @@ def do_work(teststats):
 
     print("# output going to: " + drive_file.output_path)
 
+    drive_file.set_find_limits(args.maxdepth, args.prune, args.limit)
+
     _ = handle_find(drive_file, args.find, args.all) \
             if args.find else ""
 
@@ -740,6 +1117,7 @@ def do_work(teststats):
 
     wrapup_report = teststats.report_wrapup()
     drive_file.df_print(wrapup_report)
+    drive_file.df_close_output()
 
 
 def main():
@@ -0,0 +1,78 @@
+""" Freshness policy for the DriveFileCached cache
+
+Started 2026-10-19
+
+Copyright (C) 2018-2026 Marc Donner
+
+Left to itself, DriveFileCached believes a cached node forever, and
+the only way to bound staleness is to throw the cache away (make
+rebuild).  FreshnessPolicy decides, from the time a node (or the
+listing of a folder) was fetched, whether the cache may answer:
+
+    fresh :: younger than the max-age for the operation; use it
+    stale :: older than max-age, but within the stale-while-revalidate
+            window; use it, and queue it to be refreshed later
+    expired :: older than that; go back to the Drive API now
+
+The max-age may be set for all operations or for each one ('get',
+'list_children', ...).  With no max-age everything is fresh, which is
+how the cache has always behaved.
+
+"""
+
+FRESH = 'fresh'
+STALE = 'stale'
+EXPIRED = 'expired'
+
+
+def parse_max_age(spec):
+    """Parse an OPERATION=SECONDS argument.
+       Returns: (operation, seconds)
+    """
+    operation, _, seconds = spec.partition('=')
+    if not operation or not seconds:
+        raise ValueError("expected OPERATION=SECONDS, not '" + spec + "'")
+    return operation, float(seconds)
+
+
+class FreshnessPolicy():
+    """Per-operation max-age with a stale-while-revalidate window."""
+
+    def __init__(self, max_age=None, stale_ok=0):
+        self.max_age = max_age
+        self.operation_max_age = {}
+        self.stale_ok = stale_ok
+
+    def set_max_age(self, operation, seconds):
+        """Set the max-age (seconds) of one operation."""
+        self.operation_max_age[operation] = seconds
+
+    def get_max_age(self, operation):
+        """Returns: seconds, or None if entries never go stale"""
+        return self.operation_max_age.get(operation, self.max_age)
+
+    def is_active(self):
+        """Returns: Boolean (False if nothing can ever go stale)"""
+        return self.max_age is not None or bool(self.operation_max_age)
+
+    def classify(self, operation, fetched, now):
+        """Decide what to do with an entry for operation that was
+           fetched at time fetched (seconds since the epoch).
+           Returns: FRESH, STALE or EXPIRED
+        """
+        max_age = self.get_max_age(operation)
+        if max_age is None:
+            return FRESH
+        age = now - fetched
+        if age <= max_age:
+            return FRESH
+        if age <= max_age + self.stale_ok:
+            return STALE
+        return EXPIRED
+
+    def __str__(self):
+        result = "max_age: " + str(self.max_age)
+        for operation in sorted(self.operation_max_age):
+            result += " " + operation + ": " \
+                + str(self.operation_max_age[operation])
+        return result + " stale_ok: " + str(self.stale_ok)
@@ -0,0 +1,61 @@
+""" Advisory locking of the cache file between processes
+
+Started 2026-10-19
+
+Copyright (C) 2018-2026 Marc Donner
+
+Several programs (a cron inventory, a driveshell session, a report)
+may use one cache at the same time.  CacheLock serializes them with
+flock() on a file beside the cache (PATH.lock, so that the cache
+itself can be replaced by rename):
+
+    shared :: held while the cache is read
+    exclusive :: held while the cache is read back, merged and
+            written (see DriveFileCached.dump_cache)
+
+A process that has to wait says so on stdout.  Where there is no
+fcntl module (Windows) the locks do nothing.
+
+"""
+
+import os
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def lock_path(path):
+    """Returns: the path of the lock file for the cache at path"""
+    return path + '.lock'
+
+
+class CacheLock():
+    """A shared or exclusive lock on a cache file, for use in a with
+       statement."""
+
+    def __init__(self, path, exclusive=False):
+        self.path = lock_path(path)
+        self.exclusive = exclusive
+        self.handle = None
+
+    def __enter__(self):
+        if fcntl is None:
+            return self
+        self.handle = open(self.path, "a", encoding="utf-8")
+        mode = fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH
+        try:
+            fcntl.flock(self.handle.fileno(), mode | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print("# Waiting for the lock on " + self.path \
+                + " (pid " + str(os.getpid()) + ") ...")
+            fcntl.flock(self.handle.fileno(), mode)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.handle is not None:
+            fcntl.flock(self.handle.fileno(), fcntl.LOCK_UN)
+            self.handle.close()
+            self.handle = None
+        return False
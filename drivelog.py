@@ -0,0 +1,114 @@
+""" Debug logging for the DriveInspector tools
+
+Started 2026-10-19
+
+Copyright (C) 2018-2026 Marc Donner
+
+Debug output used to be print()ed to stdout, in among the real
+output.  It now goes through the standard logging module, to stderr
+or to a file, with one logger per component:
+
+    drive.raw :: DriveFileRaw (the Drive API)
+    drive.cached :: DriveFileCached (the cache)
+    drive.report :: DriveReport (drivereport.py and newreport.py)
+    drive.shell :: driveshell.py
+
+The level of each can be set on its own (--log-level
+cached=DEBUG,raw=INFO) or all at once (--log-level DEBUG, or -D).
+Turning debugging on (the shell's debug verb) puts every component at
+DEBUG, and turning it off goes back to the levels --log-level gave.
+
+Messages are formatted lazily (LOG.debug("get(%s)", node_id)), so
+with debugging off nothing is built, and the logger's level is the
+only guard: the methods called once per node test
+LOG.isEnabledFor(logging.DEBUG) before logging, and the per-node loops
+copy that into a local first, so a hot path pays for one local test
+per node.  self.debug only turns debugging on and off.
+
+"""
+
+import logging
+import sys
+
+ROOT = 'drive'
+
+COMPONENTS = ['raw', 'cached', 'report', 'shell']
+
+FORMAT = '%(asctime)s %(name)s %(levelname)s %(message)s'
+
+# The levels setup_logging() was given, for set_debug_logging(False)
+# to go back to ('' is the drive logger itself)
+CONFIGURED_LEVELS = {}
+
+
+def get_logger(component):
+    """Returns: the logging.Logger for component"""
+    return logging.getLogger(ROOT + '.' + component)
+
+
+def parse_level(text):
+    """Parse a level name (DEBUG, INFO, ...) or number.
+       Returns: integer
+    """
+    if text.isdigit():
+        return int(text)
+    level = logging.getLevelName(text.upper())
+    if not isinstance(level, int):
+        raise ValueError("not a logging level: '" + text + "'")
+    return level
+
+
+def parse_log_levels(spec):
+    """Parse a --log-level argument: LEVEL for every component, or
+       COMPONENT=LEVEL,... for some of them.
+       Returns: dict (component => level, '' for all of them)
+    """
+    levels = {}
+    for item in spec.split(','):
+        component, _, level = item.strip().rpartition('=')
+        if component and component not in COMPONENTS:
+            raise ValueError("not a component: '" + component \
+                + "', expected one of " + ", ".join(COMPONENTS))
+        levels[component] = parse_level(level)
+    return levels
+
+
+def setup_logging(levels=None, log_file=None):
+    """Send the drive.* loggers to log_file (or stderr) at levels
+       (see parse_log_levels).
+       Returns: the drive logger
+    """
+    levels = levels if levels else {}
+    root = logging.getLogger(ROOT)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    handler = logging.FileHandler(log_file, encoding='utf-8') \
+        if log_file else logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter(FORMAT))
+    root.addHandler(handler)
+    root.propagate = False
+    CONFIGURED_LEVELS.clear()
+    CONFIGURED_LEVELS[''] = levels.get('', logging.WARNING)
+    for component in COMPONENTS:
+        CONFIGURED_LEVELS[component] = levels.get(component, logging.NOTSET)
+    set_debug_logging(False)
+    return root
+
+
+def set_debug_logging(debug):
+    """Turn debug logging on for every component, or off again, back
+       to the levels setup_logging() was given."""
+    root = logging.getLogger(ROOT)
+    if not root.handlers:
+        setup_logging()
+    root.setLevel(logging.DEBUG if debug else CONFIGURED_LEVELS[''])
+    for component in COMPONENTS:
+        get_logger(component).setLevel(
+            logging.DEBUG if debug else CONFIGURED_LEVELS[component])
+
+
+def debug_enabled():
+    """Returns: Boolean (True if any component logs at DEBUG)"""
+    return any(get_logger(component).isEnabledFor(logging.DEBUG) \
+        for component in COMPONENTS)
@@ -0,0 +1,217 @@
+""" Size-bounded stores for the DriveFileCached cache
+
+Started 2026-10-19
+
+Copyright (C) 2018-2026 Marc Donner
+
+file_data['metadata'] and file_data['path'] are plain dicts that grow
+with every node we see, so a --showall over a large shared-with-me set
+can take a long-running driveshell past the memory it is allowed.
+
+BoundedStore is a dict-like replacement that keeps at most max_items
+entries (or about max_bytes of them) resident, in least recently used
+order.  Entries pushed out are spilled to a shelve file in a private
+temporary directory and brought back on the next access, so nothing is
+lost.  Pinned keys (the ancestors of the cwd) are never spilled.
+
+"""
+
+import json
+import shelve
+import shutil
+import sys
+import tempfile
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+from drivenode import DriveNode
+
+SIZE_SUFFIXES = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+def parse_size(text):
+    """Parse a size such as 400000, 512K, 200M or 2G.
+       Returns: integer (bytes)
+    """
+    text = text.strip()
+    scale = SIZE_SUFFIXES.get(text[-1:].lower(), 1)
+    if scale != 1:
+        text = text[:-1]
+    return int(float(text) * scale)
+
+
+def estimate_size(value):
+    """Rough number of bytes held by a node or a path.
+       Returns: integer
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, DriveNode):
+        size += sys.getsizeof(value.name)
+        if value.extra is not None:
+            size += sys.getsizeof(value.extra) \
+                + sum(sys.getsizeof(item) for item in value.extra.values())
+    elif isinstance(value, dict):
+        size += sum(sys.getsizeof(item) for item in value.values())
+    return size
+
+
+def close_spill(spill, directory):
+    """Close a spill file and remove its directory."""
+    spill.close()
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+class BoundedStore(MutableMapping):
+    """A mapping with LRU eviction of its entries to disk."""
+
+    def __init__(self, max_items=None, max_bytes=None,
+                 pack=None, restore=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.pack = pack
+        self.restore = restore
+        self.resident = OrderedDict()
+        self.sizes = {}
+        self.resident_bytes = 0
+        self.pinned = set()
+        self.evictions = 0
+        self.reloads = 0
+        self.directory = tempfile.mkdtemp(prefix='drive-spill-')
+        self.spill = shelve.open(self.directory + '/spill', flag='n')
+        # The keys whose current value is in the spill file.  Entries
+        # are never deleted from the file (dbm.dumb rewrites its whole
+        # index on every delete), just left to be overwritten.
+        self.spilled = set()
+        self.finalizer = weakref.finalize(
+            self, close_spill, self.spill, self.directory)
+
+    def close(self):
+        """Throw away the spill file."""
+        self.finalizer()
+
+    def pin(self, keys):
+        """Keep keys (and only these) resident whatever the pressure."""
+        self.pinned = set(keys)
+        for key in self.pinned:
+            if key in self.spilled:
+                _ = self[key]
+
+    def __over(self):
+        """Returns: Boolean (True if more is resident than allowed)"""
+        return (self.max_items is not None \
+                and len(self.resident) > self.max_items) \
+            or (self.max_bytes is not None \
+                and self.resident_bytes > self.max_bytes)
+
+    def __evict(self):
+        """Spill least recently used entries until we are in bounds."""
+        skipped = 0
+        while self.__over() and skipped < len(self.resident):
+            key, value = self.resident.popitem(last=False)
+            if key in self.pinned:
+                self.resident[key] = value
+                skipped += 1
+                continue
+            self.resident_bytes -= self.sizes.pop(key, 0)
+            self.spill[key] = self.pack(value) if self.pack else value
+            self.spilled.add(key)
+            self.evictions += 1
+
+    def __load(self, key):
+        """Read key from the spill file without making it resident."""
+        value = self.spill[key]
+        return self.restore(value) if self.restore else value
+
+    def peek(self, key, default=None):
+        """Look up key without changing the LRU order or the resident
+           set.
+           Returns: value or default
+        """
+        if key in self.resident:
+            return self.resident[key]
+        if key in self.spilled:
+            return self.__load(key)
+        return default
+
+    def __getitem__(self, key):
+        if key in self.resident:
+            self.resident.move_to_end(key)
+            return self.resident[key]
+        if key not in self.spilled:
+            raise KeyError(key)
+        value = self.__load(key)
+        self.reloads += 1
+        self[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self.spilled.discard(key)
+        if key in self.resident:
+            self.resident_bytes -= self.sizes.pop(key, 0)
+        self.resident[key] = value
+        self.resident.move_to_end(key)
+        if self.max_bytes is not None:
+            self.sizes[key] = estimate_size(value)
+            self.resident_bytes += self.sizes[key]
+        self.__evict()
+
+    def __delitem__(self, key):
+        if key in self.resident:
+            del self.resident[key]
+            self.resident_bytes -= self.sizes.pop(key, 0)
+        elif key in self.spilled:
+            self.spilled.discard(key)
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.resident or key in self.spilled
+
+    def __iter__(self):
+        # Snapshot, since reading an entry can reorder the store
+        yield from list(self.resident)
+        yield from list(self.spilled)
+
+    def __len__(self):
+        return len(self.resident) + len(self.spilled)
+
+    def items(self):
+        """Yield (key, value) without disturbing the resident set."""
+        for key in self:
+            yield key, self.peek(key)
+
+    def values(self):
+        """Yield each value without disturbing the resident set."""
+        for key in self:
+            yield self.peek(key)
+
+    def report(self):
+        """Returns: string (a one-line summary for df_status())"""
+        return "resident: " + str(len(self.resident)) \
+            + " (" + str(self.resident_bytes) + " bytes)" \
+            + " spilled: " + str(len(self.spilled)) \
+            + " evictions: " + str(self.evictions) \
+            + " reloads: " + str(self.reloads)
+
+
+def dump_json(data, out_file, default=None):
+    """Write data (a dict) to out_file as JSON in the layout of
+       json.dump(indent=3), writing any BoundedStore in it one entry
+       at a time rather than building it in memory."""
+    out_file.write("{")
+    separator = "\n"
+    for key, value in data.items():
+        out_file.write(separator + "   " + json.dumps(key) + ": ")
+        separator = ",\n"
+        if isinstance(value, BoundedStore):
+            out_file.write("{")
+            inner = "\n"
+            for item_key, item in value.items():
+                out_file.write(inner + "      " + json.dumps(item_key) + ": " \
+                    + json.dumps(item, default=default))
+                inner = ",\n"
+            out_file.write("\n   }" if inner != "\n" else "}")
+        else:
+            out_file.write(json.dumps(value, default=default))
+    out_file.write("\n}")
@@ -0,0 +1,467 @@
+""" Memory-mapped, read-only form of the DriveFileCached cache
+
+Started 2026-10-19
+
+Copyright (C) 2018-2026 Marc Donner
+
+The JSON cache has to be parsed in full before a single lookup can be
+answered, so start-up time and RSS grow with the size of the Drive.
+The mapped cache is written next to the JSON cache (by dump_cache())
+and can be opened with mmap, so that a process decodes only the
+records it actually touches.
+
+Layout (all integers little-endian):
+
+    header :: HEADER
+    records :: one per node: RECORD, then the UTF-8 bytes of id, name,
+            path, mimeType, parents (comma-separated) and a JSON
+            object holding every other field (owners and so on)
+    id index :: INDEX entries (hash of node_id, record offset),
+            sorted by hash
+    path index :: INDEX entries (hash of path, record offset), sorted
+    parent index :: INDEX entries (hash of parent id, record offset
+            of the child), sorted
+    meta :: a small JSON object: the small members of file_data
+            (cwd and so on), the path entries that are not nodes,
+            aliases such as 'root', and the size and mtime of the
+            JSON cache it was built from
+
+Lookups binary search an index and confirm the match against the
+record, so hash collisions only cost an extra comparison.
+
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from drivenode import FIELDS
+from drivenode import millis_to_time
+from drivenode import plain
+from drivenode import time_to_millis
+
+MAGIC = b'DIMMAP01'
+VERSION = 2
+
+# magic, version, count, records offset, id index offset,
+# path index offset, parent index offset, parent index count,
+# meta offset, meta length
+HEADER = struct.Struct('<8sIIQQQQQQQ')
+
+# size, modifiedTime, createdTime, time fetched from the API, flags,
+# then the byte lengths of id, name, path, mimeType, parents and the
+# JSON remainder
+RECORD = struct.Struct('<qqqqHHHHHII')
+
+# Index of the first byte length in RECORD
+LENGTHS = 5
+
+INDEX = struct.Struct('<QQ')
+
+MISSING = -2**63
+
+FLAG_SIZE = 0x01
+FLAG_TRASHED = 0x02
+FLAG_TRASHED_SET = 0x04
+FLAG_OWNED = 0x08
+FLAG_OWNED_SET = 0x10
+FLAG_SHARED = 0x20
+FLAG_SHARED_SET = 0x40
+FLAG_PARENTS = 0x80
+
+# Members of file_data that are held in the records, or not kept
+UNMAPPED_KEYS = frozenset([
+    'metadata', 'path', 'fetched', 'time', 'ref_count', 'dirty'])
+
+HOT_FIELDS = frozenset([
+    'id', 'name', 'parents', 'mimeType', 'size', 'trashed',
+    'modifiedTime', 'createdTime', 'ownedByMe', 'shared',
+    ])
+
+
+def key_hash(key):
+    """A hash of key that is stable from one process to the next.
+       Returns: integer
+    """
+    return int.from_bytes(
+        hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(),
+        'little')
+
+
+def encode_record(node_id, node, path, fetched=None):
+    """Pack one node into a record.  fetched is the time (seconds
+       since the epoch) the node was fetched from the API, if known.
+       Returns: bytes
+    """
+    flags = 0
+    rest = {}
+    size = MISSING
+    if 'size' in node:
+        try:
+            size = int(node['size'])
+            flags |= FLAG_SIZE
+        except (TypeError, ValueError):
+            rest['size'] = node['size']
+    for field, flag, flag_set in [
+            ('trashed', FLAG_TRASHED, FLAG_TRASHED_SET),
+            ('ownedByMe', FLAG_OWNED, FLAG_OWNED_SET),
+            ('shared', FLAG_SHARED, FLAG_SHARED_SET)]:
+        if field in node:
+            if isinstance(node[field], bool):
+                flags |= flag_set | (flag if node[field] else 0)
+            else:
+                rest[field] = node[field]
+    times = []
+    for field in ['modifiedTime', 'createdTime']:
+        millis = time_to_millis(node[field]) if field in node else MISSING
+        if not isinstance(millis, int):
+            rest[field] = node[field]
+            millis = MISSING
+        times.append(millis)
+    parents = ""
+    if 'parents' in node:
+        if all(',' not in parent for parent in node['parents']):
+            flags |= FLAG_PARENTS
+            parents = ','.join(node['parents'])
+        else:
+            rest['parents'] = list(node['parents'])
+    for key in node:
+        if key not in HOT_FIELDS:
+            rest[key] = node[key]
+    parts = [
+        node_id.encode('utf-8'),
+        node.get('name', "").encode('utf-8'),
+        path.encode('utf-8'),
+        node.get('mimeType', "").encode('utf-8'),
+        parents.encode('utf-8'),
+        json.dumps(rest, separators=(',', ':'), default=plain).encode('utf-8')
+            if rest else b"",
+        ]
+    return RECORD.pack(
+        size, times[0], times[1],
+        MISSING if fetched is None else int(fetched), flags,
+        *[len(part) for part in parts]) + b"".join(parts)
+
+
+def write_mapped_cache(file_data, path, source_path):
+    """Write file_data in mapped form to path.  source_path is the
+       JSON cache the data came from; its size and mtime are recorded
+       so that a stale mapped cache can be detected.
+       Returns: integer (number of nodes written)
+    """
+    metadata = file_data['metadata']
+    paths = file_data['path']
+    fetched = file_data.get('fetched', {})
+    aliases = {}
+    seen = {}
+    tmp_path = path + '.tmp'
+    with open(tmp_path, "wb") as mapped_file:
+        mapped_file.write(b"\0" * HEADER.size)
+        offset = HEADER.size
+        id_index = []
+        path_index = []
+        parent_index = []
+        for node_id in metadata:
+            node = metadata[node_id]
+            if not node:
+                continue
+            real_id = node.get('id', node_id)
+            if real_id != node_id and real_id in metadata:
+                # e.g. 'root', which is stored under its real id too
+                aliases[node_id] = real_id
+                continue
+            node_path = paths.get(node_id, "")
+            record = encode_record(node_id, node, node_path,
+                                   fetched.get(node_id))
+            mapped_file.write(record)
+            id_index.append((key_hash(node_id), offset))
+            if node_path:
+                path_index.append((key_hash(node_path), offset))
+            for parent_id in node.get('parents', []):
+                parent_index.append((key_hash(parent_id), offset))
+            seen[node_id] = True
+            offset += len(record)
+        extra_paths = {key: value for key, value in paths.items() \
+            if key not in seen}
+        indexes = []
+        for index in [id_index, path_index, parent_index]:
+            index.sort()
+            indexes.append(offset)
+            mapped_file.write(b"".join(INDEX.pack(*entry) for entry in index))
+            offset += INDEX.size * len(index)
+        source = os.stat(source_path) if os.path.exists(source_path) \
+            else None
+        meta = json.dumps({
+            'file_data': {key: value for key, value in file_data.items() \
+                if key not in UNMAPPED_KEYS},
+            'paths': extra_paths,
+            'aliases': aliases,
+            'empty': [key for key in metadata if not metadata[key]],
+            'source_size': source.st_size if source else None,
+            'source_mtime': source.st_mtime if source else None,
+            'path_count': len(path_index),
+            }).encode('utf-8')
+        mapped_file.write(meta)
+        mapped_file.seek(0)
+        mapped_file.write(HEADER.pack(
+            MAGIC, VERSION, len(id_index), HEADER.size,
+            indexes[0], indexes[1], indexes[2], len(parent_index),
+            offset, len(meta)))
+    os.replace(tmp_path, path)
+    return len(id_index)
+
+
+class MappedCache():
+    """Read-only access to a mapped cache file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as mapped_file:
+            self.map = mmap.mmap(mapped_file.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+        (magic, version, self.count, _, self.id_index, self.path_index,
+         self.parent_index, self.parent_count, meta_offset, meta_len) = \
+            HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.map.close()
+            raise ValueError(path + " is not a mapped DriveInspector cache")
+        self.meta = json.loads(
+            self.map[meta_offset:meta_offset + meta_len].decode('utf-8'))
+        self.path_count = self.meta['path_count']
+
+    def is_current(self, source_path):
+        """Was this built from the JSON cache as it is now?
+           Returns: Boolean
+        """
+        try:
+            source = os.stat(source_path)
+        except OSError:
+            return False
+        return source.st_size == self.meta['source_size'] \
+            and source.st_mtime == self.meta['source_mtime']
+
+    def close(self):
+        """Unmap the file."""
+        self.map.close()
+
+    def __search(self, index, count, key):
+        """Yield the record offsets of every entry of index whose hash
+           matches key.
+        """
+        target = key_hash(key)
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if INDEX.unpack_from(self.map, index + middle * INDEX.size)[0] \
+                    < target:
+                low = middle + 1
+            else:
+                high = middle
+        while low < count:
+            entry_hash, offset = \
+                INDEX.unpack_from(self.map, index + low * INDEX.size)
+            if entry_hash != target:
+                break
+            yield offset
+            low += 1
+
+    def __strings(self, offset):
+        """Slice the variable part of the record at offset.
+           Returns: (RECORD fields, list of bytes)
+        """
+        fields = RECORD.unpack_from(self.map, offset)
+        position = offset + RECORD.size
+        parts = []
+        for length in fields[LENGTHS:]:
+            parts.append(self.map[position:position + length])
+            position += length
+        return fields, parts
+
+    def find(self, node_id):
+        """Return the record offset of node_id, or None."""
+        node_id = self.meta['aliases'].get(node_id, node_id)
+        wanted = node_id.encode('utf-8')
+        for offset in self.__search(self.id_index, self.count, node_id):
+            length = RECORD.unpack_from(self.map, offset)[LENGTHS]
+            start = offset + RECORD.size
+            if self.map[start:start + length] == wanted:
+                return offset
+        return None
+
+    def node_id_at(self, offset):
+        """Return the node_id of the record at offset."""
+        length = RECORD.unpack_from(self.map, offset)[LENGTHS]
+        start = offset + RECORD.size
+        return self.map[start:start + length].decode('utf-8')
+
+    def node_at(self, offset):
+        """Decode the record at offset into a node.
+           Returns: dict
+        """
+        fields, parts = self.__strings(offset)
+        size, modified, created, _, flags = fields[:LENGTHS]
+        hot = {
+            'id': parts[0].decode('utf-8'),
+            'name': parts[1].decode('utf-8'),
+            'mimeType': parts[3].decode('utf-8'),
+            }
+        if flags & FLAG_PARENTS:
+            hot['parents'] = parts[4].decode('utf-8').split(',') \
+                if parts[4] else []
+        if flags & FLAG_SIZE:
+            hot['size'] = str(size)
+        if flags & FLAG_TRASHED_SET:
+            hot['trashed'] = bool(flags & FLAG_TRASHED)
+        if flags & FLAG_OWNED_SET:
+            hot['ownedByMe'] = bool(flags & FLAG_OWNED)
+        if flags & FLAG_SHARED_SET:
+            hot['shared'] = bool(flags & FLAG_SHARED)
+        if modified != MISSING:
+            hot['modifiedTime'] = millis_to_time(modified)
+        if created != MISSING:
+            hot['createdTime'] = millis_to_time(created)
+        if parts[5]:
+            hot.update(json.loads(parts[5].decode('utf-8')))
+        node = {key: hot[key] for key in FIELDS if key in hot}
+        node.update({key: hot[key] for key in hot if key not in node})
+        return node
+
+    def fetched_at(self, offset):
+        """Return the time the record at offset was fetched, or None."""
+        fetched = RECORD.unpack_from(self.map, offset)[3]
+        return None if fetched == MISSING else fetched
+
+    def path_at(self, offset):
+        """Return the path stored in the record at offset."""
+        _, parts = self.__strings(offset)
+        return parts[2].decode('utf-8')
+
+    def resolve(self, path):
+        """Find the node_id whose cached path is path.
+           Returns: node_id or None
+        """
+        wanted = path.encode('utf-8')
+        for offset in self.__search(self.path_index, self.path_count, path):
+            _, parts = self.__strings(offset)
+            if parts[2] == wanted:
+                return parts[0].decode('utf-8')
+        return None
+
+    def children(self, node_id):
+        """Return the node_ids of the cached children of node_id.
+           Returns: list of node_id
+        """
+        node_id = self.meta['aliases'].get(node_id, node_id)
+        result = []
+        for offset in self.__search(self.parent_index, self.parent_count,
+                                    node_id):
+            node = self.node_at(offset)
+            if node_id in node.get('parents', []):
+                result.append(node['id'])
+        return result
+
+    def node_ids(self):
+        """Yield every node_id in the mapped cache."""
+        for i in range(self.count):
+            _, offset = INDEX.unpack_from(self.map,
+                                          self.id_index + i * INDEX.size)
+            yield self.node_id_at(offset)
+
+
+class MappedMetadata(Mapping):
+    """file_data['metadata'] backed by a MappedCache."""
+
+    RECENT = 256
+
+    def __init__(self, mapped):
+        self.mapped = mapped
+        self.recent = OrderedDict()
+
+    def __getitem__(self, node_id):
+        if node_id in self.recent:
+            self.recent.move_to_end(node_id)
+            return self.recent[node_id]
+        if node_id in self.mapped.meta['empty']:
+            return {}
+        offset = self.mapped.find(node_id)
+        if offset is None:
+            raise KeyError(node_id)
+        node = self.mapped.node_at(offset)
+        self.recent[node_id] = node
+        if len(self.recent) > self.RECENT:
+            self.recent.popitem(last=False)
+        return node
+
+    def __contains__(self, node_id):
+        return node_id in self.recent \
+            or node_id in self.mapped.meta['empty'] \
+            or self.mapped.find(node_id) is not None
+
+    def __iter__(self):
+        yield from self.mapped.meta['empty']
+        yield from self.mapped.node_ids()
+        yield from self.mapped.meta['aliases']
+
+    def __len__(self):
+        return self.mapped.count + len(self.mapped.meta['empty']) \
+            + len(self.mapped.meta['aliases'])
+
+
+class MappedPaths(Mapping):
+    """file_data['path'] backed by a MappedCache."""
+
+    def __init__(self, mapped):
+        self.mapped = mapped
+
+    def __getitem__(self, node_id):
+        if node_id in self.mapped.meta['paths']:
+            return self.mapped.meta['paths'][node_id]
+        offset = self.mapped.find(node_id)
+        if offset is None:
+            raise KeyError(node_id)
+        path = self.mapped.path_at(offset)
+        if not path:
+            raise KeyError(node_id)
+        return path
+
+    def __contains__(self, node_id):
+        try:
+            self[node_id]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        yield from self.mapped.meta['paths']
+        for node_id in self.mapped.node_ids():
+            if node_id in self:
+                yield node_id
+
+    def __len__(self):
+        return len(self.mapped.meta['paths']) + self.mapped.path_count
+
+
+class MappedFetched(Mapping):
+    """file_data['fetched'] backed by a MappedCache."""
+
+    def __init__(self, mapped):
+        self.mapped = mapped
+
+    def __getitem__(self, node_id):
+        offset = self.mapped.find(node_id)
+        fetched = None if offset is None else self.mapped.fetched_at(offset)
+        if fetched is None:
+            raise KeyError(node_id)
+        return fetched
+
+    def __iter__(self):
+        for node_id in self.mapped.node_ids():
+            if node_id in self:
+                yield node_id
+
+    def __len__(self):
+        return sum(1 for _ in self)
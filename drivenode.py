@@ -0,0 +1,306 @@
+""" Compact in-memory representation of Drive nodes
+
+Started 2026-10-19
+
+Copyright (C) 2018-2026 Marc Donner
+
+The Drive API hands us each node as a dict.  Kept that way, a cache of
+a few hundred thousand nodes carries hundreds of thousands of copies
+of the same mimeType strings, the same parent ids and, worst of all,
+the same owners list of dicts.
+
+DriveNode holds the STANDARD_FIELDS (and md5Checksum) in __slots__:
+
+    mimeType and parent ids are interned (sys.intern)
+    owners lists are shared through an OwnerTable, so every file with
+        the same owners points at one list
+    modifiedTime and createdTime are held as integer milliseconds
+        since the epoch and turned back into RFC 3339 strings when
+        they are read
+    anything else the API returned lives in a small 'extra' dict
+
+A DriveNode behaves like a read-mostly dict (node['name'],
+'parents' in node, node.get('size')), so the DriveFile classes do not
+need to know which form they are holding.  Reading parents gives a
+list and reading owners gives a copy of the shared list, just as the
+API's dict would.  to_dict() returns the
+plain form for JSON output (--stat and the cache file).
+
+"""
+
+import calendar
+import datetime
+import sys
+import time
+from collections.abc import Mapping
+
+# The keys we keep in slots, in the order we report them.
+FIELDS = (
+    'id',
+    'name',
+    'parents',
+    'mimeType',
+    'size',
+    'owners',
+    'trashed',
+    'modifiedTime',
+    'createdTime',
+    'ownedByMe',
+    'shared',
+    'md5Checksum',
+    )
+
+FIELD_SET = frozenset(FIELDS)
+
+TIME_FIELDS = ('modifiedTime', 'createdTime')
+
+# Marks an absent field, since None is a legal JSON value.
+ABSENT = object()
+
+
+# Seconds since the epoch at the start of each YYYY-MM-DD seen so far
+DAY_SECONDS = {}
+
+
+def time_to_millis(stamp):
+    """Convert an RFC 3339 timestamp of the form the Drive API returns
+       (2018-06-09T12:34:56.789Z) to integer milliseconds since the
+       epoch.  Anything else is returned unchanged.
+       Returns: integer or the original value
+    """
+    if not isinstance(stamp, str) or len(stamp) != 24 \
+            or stamp[19] != '.' or stamp[23] != 'Z':
+        return stamp
+    try:
+        day = stamp[0:10]
+        seconds = DAY_SECONDS.get(day)
+        if seconds is None:
+            seconds = calendar.timegm((
+                int(stamp[0:4]), int(stamp[5:7]), int(stamp[8:10]),
+                0, 0, 0, 0, 0, 0))
+            DAY_SECONDS[day] = seconds
+        seconds += int(stamp[11:13]) * 3600 + int(stamp[14:16]) * 60 \
+            + int(stamp[17:19])
+        return seconds * 1000 + int(stamp[20:23])
+    except ValueError:
+        return stamp
+
+
+def millis_to_time(millis):
+    """Inverse of time_to_millis().
+       Returns: string
+    """
+    if not isinstance(millis, int):
+        return millis
+    seconds, fraction = divmod(millis, 1000)
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds)) \
+        + ".%03dZ" % fraction
+
+
+def date_to_millis(text):
+    """Convert a date as typed on the command line (2018-06-09,
+       2018-06-09T12:34:56, or a full RFC 3339 timestamp) to integer
+       milliseconds since the epoch.  Dates without a zone are UTC.
+       Returns: integer, or None if text is not a date
+    """
+    millis = time_to_millis(text)
+    if isinstance(millis, int):
+        return millis
+    try:
+        moment = datetime.datetime.fromisoformat(text.replace('Z', '+00:00'))
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def node_millis(node):
+    """The modifiedTime of node (DriveNode or dict) in milliseconds.
+       Returns: integer, or None if it has none
+    """
+    if isinstance(node, DriveNode):
+        millis = node.modified
+    else:
+        millis = time_to_millis(node.get('modifiedTime')) if node else None
+    return millis if isinstance(millis, int) else None
+
+
+class OwnerTable():
+    """Share one owners list among all of the nodes that have it."""
+
+    def __init__(self):
+        self.table = {}
+
+    def intern(self, owners):
+        """Return the shared copy of owners.
+           Returns: list of dict
+        """
+        # The API lists an owner's fields in a fixed order, so there
+        # is no need to sort them to build the key.
+        try:
+            key = tuple(tuple(owner.items()) for owner in owners)
+            shared = self.table.get(key)
+        except (AttributeError, TypeError):
+            return owners
+        if shared is None:
+            shared = [{sys.intern(k) if isinstance(k, str) else k: \
+                sys.intern(v) if isinstance(v, str) else v \
+                for k, v in owner.items()} for owner in owners]
+            self.table[key] = shared
+        return shared
+
+    def __len__(self):
+        return len(self.table)
+
+
+class DriveNode(Mapping):
+    """A Drive node held in slots rather than in a dict."""
+
+    __slots__ = (
+        'node_id',
+        'name',
+        'parents',
+        'mime_type',
+        'size',
+        'owners',
+        'trashed',
+        'modified',
+        'created',
+        'owned_by_me',
+        'shared',
+        'md5',
+        'extra',
+        )
+
+    SLOT = {
+        'id': 'node_id',
+        'name': 'name',
+        'parents': 'parents',
+        'mimeType': 'mime_type',
+        'size': 'size',
+        'owners': 'owners',
+        'trashed': 'trashed',
+        'modifiedTime': 'modified',
+        'createdTime': 'created',
+        'ownedByMe': 'owned_by_me',
+        'shared': 'shared',
+        'md5Checksum': 'md5',
+        }
+
+    def __init__(self, node, owner_table):
+        # Unrolled rather than looping over set_field(), since this
+        # runs once per node whenever the cache is loaded.
+        get = node.get
+        self.node_id = get('id', ABSENT)
+        self.name = get('name', ABSENT)
+        parents = get('parents', ABSENT)
+        self.parents = tuple(map(sys.intern, parents)) \
+            if isinstance(parents, list) else parents
+        mime_type = get('mimeType', ABSENT)
+        self.mime_type = sys.intern(mime_type) \
+            if isinstance(mime_type, str) else mime_type
+        self.size = get('size', ABSENT)
+        owners = get('owners', ABSENT)
+        self.owners = owner_table.intern(owners) \
+            if owners is not ABSENT and owner_table is not None else owners
+        self.trashed = get('trashed', ABSENT)
+        self.modified = time_to_millis(get('modifiedTime', ABSENT))
+        self.created = time_to_millis(get('createdTime', ABSENT))
+        self.owned_by_me = get('ownedByMe', ABSENT)
+        self.shared = get('shared', ABSENT)
+        self.md5 = get('md5Checksum', ABSENT)
+        self.extra = None
+        if not FIELD_SET.issuperset(node):
+            self.extra = {key: value for key, value in node.items() \
+                if key not in self.SLOT}
+
+    def set_field(self, key, value, owner_table=None):
+        """Store one field, compacting it if it is one of ours."""
+        if key not in self.SLOT:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+            return
+        if key in TIME_FIELDS:
+            value = time_to_millis(value)
+        elif key == 'mimeType' and isinstance(value, str):
+            value = sys.intern(value)
+        elif key == 'parents' and isinstance(value, list):
+            value = tuple(sys.intern(parent) for parent in value)
+        elif key == 'owners' and owner_table is not None:
+            value = owner_table.intern(value)
+        setattr(self, self.SLOT[key], value)
+
+    def __getitem__(self, key):
+        slot = self.SLOT.get(key)
+        if slot is None:
+            if self.extra is not None and key in self.extra:
+                return self.extra[key]
+            raise KeyError(key)
+        value = getattr(self, slot)
+        if value is ABSENT:
+            raise KeyError(key)
+        if key in TIME_FIELDS:
+            return millis_to_time(value)
+        if key == 'parents' and isinstance(value, tuple):
+            # A list, as in the node the API returned
+            return list(value)
+        if key == 'owners' and isinstance(value, list):
+            # A copy, since the list is shared through the OwnerTable
+            return [dict(owner) for owner in value]
+        return value
+
+    def __setitem__(self, key, value):
+        self.set_field(key, value)
+
+    def __contains__(self, key):
+        slot = self.SLOT.get(key)
+        if slot is None:
+            return self.extra is not None and key in self.extra
+        return getattr(self, slot) is not ABSENT
+
+    def __iter__(self):
+        for key in FIELDS:
+            if getattr(self, self.SLOT[key]) is not ABSENT:
+                yield key
+        if self.extra is not None:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def to_dict(self):
+        """Return the plain dict form of the node.
+           Returns: dict
+        """
+        return {key: self[key] for key in self}
+
+    def __repr__(self):
+        return "DriveNode(" + repr(self.to_dict()) + ")"
+
+
+def compact_node(node, owner_table):
+    """Return the compact form of a node (dict or DriveNode).
+       Empty placeholders (the '<none>' entry) are left alone.
+       Returns: DriveNode or dict
+    """
+    if isinstance(node, DriveNode) or not node:
+        return node
+    return DriveNode(node, owner_table)
+
+
+def plain(value):
+    """json.dump() default hook: turn DriveNodes, and the other
+       mappings we keep in file_data, back into dicts.
+       Returns: dict
+    """
+    if isinstance(value, DriveNode):
+        return value.to_dict()
+    if hasattr(value, 'to_json'):
+        # e.g. a PathTrie, which has a form of its own
+        return value.to_json()
+    if isinstance(value, Mapping):
+        return dict(value)
+    raise TypeError("Object of type " + type(value).__name__ \
+        + " is not JSON serializable")
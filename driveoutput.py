@@ -0,0 +1,158 @@
+""" Buffered, compressed and atomic output files for df_print()
+
+Started 2026-10-19
+
+Copyright (C) 2018-2026 Marc Donner
+
+show_all, show_all_children and the report renderers call df_print()
+once per line, hundreds of thousands of times.  OutputFile collects
+the lines and writes them out in large blocks (OUTPUT_BUFFER bytes by
+default; 0 writes every line straight through), which matters when
+--output is on a network filesystem.
+
+The file name picks the format:
+
+    *.gz :: gzip
+    *.zst :: zstandard (needs the zstandard package)
+    anything else :: plain UTF-8 text
+
+The output is written to a temporary file beside the target and
+renamed over it when the file is closed, so a reader never sees half
+a report and a failed run leaves the previous one in place.  Files
+left open are closed (and renamed) when the program exits.
+
+The SHA-256 of the text written is kept as it goes, so that the cache
+(see DriveFileCached.dump_cache) can be given a checksum file, PATH.sha256
+in the format of sha256sum, without being read back.
+
+"""
+
+import atexit
+import gzip
+import hashlib
+import os
+import tempfile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+OUTPUT_BUFFER = 1024 * 1024
+
+
+def compression_for(path):
+    """Returns: 'gzip', 'zstd' or None, from the extension of path"""
+    if path.endswith('.gz'):
+        return 'gzip'
+    if path.endswith('.zst'):
+        return 'zstd'
+    return None
+
+
+class OutputFile():
+    """A write-only text file with a large buffer that only appears
+       under its name once it has been closed."""
+
+    def __init__(self, path, buffer_size=OUTPUT_BUFFER):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.pending = []
+        self.pending_size = 0
+        self.closed = False
+        # SHA-256 of the (uncompressed) text written so far
+        self.digest = hashlib.sha256()
+        compression = compression_for(path)
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("writing " + path \
+                + " needs the zstandard package")
+        if os.path.exists(path) and not os.path.isfile(path):
+            # A device or a pipe (e.g. /dev/null): write to it directly
+            self.temp_path = None
+            self.raw = open(path, "wb")
+        else:
+            handle, self.temp_path = tempfile.mkstemp(
+                prefix='.' + os.path.basename(path) + '.',
+                suffix='.tmp',
+                dir=os.path.dirname(os.path.abspath(path)))
+            self.raw = os.fdopen(handle, "wb")
+            # mkstemp makes the file private; give it the usual mode
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(self.temp_path, 0o666 & ~umask)
+        if compression == 'gzip':
+            self.stream = gzip.GzipFile(
+                filename=os.path.basename(path)[:-len('.gz')],
+                mode='wb', fileobj=self.raw)
+        elif compression == 'zstd':
+            self.stream = zstandard.ZstdCompressor().stream_writer(
+                self.raw, closefd=False)
+        else:
+            self.stream = self.raw
+        atexit.register(self.close)
+
+    def write(self, text):
+        """Add text to the buffer, writing the buffer out when full."""
+        self.pending.append(text)
+        self.pending_size += len(text)
+        if self.pending_size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Write out whatever is buffered."""
+        if self.pending:
+            data = ''.join(self.pending).encode('utf-8')
+            self.digest.update(data)
+            self.stream.write(data)
+            self.pending = []
+            self.pending_size = 0
+
+    def close(self, keep=True):
+        """Finish the file and, if keep, rename it into place;
+           otherwise throw it away."""
+        if self.closed:
+            return
+        self.closed = True
+        atexit.unregister(self.close)
+        try:
+            if keep:
+                self.flush()
+            if self.stream is not self.raw:
+                self.stream.close()
+            self.raw.flush()
+            if self.temp_path is not None and keep:
+                os.fsync(self.raw.fileno())
+        finally:
+            self.raw.close()
+        if self.temp_path is None:
+            return
+        if keep:
+            os.replace(self.temp_path, self.path)
+        else:
+            os.unlink(self.temp_path)
+
+
+def checksum_path(path):
+    """Returns: the path of the checksum file for path"""
+    return path + '.sha256'
+
+
+def write_checksum(path, digest):
+    """Record digest (hex SHA-256) as the checksum of the file at path."""
+    checksum_file = OutputFile(checksum_path(path), buffer_size=0)
+    keep = False
+    try:
+        checksum_file.write(digest + "  " + os.path.basename(path) + "\n")
+        keep = True
+    finally:
+        checksum_file.close(keep=keep)
+
+
+def read_checksum(path):
+    """Returns: the hex SHA-256 recorded for the file at path, or None
+       if there is no checksum file"""
+    try:
+        with open(checksum_path(path), "r", encoding="utf-8") as checksum_file:
+            return checksum_file.read().split()[0]
+    except (OSError, IndexError):
+        return None
@@ -0,0 +1,123 @@
+""" Owner and sharing summaries of the DriveFileCached cache
+
+Started 2026-10-19
+
+Copyright (C) 2018-2026 Marc Donner
+
+OwnerSummary answers "how many bytes does each owner have?" and "how
+many of my files are shared, and where?" from the cache.  The cached
+nodes are read once, in whatever order they come, and each file is
+added to three hash tables:
+
+    owner :: the email address of its (first) owner
+    folder :: the top-level folder it is in (see top_folder())
+    mimeType :: its mimeType
+
+each keeping, for every key:
+
+    files :: the number of files
+    bytes :: the sum of their sizes
+    shared files :: the number of those that are shared
+    shared bytes :: the sum of their sizes
+
+so the memory needed grows with the number of owners, folders and
+mimeTypes, not with the number of nodes, and nothing is sorted until
+the tables are read out.
+
+Folders are not counted (their contents are), nor are trashed nodes.
+A file whose path is not known without asking the Drive (an ancestor
+of it is not cached) is counted in the folder UNKNOWN_FOLDER.
+
+"""
+
+from drivequery import node_size
+from drivequery import owner_emails
+from driverollup import is_folder
+
+# The tables, in the order they are shown
+SECTIONS = ('owner', 'folder', 'mimeType')
+
+# Files in a shared drive belong to the drive, not to a person
+NO_OWNER = '(no owner)'
+
+# The folder of the files whose paths are not known
+UNKNOWN_FOLDER = '(unknown)'
+
+FILES = 0
+BYTES = 1
+SHARED = 2
+SHARED_BYTES = 3
+
+COLUMNS = ['files', 'bytes', 'shared files', 'shared bytes']
+
+
+def top_folder(path):
+    """The folder directly beneath the root that path is in: '/' or
+       another user's '~EMAIL/.../', say, followed by one folder, or
+       the root itself for a file that sits in it.
+       Returns: string
+    """
+    cut = path.find('/') + 1
+    if path[cut:cut + 4] == '.../':
+        # Another user's files, hung from a synthetic root
+        cut += 4
+    end = path.find('/', cut) + 1
+    return path[:end] if end else path[:cut]
+
+
+class OwnerSummary():
+    """Counts and bytes of the cached files by owner, top-level folder
+       and mimeType."""
+
+    def __init__(self, mine_only=False):
+        # Count only the files that are ownedByMe
+        self.mine_only = mine_only
+        self.tables = {section: {} for section in SECTIONS}
+        self.total = [0, 0, 0, 0]
+
+    def add(self, node_id, node, get_path):
+        """Count node, if it is a file that belongs in the summary.
+           get_path :: function of node_id returning its path, or None
+               if it is not known, which is only called for the files
+               that are counted
+           Returns: Boolean (True if node was counted)
+        """
+        if not node or node.get('trashed') or is_folder(node):
+            return False
+        if self.mine_only and not node.get('ownedByMe'):
+            return False
+        size = node_size(node) or 0
+        shared = bool(node.get('shared'))
+        emails = owner_emails(node)
+        path = get_path(node_id)
+        keys = (
+            ('owner', emails[0].lower() if emails else NO_OWNER),
+            ('folder', UNKNOWN_FOLDER if path is None else top_folder(path)),
+            ('mimeType', node.get('mimeType', '')),
+            )
+        for section, key in keys:
+            table = self.tables[section]
+            counts = table.get(key)
+            if counts is None:
+                table[key] = counts = [0, 0, 0, 0]
+            counts[FILES] += 1
+            counts[BYTES] += size
+            if shared:
+                counts[SHARED] += 1
+                counts[SHARED_BYTES] += size
+        self.total[FILES] += 1
+        self.total[BYTES] += size
+        if shared:
+            self.total[SHARED] += 1
+            self.total[SHARED_BYTES] += size
+        return True
+
+    def rows(self, section, by_shared=False):
+        """Read out one table, most bytes (or, with by_shared, most
+           shared files) first.
+           Returns: list of (key, [files, bytes, shared files,
+               shared bytes])
+        """
+        order = SHARED if by_shared else BYTES
+        return sorted(self.tables[section].items(),
+                      key=lambda row: (-row[1][order], row[0]))
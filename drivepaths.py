@@ -0,0 +1,146 @@
+""" Every path to every cached node, for DriveFileCached
+
+Started 2026-10-19
+
+Copyright (C) 2018-2026 Marc Donner
+
+file_data['path'] holds one path per node, the one through
+node['parents'][0].  A file that has been added to several folders is
+reachable by a path through each of them, and a folder with several
+parents gives every node beneath it several paths.
+
+PathIndex records all of them, in both directions:
+
+    paths :: node_id => list of path (the parents[0] path first)
+    nodes :: path => node_id
+
+so resolve_path can find a node by any of its paths with one lookup,
+and reports can list the paths of a node's parents without walking up
+the tree for every row.  It is built in one pass over the cache, and
+new nodes are added as they arrive.  A move or rename beneath which
+there may be other nodes throws it away to be built again.
+
+"""
+
+FOLDERMIMETYPE = 'application/vnd.google-apps.folder'
+
+# The paths of shared drives begin with this, then the drive's name
+SHARED_DRIVES = '~drives/'
+
+# More paths than this to one node are not recorded
+MAX_PATHS = 64
+
+
+class PathIndex():
+    """All of the paths to each cached node."""
+
+    def __init__(self, metadata, primary):
+        self.metadata = metadata
+        # file_data['path'], for nodes whose parents are not cached
+        self.primary = primary
+        self.paths = {}
+        self.nodes = {}
+        # parent_id => node_ids that have it as an uncached parent
+        self.waiting = {}
+
+    def build(self):
+        """Find the paths of every node in the cache."""
+        for node_id, node in self.metadata.items():
+            if node and node['id'] == node_id:
+                self.__paths_of(node_id)
+
+    def get(self, node_id):
+        """Returns: list of path (empty if node_id is not indexed)"""
+        return self.paths.get(node_id, [])
+
+    def resolve(self, path):
+        """Returns: node_id whose path is path, or None"""
+        return self.nodes.get(path)
+
+    def __own_paths(self, node_id, node, parent_paths):
+        """Returns: list of path through each of parent_paths"""
+        suffix = node['name']
+        if node.get('mimeType') == FOLDERMIMETYPE \
+                and 'fileExtension' not in node:
+            suffix += '/'
+        result = []
+        for parent_path in parent_paths:
+            path = parent_path + suffix
+            if path not in result:
+                result.append(path)
+        return result[:MAX_PATHS] or \
+            ([self.primary[node_id]] if node_id in self.primary else [])
+
+    def __paths_of(self, node_id):
+        """Compute (and record) the paths of node_id, after those of
+           its parents.
+           Returns: list of path
+        """
+        # Iterative, so that a deep tree does not hit the recursion limit
+        stack = [node_id]
+        while stack:
+            current = stack[-1]
+            if current in self.paths:
+                stack.pop()
+                continue
+            node = self.metadata.get(current)
+            parents = list(node.get('parents', [])) if node else []
+            pending = [parent_id for parent_id in parents \
+                if parent_id not in self.paths \
+                and self.metadata.get(parent_id) \
+                and parent_id not in stack]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            self.__record(current, node, parents)
+        return self.paths.get(node_id, [])
+
+    def __record(self, node_id, node, parents):
+        """Store the paths of node_id, whose cached parents are done."""
+        if not node:
+            paths = [self.primary[node_id]] if node_id in self.primary \
+                else []
+        elif not parents:
+            # My Drive itself, or someone else's file shared with us
+            if node_id in self.primary:
+                paths = [self.primary[node_id]]
+            elif node.get('driveId') == node_id:
+                paths = [SHARED_DRIVES + node['name'] + '/']
+            elif node['name'] == "My Drive":
+                paths = ["/"]
+            elif node.get('owners'):
+                paths = self.__own_paths(node_id, node, [
+                    '~' + node['owners'][0]['emailAddress'] + '/.../'])
+            else:
+                paths = []
+        else:
+            parent_paths = []
+            for parent_id in parents:
+                if parent_id in self.paths:
+                    parent_paths += self.paths[parent_id]
+                else:
+                    self.waiting.setdefault(parent_id, []).append(node_id)
+                    if parent_id in self.primary:
+                        parent_paths.append(self.primary[parent_id])
+            paths = self.__own_paths(node_id, node, parent_paths)
+        self.paths[node_id] = paths
+        for path in paths:
+            self.nodes.setdefault(path, node_id)
+
+    def add(self, node_id):
+        """Index node_id, which has just been cached.
+           Returns: Boolean (False if the index must be rebuilt because
+           nodes already indexed sit beneath node_id)
+        """
+        if node_id in self.waiting:
+            return False
+        self.remove(node_id)
+        self.__paths_of(node_id)
+        return True
+
+    def remove(self, node_id):
+        """Drop the paths of node_id (but not of anything beneath it)."""
+        for path in self.paths.pop(node_id, []):
+            if self.nodes.get(path) == node_id:
+                del self.nodes[path]
@@ -0,0 +1,98 @@
+""" Profiling hook for the DriveInspector tools
+
+Started 2026-10-19
+
+Copyright (C) 2018-2026 Marc Donner
+
+WorkProfiler wraps cProfile (and, optionally, tracemalloc) around the
+work section of a command so that hot spots such as __register_node or
+get_path show up without editing the code.  On stop() it writes:
+
+    <prefix>.pstats :: the raw cProfile data, for pstats or snakeviz
+    <prefix>.txt :: a summary sorted by cumulative and by internal time
+    <prefix>.tracemalloc :: the tracemalloc snapshot (memory only)
+
+"""
+
+import cProfile
+import io
+import pstats
+import tracemalloc
+
+
+def profile_prefix(program_name, prefix):
+    """Work out the output prefix for a --profile argument.
+       Returns: string
+    """
+    if prefix:
+        return prefix
+    name = program_name.split('/')[-1]
+    if name.endswith('.py'):
+        name = name[:-3]
+    return name + '-profile'
+
+
+class WorkProfiler():
+    """Capture CPU (and optionally memory) profiles of a block of work."""
+
+    def __init__(self, prefix, memory=False, limit=40):
+        self.prefix = prefix
+        self.memory = memory
+        self.limit = limit
+        self.profiler = cProfile.Profile()
+        self.running = False
+
+    def start(self):
+        """Start profiling."""
+        if self.memory:
+            tracemalloc.start(25)
+        self.running = True
+        self.profiler.enable()
+
+    def stop(self):
+        """Stop profiling and write the stats files.
+           Returns: List of String (a short report)
+        """
+        self.profiler.disable()
+        self.running = False
+        result = []
+
+        stats_path = self.prefix + '.pstats'
+        self.profiler.dump_stats(stats_path)
+        result.append("# profile: raw stats: " + stats_path + "\n")
+
+        summary = io.StringIO()
+        for sort_key in ['cumulative', 'tottime']:
+            summary.write("# sorted by " + sort_key + "\n")
+            stats = pstats.Stats(self.profiler, stream=summary)
+            stats.strip_dirs().sort_stats(sort_key).print_stats(self.limit)
+
+        if self.memory:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            snapshot_path = self.prefix + '.tracemalloc'
+            snapshot.dump(snapshot_path)
+            summary.write("# tracemalloc: current: " + str(current) \
+                + " bytes, peak: " + str(peak) + " bytes\n")
+            for stat in snapshot.statistics('lineno')[:self.limit]:
+                summary.write(str(stat) + "\n")
+            result.append("# profile: tracemalloc snapshot: " \
+                + snapshot_path + "\n")
+            result.append("# profile: peak traced memory: " \
+                + str(peak) + " bytes\n")
+
+        summary_path = self.prefix + '.txt'
+        with open(summary_path, "w", encoding="utf-8") as summary_file:
+            summary_file.write(summary.getvalue())
+        result.append("# profile: summary: " + summary_path + "\n")
+        return result
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for line in self.stop():
+            print(line, end='')
+        return False
@@ -0,0 +1,379 @@
+""" Local queries over the DriveFileCached cache
+
+Started 2026-10-19
+
+Copyright (C) 2018-2026 Marc Donner
+
+A query is a list of terms, all of which a node must match:
+
+    name:GLOB           name matches the glob (case-insensitive)
+    name~REGEX          name matches the regular expression
+                        (case-insensitive)
+    mime:TYPE           mimeType is TYPE (a glob, or an alias such
+                        as folder, doc, sheet, slides, pdf)
+    owner:GLOB          an owner's email address matches the glob
+    size:RANGE          size in bytes (K, M and G suffixes allowed)
+    modified:RANGE      modifiedTime (dates as for --newer)
+    created:RANGE       createdTime
+    shared:BOOL         shared is true (or false)
+    trashed:BOOL        trashed is true (or false)
+    under:PATH          the node is beneath the folder PATH
+
+A RANGE is >X, >=X, <X, <=X, X..Y (inclusive) or X.  A bare date
+matches that whole day.  Quote terms that contain spaces:
+'name:Tax Return*'.
+
+QueryIndex keeps secondary indexes (name, mimeType, owner, the flags
+and size, modified and created lists, sorted when next read) so that
+each term yields a candidate set without looking at every node.  The
+sets are intersected smallest first, and only under: is checked node
+by node.
+
+"""
+
+import bisect
+import fnmatch
+import re
+import shlex
+
+from drivelru import parse_size
+from drivenode import DriveNode
+from drivenode import date_to_millis
+from drivenode import node_millis
+from drivenode import time_to_millis
+
+DAY_MILLIS = 24 * 3600 * 1000
+
+MIME_ALIASES = {
+    'folder': 'application/vnd.google-apps.folder',
+    'doc': 'application/vnd.google-apps.document',
+    'sheet': 'application/vnd.google-apps.spreadsheet',
+    'slides': 'application/vnd.google-apps.presentation',
+    'form': 'application/vnd.google-apps.form',
+    'drawing': 'application/vnd.google-apps.drawing',
+    'pdf': 'application/pdf',
+    }
+
+FIELDS = ['name', 'mime', 'owner', 'size', 'modified', 'created',
+          'shared', 'trashed', 'under']
+
+# A sort key greater than every node_id
+LAST = chr(0x10ffff)
+
+
+class QueryError(ValueError):
+    """A query that can not be parsed."""
+
+
+class Term():
+    """One parsed term of a query."""
+
+    def __init__(self, field, operator, value):
+        self.field = field
+        self.operator = operator
+        self.value = value
+
+    def __repr__(self):
+        return "Term(" + self.field + self.operator + repr(self.value) + ")"
+
+
+def parse_bool(text):
+    """Returns: Boolean"""
+    if text.lower() in ['true', 'yes', '1']:
+        return True
+    if text.lower() in ['false', 'no', '0']:
+        return False
+    raise QueryError("expected true or false, not '" + text + "'")
+
+
+def parse_range(text, parse_interval):
+    """Parse a RANGE into an inclusive (low, high) pair, either of
+       which may be None.  parse_interval turns one value into the
+       (first, last) it covers: a bare date covers a whole day.
+       Returns: (low, high)
+    """
+    def interval(part):
+        result = parse_interval(part)
+        if result is None:
+            raise QueryError("can not understand '" + part + "'")
+        return result
+
+    if text.startswith('>='):
+        return interval(text[2:])[0], None
+    if text.startswith('<='):
+        return None, interval(text[2:])[1]
+    if text.startswith('>'):
+        return interval(text[1:])[1] + 1, None
+    if text.startswith('<'):
+        return None, interval(text[1:])[0] - 1
+    if '..' in text:
+        low, high = text.split('..', 1)
+        return (interval(low)[0] if low else None,
+                interval(high)[1] if high else None)
+    return interval(text)
+
+
+def size_interval(text):
+    """Returns: (bytes, bytes), or None"""
+    try:
+        size = parse_size(text)
+    except ValueError:
+        return None
+    return size, size
+
+
+def date_interval(text):
+    """Returns: (first, last) in milliseconds, or None"""
+    millis = date_to_millis(text)
+    if millis is None:
+        return None
+    if len(text) == 10:
+        return millis, millis + DAY_MILLIS - 1
+    return millis, millis
+
+
+def parse_query(text):
+    """Parse the text of a query.
+       Returns: list of Term
+    """
+    try:
+        tokens = shlex.split(text)
+    except ValueError as error:
+        raise QueryError(str(error)) from error
+    if not tokens:
+        raise QueryError("empty query")
+    terms = []
+    for token in tokens:
+        match = re.match(r'([a-z]+)([:~])(.*)$', token, re.DOTALL)
+        if not match or match.group(1) not in FIELDS:
+            raise QueryError("can not understand '" + token \
+                + "', expected one of " + ", ".join(FIELDS))
+        field, operator, value = match.groups()
+        if operator == '~' and field != 'name':
+            raise QueryError("only name takes a regular expression")
+        if field == 'name' and operator == '~':
+            try:
+                value = re.compile(value, re.IGNORECASE)
+            except re.error as error:
+                raise QueryError("bad regular expression: " + str(error)) \
+                    from error
+        elif field == 'mime':
+            value = MIME_ALIASES.get(value, value)
+        elif field == 'size':
+            value = parse_range(value, size_interval)
+        elif field in ['modified', 'created']:
+            value = parse_range(value, date_interval)
+        elif field in ['shared', 'trashed']:
+            value = parse_bool(value)
+        terms.append(Term(field, operator, value))
+    return terms
+
+
+def node_size(node):
+    """Returns: integer (bytes), or None if the node has no size"""
+    try:
+        return int(node['size'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def owner_emails(node):
+    """Returns: list of string"""
+    return [owner['emailAddress'] for owner in node.get('owners', []) \
+        if 'emailAddress' in owner]
+
+
+class OrderedPairs():
+    """(value, node_id) pairs in order, for range queries.  Changes
+       are held back and applied in one sort the next time the pairs
+       are read, so indexing many nodes one at a time (a relist, say)
+       costs one sort rather than a list insertion apiece."""
+
+    def __init__(self):
+        self.pairs = []
+        self.added = set()
+        self.removed = set()
+
+    def add(self, pair):
+        """Add pair (value, node_id)."""
+        if pair in self.removed:
+            # Taken out and put back: it is still in self.pairs
+            self.removed.discard(pair)
+        else:
+            self.added.add(pair)
+
+    def remove(self, pair):
+        """Take out pair, which must have been added."""
+        if pair in self.added:
+            self.added.discard(pair)
+        else:
+            self.removed.add(pair)
+
+    def ordered(self):
+        """Returns: sorted list of (value, node_id)"""
+        if self.added or self.removed:
+            if self.removed:
+                removed = self.removed
+                self.pairs = [pair for pair in self.pairs \
+                    if pair not in removed]
+            self.pairs.extend(self.added)
+            # Mostly in order already, which sort() takes advantage of
+            self.pairs.sort()
+            self.added = set()
+            self.removed = set()
+        return self.pairs
+
+
+class QueryIndex():
+    """Secondary indexes over the cached nodes."""
+
+    def __init__(self):
+        self.all = set()
+        self.by_name = {}
+        self.by_mime = {}
+        self.by_owner = {}
+        self.shared = set()
+        self.trashed = set()
+        self.by_size = OrderedPairs()
+        self.by_modified = OrderedPairs()
+        self.by_created = OrderedPairs()
+
+    def build(self, metadata):
+        """Index every node in metadata, in one pass."""
+        for node_id, node in metadata.items():
+            if node and node['id'] == node_id:
+                self.add(node_id, node)
+
+    def __sorted_keys(self, node):
+        """Returns: list of (sorted list, value) for node"""
+        if isinstance(node, DriveNode):
+            created = node.created
+        else:
+            created = time_to_millis(node.get('createdTime'))
+        return [
+            (self.by_size, node_size(node)),
+            (self.by_modified, node_millis(node)),
+            (self.by_created, created if isinstance(created, int) else None),
+            ]
+
+    def add(self, node_id, node):
+        """Index node under node_id."""
+        self.all.add(node_id)
+        self.by_name.setdefault(node['name'].lower(), set()).add(node_id)
+        self.by_mime.setdefault(node.get('mimeType'), set()).add(node_id)
+        for email in owner_emails(node):
+            self.by_owner.setdefault(email.lower(), set()).add(node_id)
+        if node.get('shared'):
+            self.shared.add(node_id)
+        if node.get('trashed'):
+            self.trashed.add(node_id)
+        for ordered, value in self.__sorted_keys(node):
+            if value is not None:
+                ordered.add((value, node_id))
+
+    def remove(self, node_id, node):
+        """Take node (as it was indexed) out of the indexes."""
+        self.all.discard(node_id)
+        for table, key in [(self.by_name, node['name'].lower()),
+                           (self.by_mime, node.get('mimeType'))] \
+                + [(self.by_owner, email.lower()) \
+                    for email in owner_emails(node)]:
+            if key in table:
+                table[key].discard(node_id)
+                if not table[key]:
+                    del table[key]
+        self.shared.discard(node_id)
+        self.trashed.discard(node_id)
+        for ordered, value in self.__sorted_keys(node):
+            if value is not None:
+                ordered.remove((value, node_id))
+
+    @staticmethod
+    def __in_range(pairs, low, high):
+        """Returns: set of node_id with low <= value <= high"""
+        ordered = pairs.ordered()
+        start = 0 if low is None else bisect.bisect_left(ordered, (low,))
+        end = len(ordered) if high is None \
+            else bisect.bisect_right(ordered, (high, LAST))
+        return {node_id for _, node_id in ordered[start:end]}
+
+    @staticmethod
+    def __matching(table, pattern):
+        """Returns: set of node_id under the keys of table that match
+           pattern (a glob, lower case, or a compiled regex)"""
+        if isinstance(pattern, str) and not any(
+                char in pattern for char in '*?['):
+            return set(table.get(pattern, ()))
+        result = set()
+        for key, node_ids in table.items():
+            if key is None:
+                continue
+            if isinstance(pattern, str):
+                if fnmatch.fnmatchcase(key, pattern):
+                    result |= node_ids
+            elif pattern.search(key):
+                result |= node_ids
+        return result
+
+    def newer(self, millis):
+        """Returns: list of node_id modified after millis, oldest first"""
+        ordered = self.by_modified.ordered()
+        start = bisect.bisect_right(ordered, (millis, LAST))
+        return [node_id for _, node_id in ordered[start:]]
+
+    def candidates(self, term):
+        """Find the nodes that match term.
+           Returns: set of node_id, or None if term has no index
+        """
+        field = term.field
+        if field == 'name':
+            pattern = term.value if term.operator == '~' \
+                else term.value.lower()
+            return self.__matching(self.by_name, pattern)
+        if field == 'mime':
+            if any(char in term.value for char in '*?['):
+                return self.__matching(self.by_mime, term.value)
+            return set(self.by_mime.get(term.value, ()))
+        if field == 'owner':
+            return self.__matching(self.by_owner, term.value.lower())
+        if field in ['size', 'modified', 'created']:
+            ordered = {'size': self.by_size, 'modified': self.by_modified,
+                       'created': self.by_created}[field]
+            return self.__in_range(ordered, *term.value)
+        if field in ['shared', 'trashed']:
+            flagged = self.shared if field == 'shared' else self.trashed
+            return set(flagged) if term.value else self.all - flagged
+        return None
+
+
+def run_query(terms, index, get_path, under=None):
+    """Evaluate terms against index.  under: terms (whose paths must
+       be absolute) are answered by under(prefix), which yields the
+       node_ids beneath prefix, if it is given, and otherwise are
+       checked against get_path() of the surviving candidates.
+       Returns: list of node_id
+    """
+    sets = []
+    prefixes = []
+    for term in terms:
+        if term.field == 'under':
+            prefix = term.value.rstrip('/') + '/'
+            if under is None:
+                prefixes.append(prefix)
+            else:
+                sets.append(set(under(prefix)) & index.all)
+            continue
+        sets.append(index.candidates(term))
+    if sets:
+        sets.sort(key=len)
+        result = set(sets[0])
+        for other in sets[1:]:
+            result &= other
+            if not result:
+                break
+    else:
+        result = set(index.all)
+    for prefix in prefixes:
+        result = {node_id for node_id in result \
+            if get_path(node_id).startswith(prefix)}
+    return list(result)
@@ -11,8 +11,14 @@ reports from the Google Drive metadata that the DriveFile class provides.
 """
 
 # import sys
+import argparse
+import logging
 
+from drivefilecached import CACHE_ENV
 from drivefilecached import DriveFileCached
+from drivelog import get_logger
+from driveprofile import WorkProfiler
+from driveprofile import profile_prefix
 from drivefileraw import TestStats
 
 # These two break in Python 3 and may not be needed anyway
@@ -21,10 +27,12 @@ from drivefileraw import TestStats
 
 APPLICATION_NAME = 'Drive Report'
 
+LOG = get_logger('report')
+
 class DriveReport(DriveFileCached):
     """Class to render tables of Google Drive object metadata."""
 
-    def __init__(self, debug=False):
+    def __init__(self, debug=False, service=None):
         self.render_list = []
         self.handlers = {
             'createdTime': self.get_created_time,
@@ -41,7 +49,7 @@ class DriveReport(DriveFileCached):
             'size': self.get_size,
             'trashed': self.get_trashed,
             }
-        super().__init__(debug)
+        super().__init__(debug, service)
         self.fields = self.df_field_list()
         self.fields.append("path")
 
@@ -50,145 +58,143 @@ class DriveReport(DriveFileCached):
            the relevant metadata is in the cache.
            Returns: node_id
         """
-        if self.debug:
-            print("# get_id(node_id: " + str(node_id) + ")")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_id(node_id: %s)", node_id)
         node = self.get(node_id)
-        if self.debug:
-            print("#    => " + str(node['id']))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   => %s", node['id'])
         return node['id']
 
     def get_name(self, node_id):
         """Return the file name.
            Returns: string
         """
-        if self.debug:
-            print("# get_name(node_id: " + str(node_id) + ")")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_name(node_id: %s)", node_id)
         node = self.get(node_id)
-        if self.debug:
-            print("#    => " + str(node['name']))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   => %s", node['name'])
         return node['name']
 
     def get_parents(self, node_id):
         """Return paths to parents
            Returns: string (comma-delimited list of parent paths)
         """
-        if self.debug:
-            print("# get_parents(node_id: " + str(node_id) + ")")
-        node = self.get(node_id)
-        # now get the path to each of the parents ...
-        results = [self.get_path(parent_id) for parent_id in node['parents']] \
-                  if 'parents' in node else []
-        if self.debug:
-            print("#    => " + str(results))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_parents(node_id: %s)", node_id)
+        # every path to each of the parents, from the path index
+        results = self.get_parent_paths(node_id)
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   => %s", results)
         return ', '.join(results)
 
     def get_parent_count(self, node_id):
         """Return number of parents
            Returns: integer
         """
-        if self.debug:
-            print("# get_parents(node_id: " + str(node_id) + ")")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_parents(node_id: %s)", node_id)
         node = self.get(node_id)
         # now get the path to each of the parents ...
         results = len(node['parents']) if 'parents' in node else 0
-        if self.debug:
-            print("#    => " + str(results))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   => %s", results)
         return results
 
     def get_size(self, node_id):
         """Return size in bytes of file
            Returns: integer
         """
-        if self.debug:
-            print("# get_size(node_id: " + str(node_id) + ")")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_size(node_id: %s)", node_id)
         node = self.get(node_id)
         if 'size' in node:
             result = node['size']
         else:
             result = 0
-        if self.debug:
-            print("#    => " + str(result))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   => %s", result)
 
     def get_mimetype(self, node_id):
         """Return the mimeType
            Returns: string
         """
-        if self.debug:
-            print("# get_mimetype(node_id: " + str(node_id) + ")")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_mimetype(node_id: %s)", node_id)
         node = self.get(node_id)
-        if self.debug:
-            print("#    => " + str(node['mimeType']))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   => %s", node['mimeType'])
         return node['mimeType']
 
     def get_owners(self, node_id):
         """Return the list of owners
            Returns: comma-delimited list of owner email addresses
         """
-        if self.debug:
-            print("# get_owners(node_id: " + str(node_id) + ")")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_owners(node_id: %s)", node_id)
         node = self.get(node_id)
         # We will return a list of email addresses
         owner_list = [owner['emailAddress'] for owner in node['owners']] \
                      if 'owners' in node else []
         results = ", ".join(owner_list)
-        if self.debug:
-            print("#    => " + str(node['owners']))
-            print("#    => " + str(results))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   => %s", node['owners'])
+            LOG.debug("   => %s", results)
         return results
 
     def get_trashed(self, node_id):
         """Return the trashed flag
            Returns: Boolean
         """
-        if self.debug:
-            print("# get_trashed(node_id: " + str(node_id) + ")")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_trashed(node_id: %s)", node_id)
         node = self.get(node_id)
-        if self.debug:
-            print("#    => " + str(node['trashed']))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   => %s", node['trashed'])
         return node['trashed']
 
     def get_modified_time(self, file_id):
         """Return the modifiedTime string
            Returns: string
         """
-        if self.debug:
-            print("# get_modified_time(file_id: " + str(file_id) + ")")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_modified_time(file_id: %s)", file_id)
         node = self.get(file_id)
-        if self.debug:
-            print("#    => " + str(node['modifiedTime']))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   => %s", node['modifiedTime'])
         return node['modifiedTime']
 
     def get_created_time(self, node_id):
         """Return the createdTime string
            Returns: string
         """
-        if self.debug:
-            print("# get_created_time(node_id: " + str(node_id) + ")")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_created_time(node_id: %s)", node_id)
         node = self.get(node_id)
-        if self.debug:
-            print("#    => " + str(node['createdTime']))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   => %s", node['createdTime'])
         return node['createdTime']
 
     def get_ownedbyme(self, node_id):
         """Return the ownedByMe flag
            Returns: Boolean
         """
-        if self.debug:
-            print("# get_ownedbyme(node_id: " + str(node_id) + ")")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_ownedbyme(node_id: %s)", node_id)
         node = self.get(node_id)
-        if self.debug:
-            print("#    => " + str(node['ownedByMe']))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   => %s", node['ownedByMe'])
         return node['ownedByMe']
 
     def get_shared(self, node_id):
         """Return the shared flag
            Returns: Boolean
         """
-        if self.debug:
-            print("# get_shared(node_id: " + str(node_id) + ")")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_shared(node_id: %s)", node_id)
         node = self.get(node_id)
-        if self.debug:
-            print("#    => " + str(node['shared']))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   => %s", node['shared'])
         return node['shared']
 
     def set_render_fields(self, field_list):
@@ -202,16 +208,14 @@ class DriveReport(DriveFileCached):
         """Given a node_id, retrieve the render fields for it.
            Returns: list of strings
         """
-        if self.debug:
-            print("# retrieve_item(" + str(node_id) + ")")
         result = []
         for field in self.render_list:
             if field in self.handlers:
                 result.append(self.handlers[field](node_id))
             else:
                 result.append(field)
-        if self.debug:
-            print("#   =>" + str(result))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("retrieve_item(%s) => %s", node_id, result)
         return result
 
     def retrieve_items(self, node_id_list):
@@ -219,13 +223,11 @@ class DriveReport(DriveFileCached):
            for each one.
            Returns: list of list of strings
         """
-        if self.debug:
-            print("# render_items(" + str(len(node_id_list)) + ")")
+        LOG.debug("render_items(%s)", len(node_id_list))
         result = []
         for node_id in node_id_list:
             result.append(self.retrieve_item(node_id))
-        if self.debug:
-            print("#   =>" + str(result))
+        LOG.debug("  =>%s", result)
         return result
 
     def render_items_html(self, node_id_list):
@@ -233,9 +235,7 @@ class DriveReport(DriveFileCached):
            Returns: list of list of string
         """
         # should make this an iterator!
-        if self.debug:
-            print("# render_items_html(len: " \
-                    + str(len(node_id_list)) + ")")
+        LOG.debug("render_items_html(len: %s)", len(node_id_list))
         result = ""
         result += "<table>\n"
         result += "<tr>"
@@ -254,8 +254,7 @@ class DriveReport(DriveFileCached):
         """Given a list of node_ids, render each one as TSV.
            Returns: list of list of string
         """
-        if self.debug:
-            print("# render_items_tsv(len: " + str(len(node_id_list)) + ")")
+        LOG.debug("render_items_tsv(len: %s)", len(node_id_list))
         result = ""
         for field in self.render_list:
             result += field + "\t"
@@ -272,13 +271,53 @@ class DriveReport(DriveFileCached):
         result += "fields: " + str(self.fields) + "\n"
         return result
 
+def setup_parser():
+    """Set up the arguments parser.
+       Returns: parser
+    """
+    parser = argparse.ArgumentParser(
+        description=\
+        "Write an inventory of the files to which you have access " + \
+        "to dr_output.tsv."\
+        )
+    parser.add_argument(
+        '--cache',
+        type=str,
+        metavar='PATH',
+        help='(Modifier) Keep the cache in PATH (default $' + CACHE_ENV + ' or ' + DriveFileCached.CACHE_PATH + ').'
+        )
+    parser.add_argument(
+        '--mapped',
+        action='store_true',
+        help='(Modifier) Report on the cached nodes, read through the memory-mapped cache, instead of listing the Drive.'
+        )
+    parser.add_argument(
+        '--profile',
+        type=str,
+        nargs='?',
+        const='',
+        metavar='PREFIX',
+        help='(Modifier) Profile the work with cProfile and write PREFIX.pstats and PREFIX.txt.'
+        )
+    parser.add_argument(
+        '--profile-memory',
+        action='store_true',
+        help='(Modifier) With --profile, also take a tracemalloc snapshot.'
+        )
+    return parser
+
+
 def main():
     """Test code."""
 
+    parser = setup_parser()
+    args = parser.parse_args()
+
     teststats = TestStats()
     startup_report = teststats.report_startup()
 
     drive_report = DriveReport(False)
+    _ = drive_report.set_cache_path(args.cache) if args.cache else False
     drive_report.init_cache()
 
     # Pick either TSV or HTML here and further down
@@ -309,7 +348,17 @@ def main():
     drive_report.df_print("# cwd: " + str(cwd) + "\n")
     drive_report.df_print("# cwd_fileid: " + str(cwd_node_id) + "\n")
 
-    node_id_list = [node['id'] for node in drive_report.list_all()]
+    profiler = WorkProfiler(
+        profile_prefix(teststats.program_name, args.profile),
+        args.profile_memory
+        ) if args.profile is not None else None
+    _ = profiler.start() if profiler else False
+
+    if args.mapped:
+        drive_report.load_mapped_cache()
+        node_id_list = drive_report.df_node_ids()
+    else:
+        node_id_list = [node['id'] for node in drive_report.list_all()]
 
     print("# len(node_id_list): " + str(len(node_id_list)))
 
@@ -318,8 +367,16 @@ def main():
         drive_report.render_items_tsv(node_id_list))
         # drive_report.render_items_html(node_id_list))
 
+    if profiler:
+        for line in profiler.stop():
+            print(line, end='')
+
+    # Build or refresh the mapped cache for the next run
+    _ = drive_report.dump_cache() if args.mapped else False
+
     wrapup_report = teststats.report_wrapup()
     drive_report.df_print(wrapup_report)
+    drive_report.df_close_output()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,180 @@
+""" Per-folder size and count rollups for the DriveFileCached cache
+
+Started 2026-10-19
+
+Copyright (C) 2018-2026 Marc Donner
+
+RollupIndex answers du-style questions ("how much is under
+/projects?") from the cache.  For every folder it keeps the totals of
+everything beneath it:
+
+    bytes :: the sum of the sizes of the files
+    files :: the number of files
+    folders :: the number of folders
+
+The totals are built by adding up what each folder holds directly
+and carrying each folder's sum up to its ancestors.  After that, each
+node that is added, changed or dropped moves the totals of its
+ancestors by its own contribution, so reading the rollup of a folder
+is a dictionary lookup.  A folder with a node of several parents
+somewhere beneath it cannot be moved that way (an ancestor may reach
+that node by another path as well), so a change to such a folder
+marks the index stale and it is built afresh when next read.
+
+Trashed nodes (and everything in a trashed folder) are not counted.
+A node with several parents is counted under each of them, and once
+under a folder above more than one of them.
+
+"""
+
+from drivequery import node_size
+
+FOLDERMIMETYPE = 'application/vnd.google-apps.folder'
+
+BYTES = 0
+FILES = 1
+FOLDERS = 2
+
+
+def is_folder(node):
+    """Returns: Boolean"""
+    return node.get('mimeType') == FOLDERMIMETYPE \
+        and 'fileExtension' not in node
+
+
+class RollupIndex():
+    """Totals of the cached tree beneath each folder."""
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+        # folder node_id => [bytes, files, folders] beneath it
+        self.totals = {}
+        # node_ids with more than one parent
+        self.shared = set()
+        self.stale = False
+
+    def get(self, folder_id):
+        """Returns: (bytes, files, folders) beneath folder_id"""
+        if self.stale:
+            self.build()
+        return tuple(self.totals.get(folder_id, (0, 0, 0)))
+
+    @staticmethod
+    def __alone(node):
+        """What node by itself, without anything beneath it, adds to
+           the totals of its folders.
+           Returns: [bytes, files, folders]
+        """
+        if node.get('trashed'):
+            return [0, 0, 0]
+        if is_folder(node):
+            return [0, 0, 1]
+        return [node_size(node) or 0, 1, 0]
+
+    def __own(self, node_id, node):
+        """What node, and for a folder everything beneath it, adds to
+           the totals of its parents.
+           Returns: [bytes, files, folders]
+        """
+        own = self.__alone(node)
+        if is_folder(node) and not node.get('trashed'):
+            below = self.totals.get(node_id, (0, 0, 0))
+            own = [below[BYTES], below[FILES], below[FOLDERS] + 1]
+        return own
+
+    def build(self):
+        """Compute every folder's totals.  Each node is first added to
+           the folder it is in, and then each folder's sum is carried
+           up to its ancestors, so the walk up is made once per folder
+           rather than once per node.  A node in several folders is
+           carried up on its own, so that a folder above more than one
+           of them counts it only once.
+        """
+        self.totals = {}
+        self.shared = set()
+        self.stale = False
+        direct = {}
+        for node_id, node in self.metadata.items():
+            if not node or node['id'] != node_id:
+                continue
+            parents = node.get('parents', [])
+            if not parents:
+                continue
+            alone = self.__alone(node)
+            if len(parents) > 1:
+                self.shared.add(node_id)
+                self.__propagate(parents, alone)
+                continue
+            totals = direct.get(parents[0])
+            if totals is None:
+                direct[parents[0]] = totals = [0, 0, 0]
+            totals[BYTES] += alone[BYTES]
+            totals[FILES] += alone[FILES]
+            totals[FOLDERS] += alone[FOLDERS]
+        for folder_id, delta in direct.items():
+            self.__propagate([folder_id], delta)
+
+    def __ancestors(self, parents):
+        """Walk up from parents, yielding each folder once, however
+           many paths lead up to it (and even if the parents form a
+           cycle).  The walk stops at a trashed folder.
+           Returns: generator of folder node_id
+        """
+        stack = list(parents)
+        seen = set()
+        while stack:
+            folder_id = stack.pop()
+            if folder_id in seen:
+                continue
+            seen.add(folder_id)
+            yield folder_id
+            folder = self.metadata.get(folder_id)
+            if folder and not folder.get('trashed'):
+                stack.extend(folder.get('parents', []))
+
+    def __propagate(self, parents, delta):
+        """Add delta to the totals of parents and all their ancestors,
+           once each."""
+        if not any(delta):
+            return
+        for folder_id in self.__ancestors(parents):
+            totals = self.totals.setdefault(folder_id, [0, 0, 0])
+            for i, value in enumerate(delta):
+                totals[i] += value
+
+    def __spans(self, node_id, node):
+        """Is node a counted folder with a node of several parents
+           beneath it, so that its subtotal cannot be carried up as
+           one?
+           Returns: Boolean
+        """
+        if not is_folder(node) or node.get('trashed'):
+            return False
+        for shared_id in self.shared:
+            shared = self.metadata.get(shared_id)
+            if shared and \
+                    node_id in self.__ancestors(shared.get('parents', [])):
+                return True
+        return False
+
+    def add(self, node_id, node):
+        """Count node_id, which has just been cached."""
+        if self.stale:
+            return
+        if len(node.get('parents', [])) > 1:
+            self.shared.add(node_id)
+        if self.__spans(node_id, node):
+            self.stale = True
+            return
+        self.__propagate(node.get('parents', []), self.__own(node_id, node))
+
+    def remove(self, node_id, node):
+        """Stop counting node_id (node is the copy that was counted)."""
+        if self.stale:
+            return
+        self.shared.discard(node_id)
+        if self.__spans(node_id, node):
+            self.stale = True
+            return
+        self.__propagate(node.get('parents', []),
+                         [-value for value in self.__own(node_id, node)])
@@ -10,14 +10,33 @@ Copyright (C) 2018 Marc Donner
 """
 
 # import sys
+import argparse
+import itertools
+import string
+import sys
+import time
 
+from googleapiclient import errors
+
+from drivefilecached import CACHE_ENV
 from drivefilecached import DriveFileCached
+from drivefilecached import LOOKUP_FAILURES
 from drivefilecached import canonicalize_path
+from drivefilecached import handle_drives
+from drivefilecached import handle_du
+from drivefilecached import handle_duplicates
+from drivefilecached import handle_query
+from drivefresh import parse_max_age
+from drivelog import debug_enabled
+from drivelog import get_logger
+from drivelog import parse_log_levels
+from drivelog import setup_logging
+from drivelru import parse_size
+from driveprofile import WorkProfiler
 from drivefileraw import TestStats
 from drivefileraw import handle_ls
 from drivefileraw import handle_stat
 from drivefileraw import handle_status
-from drivefileraw import handle_find
 
 # This may not be needed in Python 3.  Check carefully.
 # reload(sys)
@@ -25,11 +44,92 @@ from drivefileraw import handle_find
 
 APPLICATION_NAME = 'Drive Shell'
 
+LOG = get_logger('shell')
+
+PROFILE_SEQUENCE = itertools.count(1)
+
+# Written before each command's output in batch mode
+SEPARATOR = "# [{n}] {command}"
+
+
+FIND_USAGE = "usage: find [--maxdepth N] [--prune GLOB]... [--limit N] <path>"
+
+
+class CommandError(Exception):
+    """A command that could not be carried out."""
+
+
+# What a failing command may raise, in batch and interactive mode alike;
+# the shell reports it and carries on
+COMMAND_ERRORS = (CommandError, errors.HttpError, OSError)
+
+
+def parse_separator(separator):
+    """Check a --separator argument once, so that a bad one is reported
+       before any command runs rather than as each one does: its only
+       fields may be {n} and {command}, with no indexing or attributes,
+       and it must format.
+       Returns: string
+    """
+    try:
+        for _, field, _, _ in string.Formatter().parse(separator):
+            if field is not None and field not in ('n', 'command'):
+                raise ValueError(
+                    "expected {n} or {command}, not {" + field + "}")
+        separator.format(n=1, command="ls")
+    except (KeyError, IndexError, ValueError) as error:
+        raise argparse.ArgumentTypeError(
+            "'" + separator + "': " + str(error)) from error
+    return separator
+
+
+def resolve_noun(drive_file, noun):
+    """Resolve a path typed at the shell, relative to the cwd.
+       Returns: node_id
+    """
+    path = canonicalize_path(
+        drive_file.get_cwd(),
+        noun,
+        drive_file.debug
+        )
+    node_id = drive_file.resolve_path(path)
+    if node_id == "<too_many_matches>":
+        raise CommandError("More than one file or folder is called: " \
+            + path)
+    if node_id in LOOKUP_FAILURES:
+        raise CommandError("No such file or folder: " + path)
+    return node_id
+
+
+def parse_find_options(noun):
+    """Split the options off the front of a find command's noun.  The
+       rest of the line is the path, so it may contain spaces.
+       Returns: (dict of list_all_children() limits, path)
+    """
+    limits = {'max_depth': None, 'prune': [], 'limit': None}
+    rest = noun
+    while rest.startswith('--'):
+        tokens = rest.split(None, 2)
+        if len(tokens) < 2 \
+                or tokens[0] not in ['--maxdepth', '--prune', '--limit']:
+            raise CommandError(FIND_USAGE)
+        option, value = tokens[0], tokens[1]
+        rest = tokens[2] if len(tokens) > 2 else "."
+        if option == '--prune':
+            limits['prune'].append(value)
+            continue
+        try:
+            limits['max_depth' if option == '--maxdepth' else 'limit'] = \
+                int(value)
+        except ValueError as error:
+            raise CommandError(FIND_USAGE) from error
+    return limits, rest
+
+
 def handle_cd(drive_file, node_id, show_all):
     """Handle the cd verb by calling set_cwd()."""
-    if drive_file.debug:
-        print("# handle_cd(node_id: " + str(node_id) + ",")
-        print("#   show_all: " + str(show_all))
+    LOG.debug("handle_cd(node_id: %s,", node_id)
+    LOG.debug("  show_all: %s", show_all)
     drive_file.set_cwd(node_id)
     print("pwd: " + drive_file.get_cwd())
     return True
@@ -37,63 +137,186 @@ def handle_cd(drive_file, node_id, show_all):
 
 def handle_debug(drive_file, node_id, show_all):
     """Handle the debug verb by toggling the debug flag."""
-    if drive_file.debug:
-        print("# handle_debug(node_id: " + str(node_id) + ",")
-        print("#   show_all: " + str(show_all))
+    LOG.debug("handle_debug(node_id: %s,", node_id)
+    LOG.debug("  show_all: %s", show_all)
     drive_file.set_debug(not drive_file.get_debug())
     return True
 
 
+def handle_shared_drives(drive_file, node_id, show_all):
+    """Handle the drives verb by scanning the shared drives into the
+       cache, 'drives N' N at a time."""
+    LOG.debug("handle_shared_drives(node_id: %s,", node_id)
+    LOG.debug("  show_all: %s", show_all)
+    return handle_drives(
+        drive_file, int(node_id) if node_id.isdigit() else None, show_all)
+
+
+def handle_find(drive_file, node_id, show_all):
+    """Handle the find verb by listing everything beneath a folder,
+       within the --maxdepth, --prune and --limit given before the
+       path."""
+    LOG.debug("handle_find(node_id: %s,", node_id)
+    LOG.debug("  show_all: %s", show_all)
+    limits, path = parse_find_options(node_id)
+    drive_file.show_all_children(
+        resolve_noun(drive_file, path), show_all, **limits)
+    return True
+
+
 def handle_help(drive_file, node_id, show_all):
     """Handle the help verb by displaying the help text."""
-    if drive_file.debug:
-        print("# handle_help(node_id: " + str(node_id) + ",")
-        print("#   show_all: " + str(show_all))
+    LOG.debug("handle_help(node_id: %s,", node_id)
+    LOG.debug("  show_all: %s", show_all)
     print("driveshell")
     print("\n")
     print("Commands:")
     print("   cd <path>")
     print("   debug [Toggles the debug flag.]")
-    print("   find <path>")
+    print("   drives [N] [scan the shared drives, N at once, into the cache.]")
+    print("   du <path> [bytes, files and folders beneath a folder.]")
+    print("   duplicates [list cached files with identical content.]")
+    print("   find [--maxdepth N] [--prune GLOB]... [--limit N] <path>")
     print("   help [displays this help text.]")
     print("   ls <path>")
     print("   output <path> [set the output file path.]")
+    print("   profile [-m] <command> [run a command under the profiler.]")
     print("   pwd")
+    print("   query <terms> [find cached nodes, e.g. query name:*.pdf size:>10M]")
     print("   quit")
     print("   stat <path>")
-    print("   status [Report the DriveFileCached object status.]")
+    print("   status [Report the DriveFileCached object status and statistics.]")
     return True
 
 
 def handle_output(drive_file, node_id, show_all):
     """Handle the output verb by setting an output file path and
        opening a new output file."""
-    if drive_file.debug:
-        print("# handle_pwd(node_id: " + str(node_id) + ",")
-        print("#   show_all: " + str(show_all))
+    LOG.debug("handle_pwd(node_id: %s,", node_id)
+    LOG.debug("  show_all: %s", show_all)
     drive_file.df_set_output(node_id)
     print("# output path now: '" + drive_file.output_path + "'")
     return True
 
 
+def handle_profile(drive_file, node_id, show_all):
+    """Handle the profile verb by running the rest of the line as a
+       command under cProfile.  'profile -m <command>' also takes a
+       tracemalloc snapshot."""
+    LOG.debug("handle_profile(node_id: %s,", node_id)
+    LOG.debug("  show_all: %s", show_all)
+    tokens = node_id.split(None, 1)
+    memory = bool(tokens) and tokens[0] == '-m'
+    command = tokens[1] if memory and len(tokens) > 1 else node_id
+    if command in ['.', '-m']:
+        print("usage: profile [-m] <command>")
+        return True
+    profiler = WorkProfiler(
+        "driveshell-profile-%s-%d" % (
+            time.strftime("%Y%m%d-%H%M%S"), next(PROFILE_SEQUENCE)),
+        memory
+        )
+    profiler.start()
+    try:
+        running = execute_command(drive_file, command)
+    finally:
+        for line in profiler.stop():
+            print(line, end='')
+    return running
+
+
 def handle_pwd(drive_file, node_id, show_all):
     """Handle the pwd verb by displaying the current working directory."""
-    if drive_file.debug:
-        print("# handle_pwd(node_id: " + str(node_id) + ",")
-        print("#   show_all: " + str(show_all))
+    LOG.debug("handle_pwd(node_id: %s,", node_id)
+    LOG.debug("  show_all: %s", show_all)
     print("pwd: " + drive_file.get_cwd())
     return True
 
 
 def handle_quit(drive_file, node_id, show_all):
     """Handle the quit verb by returning True."""
-    if drive_file.debug:
-        print("# handle_quit(node_id: " + str(node_id) + ",")
-        print("#   show_all: " + str(show_all))
+    LOG.debug("handle_quit(node_id: %s,", node_id)
+    LOG.debug("  show_all: %s", show_all)
     return False
 
 
-def drive_shell(teststats):
+NODE_ID_HANDLERS = {
+    'cd': handle_cd,
+    'du': handle_du,
+    'ls': handle_ls,
+    'stat': handle_stat,
+    }
+
+NOUN_HANDLERS = {
+    'debug': handle_debug,
+    'drives': handle_shared_drives,
+    'duplicates': handle_duplicates,
+    'find': handle_find,
+    'help': handle_help,
+    'output': handle_output,
+    'query': handle_query,
+    'profile': handle_profile,
+    'pwd': handle_pwd,
+    'status': handle_status,
+    'quit': handle_quit,
+    }
+
+
+def execute_command(drive_file, line):
+    """Parse one command line and dispatch it to its handler.
+       Raises CommandError for an unknown verb or a path that does
+       not resolve.
+       Returns: False if the shell should exit, otherwise True
+    """
+    tokens = line.split(None, 1)
+    verb = tokens[0].lower() if tokens else ""
+    noun = "." if len(tokens) <= 1 else tokens[1]
+    running = True
+    if verb in NODE_ID_HANDLERS:
+        node_id = resolve_noun(drive_file, noun)
+        running = NODE_ID_HANDLERS[verb](drive_file, node_id, True)
+    elif verb in NOUN_HANDLERS:
+        running = NOUN_HANDLERS[verb](drive_file, noun, True)
+    else:
+        raise CommandError("Unrecognized command: " + str(verb))
+    return running
+
+
+def read_commands(command_file):
+    """Yield the commands in command_file, one per line, skipping
+       blank lines and # comments."""
+    for line in command_file:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+def run_batch(drive_file, commands, separator):
+    """Run each of commands in turn, writing separator (formatted with
+       the command number n and the command) before its output.  A
+       failing command is reported and the batch carries on.
+       Returns: integer (the number of commands that failed)
+    """
+    failures = 0
+    for number, line in enumerate(commands, 1):
+        if separator:
+            drive_file.df_print(
+                separator.format(n=number, command=line) + '\n')
+        try:
+            running = execute_command(drive_file, line)
+        except COMMAND_ERRORS as error:
+            failures += 1
+            drive_file.df_print("# [" + str(number) + "] failed: " \
+                + str(error) + '\n')
+            running = True
+        drive_file.df_flush_output()
+        drive_file.refresh_stale()
+        if not running:
+            break
+    return failures
+
+
+def drive_shell(teststats, args):
     """The shell supporting interactive use of the DriveFileCached
        machinery.
     """
@@ -128,53 +351,42 @@ def drive_shell(teststats):
     startup_report = teststats.report_startup()
     print(startup_report)
 
-    node_id_handlers = {
-        'cd': handle_cd,
-        'find': handle_find,
-        'ls': handle_ls,
-        'stat': handle_stat,
-        }
-
-    noun_handlers = {
-        'debug': handle_debug,
-        'help': handle_help,
-        'output': handle_output,
-        'pwd': handle_pwd,
-        'status': handle_status,
-        'quit': handle_quit,
-        }
-
-    drive_file = DriveFileCached(False)
+    _ = setup_logging(args.log_level, args.log_file) \
+            if args.log_level or args.log_file else False
+
+    drive_file = DriveFileCached(debug_enabled())
     drive_file.df_set_output('stdout')
 
+    _ = drive_file.set_cache_path(args.cache) if args.cache else False
+    drive_file.set_memory_bound(args.max_nodes, args.max_memory)
+
     # Later on add a command line argument to skip the cache
     drive_file.load_cache()
 
-    running = True
-    tokens = []
+    drive_file.set_policy(args.max_age, args.max_age_for, args.stale_ok)
+
+    failures = 0
+    if args.commands:
+        # Batch mode: one cache load and one service for the lot.
+        # The parser has already opened the file (or stdin for -).
+        with args.commands as command_file:
+            failures = run_batch(
+                drive_file, read_commands(command_file), args.separator)
+    running = not args.commands
     while running:
         try:
             line = input("> ")
-            tokens = line.split(None, 1)
-            verb = tokens[0].lower() if tokens else ""
-            noun = "." if len(tokens) <= 1 else tokens[1]
-            if verb in node_id_handlers:
-                # Resolve the noun to a node_id
-                path = canonicalize_path(
-                    drive_file.get_cwd(),
-                    noun,
-                    drive_file.debug
-                    )
-                node_id = drive_file.resolve_path(path)
-                running = node_id_handlers[verb](drive_file, node_id, True)
-            elif verb in noun_handlers:
-                running = noun_handlers[verb](drive_file, noun, True)
-            else:
-                print("Unrecognized command: " + str(verb))
+            running = execute_command(drive_file, line)
+            drive_file.df_flush_output()
+            # Answer first, then bring stale entries up to date
+            drive_file.refresh_stale()
+        except COMMAND_ERRORS as error:
+            print(str(error))
         except EOFError:
             print("\n# EOF ...")
             running = False
 
+    drive_file.df_close_output()
     drive_file.dump_cache()
 
     print("# call_count: ")
@@ -182,14 +394,98 @@ def drive_shell(teststats):
     print("#    list_children: " + \
         str(drive_file.call_count['list_children']))
 
+    _ = drive_file.df_dump_stats(args.stats_json) if args.stats_json else False
+
     wrapup_report = teststats.report_wrapup()
     print(wrapup_report)
+    return 1 if failures else 0
+
+
+def setup_parser():
+    """Set up the arguments parser.
+       Returns: parser
+    """
+    parser = argparse.ArgumentParser(
+        description=\
+        "Interactive shell for inspecting the Google Drive metadata " + \
+        "of files to which you have access."\
+        )
+    parser.add_argument(
+        '--cache',
+        type=str,
+        metavar='PATH',
+        help='(Modifier) Keep the cache in PATH (default $' + CACHE_ENV + ' or ' + DriveFileCached.CACHE_PATH + ').'
+        )
+    parser.add_argument(
+        '-c', '--commands',
+        type=argparse.FileType('r', encoding='utf-8'),
+        metavar='FILE',
+        help='Run the commands in FILE (- for stdin), one per line, then exit.  The exit status is 1 if any failed.'
+        )
+    parser.add_argument(
+        '--separator',
+        type=parse_separator,
+        default=SEPARATOR,
+        help="(Modifier) With -c, write this before each command's output; {n} is the command number and {command} the command (default '" + SEPARATOR.replace('%', '%%') + "')."
+        )
+    parser.add_argument(
+        '--log-file',
+        type=str,
+        metavar='PATH',
+        help='(Modifier) Write debugging and log output to PATH instead of stderr.'
+        )
+    parser.add_argument(
+        '--log-level',
+        type=parse_log_levels,
+        metavar='LEVEL',
+        help='(Modifier) Log at LEVEL (e.g. DEBUG), or per component (e.g. cached=DEBUG,raw=INFO).'
+        )
+    parser.add_argument(
+        '--max-age',
+        type=float,
+        metavar='SECONDS',
+        help='(Modifier) Treat cached nodes and folder listings older than SECONDS as stale.'
+        )
+    parser.add_argument(
+        '--max-age-for',
+        type=parse_max_age,
+        action='append',
+        metavar='OPERATION=SECONDS',
+        help='(Modifier) Override --max-age for one operation (get or list_children).'
+        )
+    parser.add_argument(
+        '--max-memory',
+        type=parse_size,
+        metavar='SIZE',
+        help='(Modifier) Keep about SIZE bytes (e.g. 200M) of the cache in memory, spilling the rest to disk.'
+        )
+    parser.add_argument(
+        '--max-nodes',
+        type=int,
+        metavar='N',
+        help='(Modifier) Keep at most N nodes of the cache in memory, spilling the rest to disk.'
+        )
+    parser.add_argument(
+        '--stale-ok',
+        type=float,
+        default=3600,
+        metavar='SECONDS',
+        help='(Modifier) Answer from entries up to SECONDS past their max-age, refreshing them after each command (default 3600).'
+        )
+    parser.add_argument(
+        '--stats-json',
+        type=str,
+        help="(Modifier) On exit, write API and cache statistics as JSON to the specified file."
+        )
+    return parser
 
 
 def main():
     """Test code and basic CLI functionality engine."""
+    parser = setup_parser()
+    args = parser.parse_args()
     test_stats = TestStats()
-    drive_shell(test_stats)
+    sys.exit(drive_shell(test_stats, args))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,163 @@
+""" Instrumentation for the DriveInspector classes
+
+Started 2026-10-19
+
+Copyright (C) 2018-2026 Marc Donner
+
+DriveStats collects, for every kind of Drive API call, the latency of
+each request, the number of pages and the number of bytes received,
+and, for the cached operations, how often the cache answered the
+question without going to the API.
+
+DriveFileRaw owns one of these as self.stats.  df_status() reports
+it and dump() writes it as JSON for later analysis.
+
+"""
+
+import json
+import math
+import time
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a sorted list of samples.
+       Returns: float
+    """
+    if not samples:
+        return 0.0
+    rank = max(int(math.ceil(fraction * len(samples))) - 1, 0)
+    return samples[min(rank, len(samples) - 1)]
+
+
+def response_bytes(resp, content):
+    """The size of an HTTP response body, from its content-length
+       header if it has one and otherwise from the body itself.
+       Returns: integer
+    """
+    length = resp.get('content-length') if resp else None
+    if length is not None and str(length).isdigit():
+        return int(length)
+    return len(content or b'')
+
+
+def histogram(samples):
+    """Bucket latency samples (seconds) by powers of two milliseconds.
+       Returns: dict of bucket upper bound (ms) => count
+    """
+    buckets = {}
+    for sample in samples:
+        bound = 1
+        while bound < sample * 1000.0:
+            bound *= 2
+        buckets[bound] = buckets.get(bound, 0) + 1
+    return {str(bound): buckets[bound] for bound in sorted(buckets)}
+
+
+class DriveStats():
+    """Latency, volume and cache effectiveness counters."""
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.latency = {}
+        self.pages = {}
+        self.bytes = {}
+        self.hits = {}
+        self.misses = {}
+
+    def record(self, call_type, elapsed, received):
+        """Record one request (one page) of an API call of call_type,
+           which took elapsed seconds and received bytes of response
+           body (see count_bytes() in drivefileraw.py)."""
+        self.latency.setdefault(call_type, []).append(elapsed)
+        self.pages[call_type] = self.pages.get(call_type, 0) + 1
+        self.bytes[call_type] = self.bytes.get(call_type, 0) + received
+
+    def hit(self, operation):
+        """Count a cache hit for operation."""
+        self.hits[operation] = self.hits.get(operation, 0) + 1
+
+    def miss(self, operation):
+        """Count a cache miss for operation."""
+        self.misses[operation] = self.misses.get(operation, 0) + 1
+
+    def api_summary(self):
+        """Summarize the API calls.
+           Returns: dict of call_type => dict
+        """
+        result = {}
+        for call_type, samples in self.latency.items():
+            ordered = sorted(samples)
+            result[call_type] = {
+                'pages': self.pages[call_type],
+                'bytes': self.bytes[call_type],
+                'total_s': sum(ordered),
+                'p50_s': percentile(ordered, 0.50),
+                'p95_s': percentile(ordered, 0.95),
+                'p99_s': percentile(ordered, 0.99),
+                'max_s': ordered[-1],
+                'histogram_ms': histogram(ordered),
+                }
+        return result
+
+    def cache_summary(self):
+        """Summarize the cache hits and misses.
+           Returns: dict of operation => dict
+        """
+        result = {}
+        for operation in sorted(set(self.hits) | set(self.misses)):
+            hits = self.hits.get(operation, 0)
+            misses = self.misses.get(operation, 0)
+            result[operation] = {
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': float(hits) / (hits + misses),
+                }
+        return result
+
+    def api_report(self):
+        """Render the API statistics for df_status().
+           Returns: List of String
+        """
+        result = []
+        for call_type, summary in sorted(self.api_summary().items()):
+            result.append(
+                "# api: %s: pages: %d bytes: %d total: %.3fs "
+                "p50: %.3fs p95: %.3fs p99: %.3fs\n" % (
+                    call_type,
+                    summary['pages'],
+                    summary['bytes'],
+                    summary['total_s'],
+                    summary['p50_s'],
+                    summary['p95_s'],
+                    summary['p99_s'],
+                ))
+        return result
+
+    def cache_report(self):
+        """Render the cache statistics for df_status().
+           Returns: List of String
+        """
+        result = []
+        for operation, summary in self.cache_summary().items():
+            result.append(
+                "# cache: %s: hits: %d misses: %d hit rate: %.1f%%\n" % (
+                    operation,
+                    summary['hits'],
+                    summary['misses'],
+                    100.0 * summary['hit_rate'],
+                ))
+        return result
+
+    def dump(self, path, call_count=None):
+        """Write the statistics to path as JSON."""
+        with open(path, "w", encoding="utf-8") as stats_file:
+            json.dump(
+                {
+                    'start_time': self.start_time,
+                    'end_time': time.time(),
+                    'call_count': call_count if call_count else {},
+                    'api': self.api_summary(),
+                    'cache': self.cache_summary(),
+                },
+                stats_file, indent=3, separators=(',', ': ')
+                )
@@ -0,0 +1,444 @@
+""" A trie of paths for the DriveFileCached path cache
+
+Started 2026-10-19
+
+Copyright (C) 2018-2026 Marc Donner
+
+file_data['path'] maps each node_id to its path.  Held as a dict of
+strings, a node twelve folders down repeats the names of all twelve
+in its own path, and so does each of its siblings.  PathTrie holds
+the same mapping with the paths broken into their components
+('/', 'projects/', '2018/', 'budget.xls') and every component stored
+once, in a tree of entries kept in parallel lists:
+
+    parents :: the entry each entry extends (-1 for entry 0, the
+            empty path)
+    components :: the component each entry adds to its parent's path
+    ids :: the node_ids whose path ends at each entry (None, one
+            node_id or a list of them)
+    where :: node_id => entry
+
+The path of a node_id is rebuilt from its entry and the entries above
+it when it is asked for.  The paths of the entries that others hang
+from (i.e. of folders, a small share of the whole) are kept once
+they have been built, so that this is one concatenation.
+
+The trie also answers the questions a dict of strings cannot without
+a full scan:
+
+    resolve(path) :: the node_id whose path is path, by walking down
+            the components
+    under(prefix) :: every node_id whose path begins with prefix, by
+            walking down to prefix and then over everything beneath
+    move(old, new) :: move everything beneath a folder that has been
+            renamed or moved by touching only its children
+
+Walking down needs each entry's children (component => entry), which
+are worked out in one pass the first time they are wanted, so that a
+cache that is only read never pays for them.
+
+PathTrie behaves like a dict (it is a MutableMapping), so the code
+that reads and writes file_data['path'] does not need to know which
+it has.  In the cache file it is written by to_json() as a list of
+one string per entry, parents first:
+
+    "PARENT<tab>NODE_ID,NODE_ID<tab>COMPONENT"
+
+(the component last, since a name may hold any character).  The
+node_ids of an entry are written as a JSON list instead,
+"PARENT<tab>["NODE_ID", ...]<tab>COMPONENT", if any of them holds a
+',' or a tab or begins with '[': the synthetic keys for other users'
+files (~EMAIL/.../) are made from an email address, which may.
+PathTrie() accepts either form of row, or the dict of strings written
+by older versions.
+
+"""
+
+import json
+import re
+from array import array
+from collections.abc import MutableMapping
+
+# A component is a folder name with its '/', or a final name without
+PATH_COMPONENT = re.compile(r'[^/]*/|[^/]+')
+
+
+def split_path(path):
+    """Break path into components that join back into path.
+       Returns: list of string
+    """
+    return PATH_COMPONENT.findall(path)
+
+
+def path_table(value):
+    """The paths read from a cache file, in either form, for looking
+       things up in.
+       Returns: PathTrie (rows) or dict (the older form)
+    """
+    return PathTrie(value) if isinstance(value, list) else (value or {})
+
+
+def id_list(ids):
+    """Returns: list of node_id, from an entry of PathTrie.ids"""
+    if ids is None:
+        return []
+    return ids if isinstance(ids, list) else [ids]
+
+
+def ids_field(ids):
+    """The node_ids of an entry of PathTrie.ids as they are written in
+       a row: joined with ',', or as a JSON list if that would be
+       ambiguous.
+       Returns: string
+    """
+    node_ids = id_list(ids)
+    for node_id in node_ids:
+        if ',' in node_id or '\t' in node_id or node_id[:1] == '[':
+            return json.dumps(node_ids)
+    return ','.join(node_ids)
+
+
+def read_ids(field):
+    """The node_ids of an entry from their field in a row, as they are
+       held in PathTrie.ids.
+       Returns: None, node_id or list of node_id
+    """
+    if not field:
+        return None
+    node_ids = json.loads(field) if field[0] == '[' else field.split(',')
+    return node_ids if len(node_ids) > 1 else node_ids[0]
+
+
+class PathTrie(MutableMapping):
+    """node_id => path, with the paths held in a trie."""
+
+    def __init__(self, paths=None):
+        # Entry 0 is the empty path; every other path hangs from it
+        self.parents = array('l', [-1])
+        self.components = ['']
+        self.ids = [None]
+        # entry => dict of component => entry (or None), built on demand
+        self.children = None
+        # entries dropped from the trie, to be used again
+        self.free = []
+        # entry => path, for the entries others hang from, on demand,
+        # and the other way round, so that a path can be added beneath
+        # a folder already seen without walking down to it
+        self.prefixes = {}
+        self.prefix_entries = {}
+        self.where = {}
+        if isinstance(paths, list):
+            self.__load_rows(paths)
+        elif paths:
+            for node_id, path in paths.items():
+                self[node_id] = path
+
+    def __index_children(self):
+        """Build self.children in one pass over the entries."""
+        children = [None] * len(self.parents)
+        components = self.components
+        for entry, parent in enumerate(self.parents):
+            if parent < 0:
+                continue
+            table = children[parent]
+            if table is None:
+                children[parent] = table = {}
+            table[components[entry]] = entry
+        self.children = children
+
+    def __find(self, path, create):
+        """Walk down the trie to the entry for path.
+           Returns: integer, or None if it is not there (and not create)
+        """
+        if self.children is None:
+            self.__index_children()
+        children = self.children
+        entry = 0
+        for component in split_path(path):
+            table = children[entry]
+            child = table.get(component) if table else None
+            if child is None:
+                if not create:
+                    return None
+                child = self.__new_entry(entry, component)
+                if table is None:
+                    children[entry] = table = {}
+                table[component] = child
+            entry = child
+        return entry
+
+    def __new_entry(self, parent, component):
+        """Returns: integer (an unused entry for component of parent)"""
+        if self.free:
+            entry = self.free.pop()
+            self.parents[entry] = parent
+            self.components[entry] = component
+            self.ids[entry] = None
+            self.children[entry] = None
+            return entry
+        self.parents.append(parent)
+        self.components.append(component)
+        self.ids.append(None)
+        self.children.append(None)
+        return len(self.parents) - 1
+
+    def __prune(self, entry):
+        """Drop entry, and the entries above it, while they hold no
+           node_id and nothing extends them."""
+        children = self.children
+        while entry > 0 and self.ids[entry] is None and not children[entry]:
+            parent = self.parents[entry]
+            table = children[parent]
+            del table[self.components[entry]]
+            if not table:
+                children[parent] = None
+            self.parents[entry] = -1
+            self.components[entry] = None
+            self.prefix_entries.pop(self.prefixes.pop(entry, None), None)
+            self.free.append(entry)
+            entry = parent
+
+    def __add_id(self, entry, node_id):
+        """Record that the path of node_id ends at entry."""
+        ids = self.ids[entry]
+        if ids is None:
+            self.ids[entry] = node_id
+        elif isinstance(ids, list):
+            ids.append(node_id)
+        else:
+            self.ids[entry] = [ids, node_id]
+        self.where[node_id] = entry
+
+    def __remove_id(self, entry, node_id):
+        """Forget that the path of node_id ends at entry."""
+        ids = self.ids[entry]
+        if isinstance(ids, list):
+            ids.remove(node_id)
+            if len(ids) == 1:
+                self.ids[entry] = ids[0]
+        else:
+            self.ids[entry] = None
+
+    def __path(self, entry):
+        """Returns: string (the path that ends at entry)"""
+        if entry <= 0:
+            return ''
+        parent = self.parents[entry]
+        prefix = self.prefixes.get(parent)
+        if prefix is None:
+            prefix = self.__prefix(parent)
+        return prefix + self.components[entry]
+
+    def __prefix(self, entry):
+        """Build, and keep, the paths of entry and of the entries
+           above it that are not kept already.
+           Returns: string (the path that ends at entry)
+        """
+        parents = self.parents
+        prefixes = self.prefixes
+        chain = []
+        while entry > 0 and entry not in prefixes:
+            chain.append(entry)
+            entry = parents[entry]
+        path = prefixes.get(entry, '')
+        for link in reversed(chain):
+            path += self.components[link]
+            prefixes[link] = path
+            self.prefix_entries[path] = link
+        return path
+
+    def __locate(self, path):
+        """Find, or add, the entry for path, starting from the folder
+           it is in if that folder's path is kept.
+           Returns: integer
+        """
+        if not path:
+            return 0
+        cut = path.rfind('/', 0, len(path) - 1) + 1
+        parent = self.prefix_entries.get(path[:cut]) if cut else 0
+        if parent is None:
+            entry = self.__find(path, True)
+            # Keep the folder's path for its next child
+            self.__prefix(self.parents[entry])
+            return entry
+        if self.children is None:
+            self.__index_children()
+        table = self.children[parent]
+        component = path[cut:]
+        entry = table.get(component) if table else None
+        if entry is None:
+            entry = self.__new_entry(parent, component)
+            if table is None:
+                self.children[parent] = table = {}
+            table[component] = entry
+        return entry
+
+    def __getitem__(self, node_id):
+        return self.__path(self.where[node_id])
+
+    def get(self, node_id, default=None):
+        # __path(), written out, since this is called for every node
+        entry = self.where.get(node_id)
+        if entry is None:
+            return default
+        if entry == 0:
+            return ''
+        parent = self.parents[entry]
+        prefix = self.prefixes.get(parent)
+        if prefix is None:
+            prefix = self.__prefix(parent)
+        return prefix + self.components[entry]
+
+    def __contains__(self, node_id):
+        return node_id in self.where
+
+    def __setitem__(self, node_id, path):
+        old = self.where.get(node_id)
+        if old is not None:
+            if self.__path(old) == path:
+                return
+            self.__remove_id(old, node_id)
+            if self.children is None:
+                self.__index_children()
+            self.__prune(old)
+        self.__add_id(self.__locate(path), node_id)
+
+    def __delitem__(self, node_id):
+        entry = self.where.pop(node_id)
+        self.__remove_id(entry, node_id)
+        if self.children is None:
+            self.__index_children()
+        self.__prune(entry)
+
+    def __iter__(self):
+        return iter(self.where)
+
+    def __len__(self):
+        return len(self.where)
+
+    def resolve(self, path):
+        """Returns: the node_id whose path is path (the first recorded,
+           if there are several), or None"""
+        entry = self.__find(path, False)
+        if entry is None or self.ids[entry] is None:
+            return None
+        return id_list(self.ids[entry])[0]
+
+    def under(self, prefix):
+        """Find every node_id whose path begins with prefix.
+           Yields: node_id
+        """
+        components = split_path(prefix)
+        partial = ''
+        if components and not components[-1].endswith('/'):
+            # Part of a name: match each component that begins with it
+            partial = components.pop()
+        entry = self.__find(''.join(components), False)
+        if entry is None:
+            return
+        children = self.children
+        if partial:
+            stack = [child for component, child \
+                in (children[entry] or {}).items() \
+                if component.startswith(partial)]
+        else:
+            stack = [entry]
+        while stack:
+            entry = stack.pop()
+            yield from id_list(self.ids[entry])
+            if children[entry]:
+                stack.extend(children[entry].values())
+
+    def move(self, old_prefix, new_prefix):
+        """Move everything beneath old_prefix (the path of a folder that
+           has been renamed or moved) to beneath new_prefix.  The
+           entries beneath are moved as they are, so it is the folder's
+           children that are touched, not every descendant.
+        """
+        source = self.__find(old_prefix, False)
+        if source is None or not self.children[source]:
+            return
+        target = self.__find(new_prefix, True)
+        if target == source:
+            return
+        self.__graft(source, target)
+        self.__prune(source)
+        # The paths beneath have changed
+        self.prefixes = {}
+        self.prefix_entries = {}
+
+    def __graft(self, source, target):
+        """Hang the children of source from target, merging any that
+           target already has."""
+        children = self.children
+        moving = children[source]
+        children[source] = None
+        if children[target] is None:
+            children[target] = {}
+        table = children[target]
+        for component, child in moving.items():
+            existing = table.get(component)
+            if existing is None:
+                self.parents[child] = target
+                table[component] = child
+                continue
+            for node_id in id_list(self.ids[child]):
+                self.__add_id(existing, node_id)
+            self.ids[child] = None
+            if children[child]:
+                self.__graft(child, existing)
+            self.parents[child] = -1
+            self.components[child] = None
+            self.free.append(child)
+
+    def to_json(self):
+        """The trie as rows for the cache file, parents first (see
+           above).  Row 0 is the empty path.
+           Returns: list of string
+        """
+        if self.children is None:
+            self.__index_children()
+        children = self.children
+        rows = []
+        # (entry, its parent's row)
+        stack = [(0, -1)]
+        while stack:
+            entry, parent_row = stack.pop()
+            row = len(rows)
+            rows.append(str(parent_row) + '\t' \
+                + ids_field(self.ids[entry]) + '\t' \
+                + self.components[entry])
+            if children[entry]:
+                stack.extend((child, row) for child in children[entry].values())
+        return rows
+
+    def __load_rows(self, rows):
+        """Rebuild the trie from the rows written by to_json()."""
+        if not rows:
+            return
+        # A column at a time, since comprehensions are much faster than
+        # a loop over the rows, and by slicing rather than split(),
+        # whose lists would set the garbage collector off again and
+        # again
+        first = [row.find('\t') for row in rows]
+        second = [row.find('\t', start + 1) \
+            for row, start in zip(rows, first)]
+        self.parents = array('l', [int(row[:end]) \
+            for row, end in zip(rows, first)])
+        self.ids = [row[start + 1:end] or None \
+            for row, start, end in zip(rows, first, second)]
+        self.components = [row[end + 1:] for row, end in zip(rows, second)]
+        # Most entries hold one plain node_id, which needs no more work
+        self.where = {ids: entry for entry, ids in enumerate(self.ids) \
+            if ids and ',' not in ids and ids[0] != '['}
+        for entry, ids in enumerate(self.ids):
+            if ids and (',' in ids or ids[0] == '['):
+                self.ids[entry] = read_ids(ids)
+                for node_id in id_list(self.ids[entry]):
+                    self.where[node_id] = entry
+
+    def report(self):
+        """Returns: string (how many paths are held in how many
+           components)"""
+        return str(len(self.where)) + " paths in " \
+            + str(len(self.parents) - len(self.free)) + " components"
@@ -20,9 +20,20 @@ reports from the Google Drive metadata that the DriveFile class provides.
 # import sys
 import argparse
 import datetime
+import logging
 
 from drivefilecached import canonicalize_path
+from drivefilecached import CACHE_ENV
 from drivefilecached import DriveFileCached
+from drivelog import debug_enabled
+from drivelog import get_logger
+from drivelog import parse_log_levels
+from drivelog import setup_logging
+from driveowners import COLUMNS
+from driveowners import OwnerSummary
+from driveowners import SECTIONS
+from driveprofile import WorkProfiler
+from driveprofile import profile_prefix
 from drivefileraw import TestStats
 from drivefileraw import handle_status
 
@@ -32,10 +43,12 @@ from drivefileraw import handle_status
 
 APPLICATION_NAME = 'Drive Report'
 
+LOG = get_logger('report')
+
 class DriveReport(DriveFileCached):
     """Class to render tables of Google Drive object metadata."""
 
-    def __init__(self, debug=False):
+    def __init__(self, debug=False, service=None):
         self.render_list = []
         self.handlers = {
             'createdTime': self.get_created_time,
@@ -52,7 +65,7 @@ class DriveReport(DriveFileCached):
             'size': self.get_size,
             'trashed': self.get_trashed,
             }
-        super().__init__(debug)
+        super().__init__(debug, service)
         self.format = "HTML";
         self.fields = self.df_field_list()
         self.fields.append("path")
@@ -62,145 +75,143 @@ class DriveReport(DriveFileCached):
            the relevant metadata is in the cache.
            Returns: node_id
         """
-        if self.debug:
-            print("# get_id(node_id: " + str(node_id) + ")")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_id(node_id: %s)", node_id)
         node = self.get(node_id)
-        if self.debug:
-            print("#    => " + str(node['id']))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   => %s", node['id'])
         return node['id']
 
     def get_name(self, node_id):
         """Return the file name.
            Returns: string
         """
-        if self.debug:
-            print("# get_name(node_id: " + str(node_id) + ")")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_name(node_id: %s)", node_id)
         node = self.get(node_id)
-        if self.debug:
-            print("#    => " + str(node['name']))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   => %s", node['name'])
         return node['name']
 
     def get_parents(self, node_id):
         """Return paths to parents
            Returns: string (comma-delimited list of parent paths)
         """
-        if self.debug:
-            print("# get_parents(node_id: " + str(node_id) + ")")
-        node = self.get(node_id)
-        # now get the path to each of the parents ...
-        results = [self.get_path(parent_id) for parent_id in node['parents']] \
-                  if 'parents' in node else []
-        if self.debug:
-            print("#    => " + str(results))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_parents(node_id: %s)", node_id)
+        # every path to each of the parents, from the path index
+        results = self.get_parent_paths(node_id)
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   => %s", results)
         return ', '.join(results)
 
     def get_parent_count(self, node_id):
         """Return number of parents
            Returns: integer
         """
-        if self.debug:
-            print("# get_parents(node_id: " + str(node_id) + ")")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_parents(node_id: %s)", node_id)
         node = self.get(node_id)
         # now get the path to each of the parents ...
         results = len(node['parents']) if 'parents' in node else 0
-        if self.debug:
-            print("#    => " + str(results))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   => %s", results)
         return results
 
     def get_size(self, node_id):
         """Return size in bytes of file
            Returns: integer
         """
-        if self.debug:
-            print("# get_size(node_id: " + str(node_id) + ")")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_size(node_id: %s)", node_id)
         node = self.get(node_id)
         if 'size' in node:
             result = node['size']
         else:
             result = 0
-        if self.debug:
-            print("#    => " + str(result))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   => %s", result)
 
     def get_mimetype(self, node_id):
         """Return the mimeType
            Returns: string
         """
-        if self.debug:
-            print("# get_mimetype(node_id: " + str(node_id) + ")")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_mimetype(node_id: %s)", node_id)
         node = self.get(node_id)
-        if self.debug:
-            print("#    => " + str(node['mimeType']))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   => %s", node['mimeType'])
         return node['mimeType']
 
     def get_owners(self, node_id):
         """Return the list of owners
            Returns: comma-delimited list of owner email addresses
         """
-        if self.debug:
-            print("# get_owners(node_id: " + str(node_id) + ")")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_owners(node_id: %s)", node_id)
         node = self.get(node_id)
         # We will return a list of email addresses
         owner_list = [owner['emailAddress'] for owner in node['owners']] \
                      if 'owners' in node else []
         results = ", ".join(owner_list)
-        if self.debug:
-            print("#    => " + str(node['owners']))
-            print("#    => " + str(results))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   => %s", node['owners'])
+            LOG.debug("   => %s", results)
         return results
 
     def get_trashed(self, node_id):
         """Return the trashed flag
            Returns: Boolean
         """
-        if self.debug:
-            print("# get_trashed(node_id: " + str(node_id) + ")")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_trashed(node_id: %s)", node_id)
         node = self.get(node_id)
-        if self.debug:
-            print("#    => " + str(node['trashed']))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   => %s", node['trashed'])
         return node['trashed']
 
     def get_modified_time(self, file_id):
         """Return the modifiedTime string
            Returns: string
         """
-        if self.debug:
-            print("# get_modified_time(file_id: " + str(file_id) + ")")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_modified_time(file_id: %s)", file_id)
         node = self.get(file_id)
-        if self.debug:
-            print("#    => " + str(node['modifiedTime']))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   => %s", node['modifiedTime'])
         return node['modifiedTime']
 
     def get_created_time(self, node_id):
         """Return the createdTime string
            Returns: string
         """
-        if self.debug:
-            print("# get_created_time(node_id: " + str(node_id) + ")")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_created_time(node_id: %s)", node_id)
         node = self.get(node_id)
-        if self.debug:
-            print("#    => " + str(node['createdTime']))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   => %s", node['createdTime'])
         return node['createdTime']
 
     def get_ownedbyme(self, node_id):
         """Return the ownedByMe flag
            Returns: Boolean
         """
-        if self.debug:
-            print("# get_ownedbyme(node_id: " + str(node_id) + ")")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_ownedbyme(node_id: %s)", node_id)
         node = self.get(node_id)
-        if self.debug:
-            print("#    => " + str(node['ownedByMe']))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   => %s", node['ownedByMe'])
         return node['ownedByMe']
 
     def get_shared(self, node_id):
         """Return the shared flag
            Returns: Boolean
         """
-        if self.debug:
-            print("# get_shared(node_id: " + str(node_id) + ")")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("get_shared(node_id: %s)", node_id)
         node = self.get(node_id)
-        if self.debug:
-            print("#    => " + str(node['shared']))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("   => %s", node['shared'])
         return node['shared']
 
     def set_render_fields(self, field_list):
@@ -214,16 +225,14 @@ class DriveReport(DriveFileCached):
         """Given a node_id, retrieve the render fields for it.
            Returns: list of strings
         """
-        if self.debug:
-            print("# retrieve_item(" + str(node_id) + ")")
         result = []
         for field in self.render_list:
             if field in self.handlers:
                 result.append(self.handlers[field](node_id))
             else:
                 result.append(field)
-        if self.debug:
-            print("#   =>" + str(result))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("retrieve_item(%s) => %s", node_id, result)
         return result
 
     def retrieve_items(self, node_id_list):
@@ -231,13 +240,11 @@ class DriveReport(DriveFileCached):
            for each one.
            Returns: list of list of strings
         """
-        if self.debug:
-            print("# render_items(" + str(len(node_id_list)) + ")")
+        LOG.debug("render_items(%s)", len(node_id_list))
         result = []
         for node_id in node_id_list:
             result.append(self.retrieve_item(node_id))
-        if self.debug:
-            print("#   =>" + str(result))
+        LOG.debug("  =>%s", result)
         return result
 
     def render_items_html(self, node_id_list):
@@ -245,9 +252,7 @@ class DriveReport(DriveFileCached):
            Returns: list of list of string
         """
         # should make this an iterator!
-        if self.debug:
-            print("# render_items_html(len: " \
-                    + str(len(node_id_list)) + ")")
+        LOG.debug("render_items_html(len: %s)", len(node_id_list))
         result = ""
         result += "<table>\n"
         result += "<tr>"
@@ -266,8 +271,7 @@ class DriveReport(DriveFileCached):
         """Given a list of node_ids, render each one as TSV.
            Returns: list of list of string
         """
-        if self.debug:
-            print("# render_items_tsv(len: " + str(len(node_id_list)) + ")")
+        LOG.debug("render_items_tsv(len: %s)", len(node_id_list))
         result = ""
         for field in self.render_list:
             result += field + "\t"
@@ -278,6 +282,45 @@ class DriveReport(DriveFileCached):
             result += "\n"
         return result
 
+    def list_owner_summary(self, mine_only=False):
+        """Add up the cached files by owner, top-level folder and
+           mimeType, in one pass over the cache and without asking the
+           Drive or changing the cache.
+           Returns: OwnerSummary
+        """
+        LOG.debug("list_owner_summary(mine_only: %s)", mine_only)
+        summary = OwnerSummary(mine_only)
+        metadata = self.file_data['metadata']
+        for node_id in self.df_node_ids():
+            summary.add(node_id, metadata[node_id], self.cached_path)
+        return summary
+
+    def show_owner_summary(self, by_owner, sharing):
+        """ Display the totals by owner (by_owner) and where my shared
+            files are (sharing), as TSV. """
+        LOG.debug("show_owner_summary(by_owner: %s, sharing: %s)",
+                  by_owner, sharing)
+        if by_owner:
+            summary = self.list_owner_summary()
+            for section in SECTIONS:
+                self.__show_summary_table(summary, section, False)
+        if sharing:
+            summary = self.list_owner_summary(True)
+            # The owner is always me
+            for section in SECTIONS[1:]:
+                self.__show_summary_table(summary, section, True)
+
+    def __show_summary_table(self, summary, section, by_shared):
+        """Display one table of summary, with a total line."""
+        title = "my files by " if summary.mine_only else "files by "
+        self.df_print("# " + title + section + '\n')
+        self.df_print("# " + section + "\t" + "\t".join(COLUMNS) + '\n')
+        for key, counts in summary.rows(section, by_shared):
+            self.df_print(key + "\t" \
+                + "\t".join(str(count) for count in counts) + '\n')
+        self.df_print("# total\t" \
+            + "\t".join(str(count) for count in summary.total) + '\n')
+
     def __str__(self):
         result = "DriveReport:\n"
         result += "debug: " + str(self.debug) + "\n"
@@ -295,6 +338,17 @@ def setup_parser():
         "Use the Google Drive API (REST v3) to get information " + \
         "about files to which you have access."\
         )
+    parser.add_argument(
+        '--cache',
+        type=str,
+        metavar='PATH',
+        help='(Modifier) Keep the cache in PATH (default $' + CACHE_ENV + ' or ' + DriveFileCached.CACHE_PATH + ').'
+        )
+    parser.add_argument(
+        '--by-owner',
+        action='store_true',
+        help='Total the files and bytes in the cache by owner, top-level folder and mimeType.'
+        )
     parser.add_argument(
         '--cd',
         type=str,
@@ -315,11 +369,28 @@ def setup_parser():
         type=str,
         help='Generate JSON output.'
         )
+    parser.add_argument(
+        '--log-file',
+        type=str,
+        metavar='PATH',
+        help='(Modifier) Write debugging and log output to PATH instead of stderr.'
+        )
+    parser.add_argument(
+        '--log-level',
+        type=parse_log_levels,
+        metavar='LEVEL',
+        help='(Modifier) Log at LEVEL (e.g. DEBUG), or per component (e.g. report=DEBUG,raw=INFO).'
+        )
     parser.add_argument(
         '--newer',
         type=str,
         help='List all nodes modified since the specified date.'
         )
+    parser.add_argument(
+        '--mapped',
+        action='store_true',
+        help='(Modifier) Report on the cached nodes, read through the memory-mapped cache, instead of listing the Drive.'
+        )
     parser.add_argument(
         '-n', '--nocache',
         action='store_true',
@@ -330,11 +401,29 @@ def setup_parser():
         type=str,
         help='Send the output to the specified local file.'
         )
+    parser.add_argument(
+        '--profile',
+        type=str,
+        nargs='?',
+        const='',
+        metavar='PREFIX',
+        help='(Modifier) Profile the work with cProfile and write PREFIX.pstats and PREFIX.txt.'
+        )
+    parser.add_argument(
+        '--profile-memory',
+        action='store_true',
+        help='(Modifier) With --profile, also take a tracemalloc snapshot.'
+        )
     parser.add_argument(
         '-R', '--refresh',
         action='store_true',
         help='(Modifier) Update the cache.  For use with the --newer operator.'
         )
+    parser.add_argument(
+        '--sharing',
+        action='store_true',
+        help='Show how many of my files in the cache are shared, by top-level folder and mimeType.'
+        )
     parser.add_argument(
         '--showall',
         action='store_true',
@@ -345,6 +434,11 @@ def setup_parser():
         action='store_true',
         help="Display the status of the DriveFile object."
         )
+    parser.add_argument(
+        '--stats-json',
+        type=str,
+        help="(Modifier) On exit, write API and cache statistics as JSON to the specified file."
+        )
     parser.add_argument(
         '--tsv',
         type=str,
@@ -367,8 +461,7 @@ def setup_parser():
         """Get status of DriveFile instance.
            Returns: List of String
         """
-        if self.debug:
-            print("# df_status()")
+        LOG.debug("df_status()")
         result = super().df_status()
         result.append("# ========== Cache STATUS ==========\n")
         result.append("# cache['path']: '" \
@@ -399,11 +492,18 @@ def do_work():
 
     # Do the work ...
 
+    _ = setup_logging(args.log_level, args.log_file) \
+            if args.log_level or args.log_file else False
+
     # set the DEBUG flag if desired.
-    drive_file = DriveFileCached(True) if args.DEBUG \
+    debug = args.DEBUG or debug_enabled()
+    drive_file = DriveFileCached(True) if debug \
                 else DriveFileCached(False)
-    drive_report = DriveReport(True) if args.DEBUG \
+    drive_report = DriveReport(True) if debug \
                 else DriveReport(False)
+    if args.cache:
+        drive_file.set_cache_path(args.cache)
+        drive_report.set_cache_path(args.cache)
     drive_report.init_cache()
 
     # at this point we have drive_file, drive_report, and parser, 
@@ -462,7 +562,12 @@ def do_work():
     drive_report.df_print("# cwd: " + str(cwd) + "\n")
     drive_report.df_print("# cwd_fileid: " + str(cwd_node_id) + "\n")
 
-    _ = drive_file.init_cache() if args.nocache else drive_file.load_cache()
+    if args.nocache:
+        drive_file.init_cache()
+    elif args.mapped:
+        drive_file.load_mapped_cache()
+    else:
+        drive_file.load_cache()
 
     if args.status:
         result = drive_file.df_status()
@@ -470,16 +575,37 @@ def do_work():
             drive_file.df_print(_)
         exit()
 
-    node_id_list = [node['id'] for node in drive_report.list_all()]
-
-    print("# len(node_id_list): " + str(len(node_id_list)))
-    if drive_report.format == "TSV":
-        drive_report.df_print(drive_report.render_items_tsv(node_id_list))
-    elif drive_report.format == "JSON":
-        # JSON is not handled yet
-        drive_report.render_items_tsv(node_id_list)
+    profiler = WorkProfiler(
+        profile_prefix(teststats.program_name, args.profile),
+        args.profile_memory
+        ) if args.profile is not None else None
+    _ = profiler.start() if profiler else False
+
+    if args.by_owner or args.sharing:
+        # A summary of the cache, without listing the Drive
+        _ = drive_report.load_mapped_cache() if args.mapped \
+                else drive_report.load_cache()
+        drive_report.show_owner_summary(args.by_owner, args.sharing)
     else:
-        drive_report.render_items_HTML(node_id_list)
+        if args.mapped:
+            drive_report.load_mapped_cache()
+            node_id_list = drive_report.df_node_ids()
+        else:
+            node_id_list = [node['id'] for node in drive_report.list_all()]
+
+        print("# len(node_id_list): " + str(len(node_id_list)))
+        if drive_report.format == "TSV":
+            drive_report.df_print(
+                drive_report.render_items_tsv(node_id_list))
+        elif drive_report.format == "JSON":
+            # JSON is not handled yet
+            drive_report.render_items_tsv(node_id_list)
+        else:
+            drive_report.render_items_HTML(node_id_list)
+
+    if profiler:
+        for line in profiler.stop():
+            print(line, end='')
 
     # Done with the work
 
@@ -492,8 +618,13 @@ def do_work():
     else:
         print("# skip writing cache.")
 
+    _ = drive_report.df_dump_stats(args.stats_json) \
+            if args.stats_json else False
+
     wrapup_report = teststats.report_wrapup()
     drive_report.df_print(wrapup_report)
+    drive_report.df_close_output()
+    drive_file.df_close_output()
 
 
 def main():
@@ -0,0 +1,339 @@
+""" Offline tests for DriveFileCached, against drivefake's stand-in
+service
+
+Started 2026-10-19
+
+Copyright (C) 2018-2026 Marc Donner
+
+Run with: python3 -m unittest discover -p 'test_*.py'
+
+"""
+
+import json
+import os
+import posixpath
+import random
+import tempfile
+import unittest
+
+from drivebench import legacy_canonicalize_path
+from drivefake import FOLDERMIMETYPE
+from drivefake import ROOT_ID
+from drivefake import FakeDriveService
+from drivefake import make_file_data
+from drivefake import make_nodes
+from drivefake import make_shared_drives
+from drivefilecached import DriveFileCached
+from drivefilecached import SYNTHETIC_ROOT
+from drivefilecached import canonical_path
+from drivefilecached import canonicalize_path
+from drivepaths import SHARED_DRIVES
+from drivetrie import PathTrie
+
+NUM_DRIVES = 4
+NODES_PER_DRIVE = 150
+
+# The cases in the comments of canonicalize_path(), as (cwd, path,
+# canonical path), on which the legacy version is right too
+COMMENT_EXAMPLES = [
+    ('/', '//', '/'),
+    ('/cwd/', 'foo/bar/../whatever', '/cwd/foo/whatever'),
+    ('/cwd/', 'foo/bar/./whatever', '/cwd/foo/bar/whatever'),
+    ('/cwd/', '/foo/bar', '/foo/bar'),
+    ('/cwd/', 'foo/bar', '/cwd/foo/bar'),
+    ('/cwd/', '', '/cwd'),
+    ('/', '', '/'),
+    ('/', '/..', '/'),
+    ('/cwd/sub/', '../..', '/'),
+    ('/cwd/', '/foo//bar/', '/foo/bar'),
+    ]
+
+# Where the legacy version is wrong, as (cwd, path, canonical path,
+# what the legacy version gives): it lets a '..' cancel a '.' or an
+# empty component instead of the name before it, and it knows nothing
+# of the synthetic roots
+LEGACY_DIFFERENCES = [
+    ('/a/b/', './../..', '/', '/a'),
+    ('/a/b/', '..//..', '/', '/a'),
+    ('/a/', 'b/./..', '/a', '/a/b'),
+    ('/', 'a/.//../..', '/', '/a'),
+    ('/c/', '~drives/T/./..', '~drives', '/c/~drives/T'),
+    ('/c/', '~someone@example.com/.../x', '~someone@example.com/.../x',
+     '/c/~someone@example.com/.../x'),
+    ('~drives/T/', 'a', '~drives/T/a', '/~drives/T/a'),
+    ]
+
+# Components for random paths, including names that begin with '~'
+PATH_COMPONENTS = ['a', 'b', 'c d', '.', '..', '', '...', '.hidden',
+                   '~', '~notes']
+
+# Beginnings for random paths: relative, absolute, and beneath each
+# kind of synthetic root
+PATH_STARTS = ['', '', '/', '~drives/', '~drives/Team 1/',
+               '~someone@example.com/.../']
+
+# Working directories for random paths
+CWDS = ['/', '/a/', '/a/b/', '/c d/~notes/', '~drives/Team 1/',
+        '~drives/Team 1/a/', '~someone@example.com/.../',
+        '~someone@example.com/.../b/']
+
+
+def new_drive_file(service):
+    """Returns: DriveFileCached bound to service, with an empty cache,
+       printing nothing"""
+    drive_file = DriveFileCached(False, service)
+    drive_file.df_set_output(os.devnull)
+    drive_file.init_cache()
+    return drive_file
+
+
+def reference_path(cwd, path):
+    """What canonical_path() ought to give, worked out another way:
+       with posixpath.normpath(), beneath '/' so that '..' can not
+       climb out, keeping a synthetic root if it survives.
+       Returns: string
+    """
+    absolute = path[:1] == '/' or SYNTHETIC_ROOT.match(path)
+    full = path if absolute else cwd + path
+    root = full.split('/')[0]
+    result = posixpath.normpath('/' + full.lstrip('/'))
+    if root[:1] == '~' and (result == '/' + root \
+            or result.startswith('/' + root + '/')):
+        return result[1:]
+    return result
+
+
+def legacy_is_exact(cwd, path):
+    """Does the legacy canonicalizer give the right answer?  Not if
+       a '.' or an empty component comes before a '..', nor for a
+       path or cwd beneath a synthetic root.
+       Returns: Boolean
+    """
+    if SYNTHETIC_ROOT.match(path) or SYNTHETIC_ROOT.match(cwd):
+        return False
+    parts = path.split('/') if path[:1] == '/' \
+        else cwd.split('/')[:-1] + path.split('/')
+    if '..' not in parts:
+        return True
+    last = len(parts) - 1 - parts[::-1].index('..')
+    return not any(part in ['.', ''] for part in parts[1:last])
+
+
+class CanonicalPathTest(unittest.TestCase):
+    """The single-pass canonical_path() against the legacy version
+       and against reference_path()."""
+
+    def test_comment_examples(self):
+        for cwd, path, expected in COMMENT_EXAMPLES:
+            self.assertEqual(canonicalize_path(cwd, path, False), expected,
+                             (cwd, path))
+            self.assertEqual(legacy_canonicalize_path(cwd, path), expected,
+                             (cwd, path))
+
+    def test_legacy_differences(self):
+        for cwd, path, expected, legacy in LEGACY_DIFFERENCES:
+            self.assertFalse(legacy_is_exact(cwd, path), (cwd, path))
+            self.assertEqual(canonicalize_path(cwd, path, False), expected,
+                             (cwd, path))
+            self.assertEqual(reference_path(cwd, path), expected,
+                             (cwd, path))
+            self.assertEqual(legacy_canonicalize_path(cwd, path), legacy,
+                             (cwd, path))
+
+    def test_random_paths(self):
+        rng = random.Random(40)
+        uncached = canonical_path.__wrapped__
+        differences = 0
+        for _ in range(20000):
+            cwd = rng.choice(CWDS)
+            path = rng.choice(PATH_STARTS) + '/'.join(
+                rng.choice(PATH_COMPONENTS) \
+                for _ in range(rng.randint(0, 6)))
+            new = uncached(cwd, path)
+            self.assertEqual(new, reference_path(cwd, path), (cwd, path))
+            self.assertEqual(canonicalize_path(cwd, path, False), new)
+            if legacy_is_exact(cwd, path):
+                self.assertEqual(new, legacy_canonicalize_path(cwd, path),
+                                 (cwd, path))
+            elif new != legacy_canonicalize_path(cwd, path):
+                differences += 1
+        # The cases where the two differ were generated, and checked
+        self.assertGreater(differences, 0)
+
+
+class SharedDrivesTest(unittest.TestCase):
+    """show_drives() scans every shared drive into ~drives/NAME/."""
+
+    def setUp(self):
+        self.drives, self.drive_nodes = make_shared_drives(
+            NUM_DRIVES, NODES_PER_DRIVE, seed=45)
+        self.service = FakeDriveService(
+            make_nodes(100, seed=45) + self.drive_nodes, page_size=40,
+            drives=self.drives)
+        self.drive_file = new_drive_file(self.service)
+        self.drive_file.show_drives(workers=2)
+
+    def expected_path(self, node_id):
+        """Work out a drive node's path from the fake's own nodes.
+           Returns: string
+        """
+        nodes = {node['id']: node for node in self.drive_nodes}
+        node = nodes[node_id]
+        folder = node['mimeType'].endswith('.folder')
+        path = node['name'] + ('/' if folder else '')
+        while 'parents' in node:
+            node = nodes[node['parents'][0]]
+            path = node['name'] + '/' + path
+        return SHARED_DRIVES + path
+
+    def test_every_node_cached(self):
+        metadata = self.drive_file.file_data['metadata']
+        for node in self.drive_nodes:
+            self.assertIn(node['id'], metadata)
+            self.assertEqual(metadata[node['id']]['driveId'],
+                             node['driveId'])
+
+    def test_paths_rooted_per_drive(self):
+        for node in self.drive_nodes:
+            self.assertEqual(self.drive_file.get_path(node['id']),
+                             self.expected_path(node['id']))
+
+    def test_resolve_from_cache(self):
+        calls = sum(self.drive_file.call_count.values())
+        for node in self.drive_nodes[::17]:
+            path = self.expected_path(node['id']).rstrip('/')
+            self.assertEqual(self.drive_file.resolve_path(path), node['id'])
+        # Every drive was listed in full, so the Drive is not asked
+        self.assertEqual(sum(self.drive_file.call_count.values()), calls)
+
+
+class IncompleteDriveService(FakeDriveService):
+    """A multi-drive service that notes the corpus of every listing,
+       and can answer that its results are incomplete."""
+
+    def __init__(self, nodes, drives):
+        super().__init__(nodes, page_size=40, drives=drives)
+        self.corpora = []
+        self.incomplete = False
+
+    def do_list(self, **kwargs):
+        self.corpora.append((kwargs.get('corpora'), kwargs.get('driveId')))
+        response = super().do_list(**kwargs)
+        if self.incomplete:
+            response['incompleteSearch'] = True
+        return response
+
+
+class ListingTest(unittest.TestCase):
+    """Folders are listed in their own corpus, and only a complete
+       listing is recorded as one."""
+
+    def setUp(self):
+        self.drives, self.drive_nodes = make_shared_drives(
+            2, NODES_PER_DRIVE, seed=45)
+        self.service = IncompleteDriveService(
+            make_nodes(100, seed=45) + self.drive_nodes, self.drives)
+        self.drive_file = new_drive_file(self.service)
+
+    def test_incomplete_not_listed(self):
+        self.service.incomplete = True
+        self.assertTrue(self.drive_file.list_children('root'))
+        self.assertNotIn(ROOT_ID, self.drive_file.file_data['listed'])
+        asked = len(self.service.corpora)
+        # So the next look lists it again
+        self.service.incomplete = False
+        self.drive_file.list_children('root')
+        self.assertGreater(len(self.service.corpora), asked)
+        self.assertIn(ROOT_ID, self.drive_file.file_data['listed'])
+        asked = len(self.service.corpora)
+        self.drive_file.list_children('root')
+        self.assertEqual(len(self.service.corpora), asked)
+        self.assertEqual(set(self.service.corpora), {(None, None)})
+
+    def test_shared_drive_folder(self):
+        drive_id = self.drives[0]['id']
+        folder = next(node for node in self.drive_nodes \
+            if node['driveId'] == drive_id and node['id'] != drive_id \
+                and node['mimeType'] == FOLDERMIMETYPE)
+        self.drive_file.get(folder['id'])
+        children = self.drive_file.list_children(folder['id'])
+        self.assertEqual(
+            {child['id'] for child in children},
+            {node['id'] for node in self.drive_nodes \
+                if folder['id'] in node.get('parents', [])})
+        self.assertEqual(self.service.corpora, [('drive', drive_id)])
+
+
+class ListDiffTest(unittest.TestCase):
+    """list_diff() against a snapshot, from the cache alone."""
+
+    def setUp(self):
+        nodes = make_nodes(300, seed=48)
+        self.old = make_file_data(nodes)
+        self.directory = tempfile.TemporaryDirectory()
+        self.old_cache = os.path.join(self.directory.name, 'old.json')
+        with open(self.old_cache, 'w', encoding='utf-8') as old_file:
+            json.dump({'metadata': self.old['metadata'],
+                       'path': dict(self.old['path'])}, old_file)
+        file_data = make_file_data(nodes)
+        metadata = file_data['metadata']
+        # Rename a folder, and add a file whose folder is not cached
+        self.folder = next(node for node in nodes[1:] \
+            if node['mimeType'] == FOLDERMIMETYPE)
+        metadata[self.folder['id']] = dict(self.folder, name='renamed')
+        metadata['N8000001'] = {
+            'id': 'N8000001', 'name': 'stray.txt', 'mimeType': 'text/plain',
+            'parents': ['0NOTCACHED'], 'trashed': False,
+            }
+        # Leave the paths to be worked out from the metadata
+        file_data['path'] = PathTrie({ROOT_ID: '/'})
+        self.drive_file = new_drive_file(FakeDriveService(nodes))
+        self.drive_file.file_data = file_data
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_cache_alone(self):
+        changes = {(change, node_id): (old_path, new_path) \
+            for change, node_id, old_path, new_path, _ \
+            in self.drive_file.list_diff(self.old_cache)}
+        old_path = self.old['path'][self.folder['id']]
+        self.assertEqual(
+            changes[('renamed', self.folder['id'])],
+            (old_path, old_path[:-len(self.folder['name']) - 1] + 'renamed/'))
+        self.assertEqual(changes[('added', 'N8000001')], ('', 'stray.txt'))
+        self.assertEqual(len(changes), 2)
+        # Nothing was asked of the Drive, nor added to the cache
+        self.assertEqual(sum(self.drive_file.call_count.values()), 0)
+        self.assertFalse(self.drive_file.file_data['dirty'])
+        self.assertEqual(len(self.drive_file.file_data['path']), 1)
+
+
+class TildePathTest(unittest.TestCase):
+    """Only the synthetic roots make a path that begins with '~'
+       absolute."""
+
+    def test_shared_drive_paths(self):
+        self.assertEqual(canonical_path('/cwd/', '~drives/Team 1/a/../b'),
+                         '~drives/Team 1/b')
+        self.assertEqual(canonical_path('/cwd/', '~drives'), '~drives')
+        self.assertEqual(canonical_path('~drives/Team 1/', 'a'),
+                         '~drives/Team 1/a')
+
+    def test_other_users_files(self):
+        self.assertEqual(
+            canonical_path('/cwd/', '~someone@example.com/.../report'),
+            '~someone@example.com/.../report')
+
+    def test_names_beginning_with_tilde(self):
+        self.assertEqual(canonical_path('/cwd/', '~notes/x'),
+                         '/cwd/~notes/x')
+        self.assertEqual(canonical_path('/cwd/', '~'), '/cwd/~')
+        self.assertEqual(canonical_path('/cwd/', '~drivesx/a'),
+                         '/cwd/~drivesx/a')
+        self.assertEqual(canonical_path('/cwd/', '~bob/.../a'),
+                         '/cwd/~bob/.../a')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,210 @@
+""" Offline tests for DriveFileRaw, against drivefake's stand-in service
+
+Started 2026-10-19
+
+Copyright (C) 2018-2026 Marc Donner
+
+Run with: python3 -m unittest discover -p 'test_*.py'
+
+"""
+
+import os
+import unittest
+
+import httplib2
+from googleapiclient import errors
+
+from drivefake import FOLDERMIMETYPE
+from drivefake import ROOT_ID
+from drivefake import FakeDriveService
+from drivefake import make_nodes
+from drivefake import make_shared_drives
+from drivefileraw import DriveFileRaw
+
+# Shared drives, and the nodes in each, for the multi-drive tests
+NUM_DRIVES = 5
+NODES_PER_DRIVE = 250
+PAGE_SIZE = 100
+
+
+class FailingDriveService(FakeDriveService):
+    """A multi-drive service on which scanning one drive fails."""
+
+    def __init__(self, nodes, drives, failing):
+        super().__init__(nodes, page_size=PAGE_SIZE, drives=drives)
+        self.failing = failing
+
+    def do_list(self, **kwargs):
+        if kwargs.get('driveId') == self.failing:
+            raise errors.HttpError(
+                httplib2.Response({'status': 403}),
+                b'{"error": {"message": "Forbidden"}}'
+                )
+        return super().do_list(**kwargs)
+
+
+class RecordingDriveService(FakeDriveService):
+    """A multi-drive service that notes the corpus of every listing,
+       and can answer that its results are incomplete."""
+
+    def __init__(self, nodes, drives):
+        super().__init__(nodes, page_size=PAGE_SIZE, drives=drives)
+        self.corpora = []
+        self.incomplete = False
+
+    def do_list(self, **kwargs):
+        self.corpora.append((kwargs.get('corpora'), kwargs.get('driveId')))
+        response = super().do_list(**kwargs)
+        if self.incomplete:
+            response['incompleteSearch'] = True
+        return response
+
+
+class DrivePagesTest(unittest.TestCase):
+    """list_drive_pages() and list_all_drive_pages()."""
+
+    def setUp(self):
+        self.drives, self.drive_nodes = make_shared_drives(
+            NUM_DRIVES, NODES_PER_DRIVE, seed=45)
+        self.nodes = make_nodes(200, seed=45)
+        self.service = FakeDriveService(
+            self.nodes + self.drive_nodes, page_size=PAGE_SIZE,
+            drives=self.drives)
+        self.drive_file = self.new_drive_file(self.service)
+
+    @staticmethod
+    def new_drive_file(service):
+        """Returns: DriveFileRaw bound to service, printing nothing"""
+        drive_file = DriveFileRaw(False, service)
+        drive_file.df_set_output(os.devnull)
+        return drive_file
+
+    def in_drive(self, drive_id):
+        """Returns: set of the node_ids in drive_id, but its top folder"""
+        return {node['id'] for node in self.drive_nodes \
+            if node['driveId'] == drive_id and node['id'] != drive_id}
+
+    def test_list_drives(self):
+        self.assertEqual(
+            [(drive['id'], drive['name']) \
+                for drive in self.drive_file.list_drives()],
+            [(drive['id'], drive['name']) for drive in self.drives])
+
+    def test_list_drive_pages(self):
+        drive_id = self.drives[2]['id']
+        pages = list(self.drive_file.list_drive_pages(drive_id))
+        self.assertEqual([len(page) for page in pages], [100, 100, 49])
+        ids = [node['id'] for page in pages for node in page]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(set(ids), self.in_drive(drive_id))
+        self.assertTrue(all(node['driveId'] == drive_id \
+            for page in pages for node in page))
+        self.assertEqual(self.drive_file.call_count['list_drive'], 3)
+
+    def test_list_drive_pages_empty(self):
+        pages = list(self.drive_file.list_drive_pages('0DNONE'))
+        self.assertEqual(pages, [[]])
+
+    def test_list_all_drive_pages(self):
+        seen = {}
+        finished = []
+        for drive, page in self.drive_file.list_all_drive_pages(
+                self.drives, workers=3):
+            self.assertNotIn(drive['id'], finished,
+                             "a page arrived after the drive's marker")
+            if page is None:
+                finished.append(drive['id'])
+                continue
+            seen.setdefault(drive['id'], set()).update(
+                node['id'] for node in page)
+        self.assertEqual(sorted(finished),
+                         sorted(drive['id'] for drive in self.drives))
+        for drive in self.drives:
+            self.assertEqual(seen[drive['id']], self.in_drive(drive['id']))
+        self.assertEqual(self.drive_file.call_count['list_drive'],
+                         NUM_DRIVES * 3)
+
+    def test_list_all_drive_pages_failure(self):
+        failing = self.drives[1]['id']
+        service = FailingDriveService(
+            self.nodes + self.drive_nodes, self.drives, failing)
+        drive_file = self.new_drive_file(service)
+        finished = []
+        seen = set()
+        for drive, page in drive_file.list_all_drive_pages(
+                self.drives, workers=2):
+            if page is None:
+                finished.append(drive['id'])
+            else:
+                seen.update(node['id'] for node in page)
+        # The failed drive is reported and left out; the rest finish
+        self.assertNotIn(failing, finished)
+        self.assertEqual(len(finished), NUM_DRIVES - 1)
+        self.assertFalse(seen & self.in_drive(failing))
+
+    def test_list_all_skips_shared_drives(self):
+        ids = {node['id'] for node in self.drive_file.list_all()}
+        self.assertFalse(ids & {node['id'] for node in self.drive_nodes})
+
+
+class ParentCorpusTest(unittest.TestCase):
+    """Queries by parent ask the corpus the parent is in, and never
+       the slow and possibly incomplete allDrives."""
+
+    def setUp(self):
+        self.drives, self.drive_nodes = make_shared_drives(
+            2, NODES_PER_DRIVE, seed=45)
+        self.nodes = make_nodes(200, seed=45)
+        self.service = RecordingDriveService(
+            self.nodes + self.drive_nodes, self.drives)
+        self.drive_file = DrivePagesTest.new_drive_file(self.service)
+
+    def children_of(self, nodes, parent_id):
+        """Returns: set of the node_ids in nodes with parent parent_id"""
+        return {node['id'] for node in nodes \
+            if parent_id in node.get('parents', [])}
+
+    def test_my_drive_folder(self):
+        children = self.drive_file.list_children(ROOT_ID)
+        self.assertEqual({child['id'] for child in children},
+                         self.children_of(self.nodes, ROOT_ID))
+        self.assertEqual(set(self.service.corpora), {(None, None)})
+
+    def test_shared_drive_folder(self):
+        drive_id = self.drives[1]['id']
+        folder = next(node for node in self.drive_nodes \
+            if node['driveId'] == drive_id and node['id'] != drive_id \
+                and node['mimeType'] == FOLDERMIMETYPE)
+        for parent_id in [drive_id, folder['id']]:
+            children = self.drive_file.list_children(parent_id, drive_id)
+            self.assertEqual({child['id'] for child in children},
+                             self.children_of(self.drive_nodes, parent_id))
+        self.assertEqual(set(self.service.corpora), {('drive', drive_id)})
+
+    def test_named_children(self):
+        drive_id = self.drives[0]['id']
+        child = next(node for node in self.drive_nodes \
+            if node.get('parents') == [drive_id])
+        found = self.drive_file.list_named_children(
+            drive_id, child['name'], drive_id)
+        self.assertIn(child['id'], [node['id'] for node in found])
+        self.drive_file.list_named_children(ROOT_ID, 'nothing')
+        self.assertEqual(self.service.corpora,
+                         [('drive', drive_id), (None, None)])
+
+    def test_incomplete_search(self):
+        self.service.incomplete = True
+        children, complete = self.drive_file.list_children_complete(ROOT_ID)
+        self.assertTrue(children)
+        self.assertFalse(complete)
+        # An incomplete search that found nothing proves nothing
+        self.assertIsNone(
+            self.drive_file.list_named_children(ROOT_ID, 'nothing'))
+        self.service.incomplete = False
+        self.assertTrue(self.drive_file.list_children_complete(ROOT_ID)[1])
+        self.assertEqual(
+            self.drive_file.list_named_children(ROOT_ID, 'nothing'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
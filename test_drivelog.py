@@ -0,0 +1,59 @@
+""" Offline tests for the logging set up by drivelog.py
+
+Started 2026-10-19
+
+Copyright (C) 2018-2026 Marc Donner
+
+Run with: python3 -m unittest discover -p 'test_*.py'
+
+"""
+
+import logging
+import os
+import unittest
+
+from drivelog import COMPONENTS
+from drivelog import ROOT
+from drivelog import get_logger
+from drivelog import parse_log_levels
+from drivelog import set_debug_logging
+from drivelog import setup_logging
+
+
+def effective_levels():
+    """Returns: dict of component => effective logging level"""
+    return {component: get_logger(component).getEffectiveLevel() \
+        for component in COMPONENTS}
+
+
+class DebugLoggingTest(unittest.TestCase):
+    """set_debug_logging() on top of --log-level."""
+
+    def tearDown(self):
+        setup_logging(log_file=os.devnull)
+        for handler in list(logging.getLogger(ROOT).handlers):
+            logging.getLogger(ROOT).removeHandler(handler)
+            handler.close()
+
+    def test_per_component(self):
+        setup_logging(parse_log_levels('raw=DEBUG,cached=INFO'),
+                      os.devnull)
+        configured = effective_levels()
+        self.assertEqual(configured['raw'], logging.DEBUG)
+        self.assertEqual(configured['cached'], logging.INFO)
+        self.assertEqual(configured['report'], logging.WARNING)
+        set_debug_logging(True)
+        self.assertEqual(set(effective_levels().values()), {logging.DEBUG})
+        set_debug_logging(False)
+        self.assertEqual(effective_levels(), configured)
+
+    def test_all_at_once(self):
+        setup_logging(parse_log_levels('INFO'), os.devnull)
+        set_debug_logging(True)
+        self.assertEqual(set(effective_levels().values()), {logging.DEBUG})
+        set_debug_logging(False)
+        self.assertEqual(set(effective_levels().values()), {logging.INFO})
+
+
+if __name__ == '__main__':
+    unittest.main()
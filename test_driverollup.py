@@ -0,0 +1,99 @@
+""" Offline tests for RollupIndex: keeping it up to date node by node
+must come to the same totals as building it afresh
+
+Started 2026-10-19
+
+Copyright (C) 2018-2026 Marc Donner
+
+Run with: python3 -m unittest discover -p 'test_*.py'
+
+"""
+
+import random
+import unittest
+
+from drivefake import FOLDERMIMETYPE
+from drivefake import ROOT_ID
+from drivefake import make_file_data
+from drivefake import make_nodes
+from driverollup import RollupIndex
+from driverollup import is_folder
+
+
+def built_totals(metadata):
+    """Returns: dict of folder node_id => (bytes, files, folders), from
+       an index built afresh"""
+    index = RollupIndex(metadata)
+    index.build()
+    return {node_id: index.get(node_id) for node_id in metadata}
+
+
+def update(index, metadata, node):
+    """Replace a node in metadata as DriveFileCached does, telling the
+       index about the copy it counted and the new one."""
+    old = metadata.get(node['id'])
+    metadata[node['id']] = node
+    if old:
+        index.remove(node['id'], old)
+    index.add(node['id'], node)
+
+
+class RollupIndexTest(unittest.TestCase):
+    """remove() and add() against build()."""
+
+    def check(self, index, metadata):
+        """Compare every folder's totals with a fresh build."""
+        expected = built_totals(metadata)
+        for node_id in metadata:
+            self.assertEqual(index.get(node_id), expected[node_id], node_id)
+
+    def test_trash_folder_above_shared_node(self):
+        # n2 is in both root and n1; trashing n1 must leave it counted
+        # once under root
+        metadata = {
+            ROOT_ID: {'id': ROOT_ID, 'name': 'My Drive',
+                      'mimeType': FOLDERMIMETYPE},
+            'n1': {'id': 'n1', 'name': 'n1', 'mimeType': FOLDERMIMETYPE,
+                   'parents': [ROOT_ID]},
+            'n2': {'id': 'n2', 'name': 'n2', 'mimeType': 'text/plain',
+                   'size': '57', 'parents': [ROOT_ID, 'n1']},
+            'n3': {'id': 'n3', 'name': 'n3', 'mimeType': 'text/plain',
+                   'size': '200', 'parents': ['n1']},
+            }
+        index = RollupIndex(metadata)
+        index.build()
+        self.assertEqual(index.get(ROOT_ID), (257, 2, 1))
+        update(index, metadata, dict(metadata['n1'], trashed=True))
+        self.assertEqual(index.get(ROOT_ID), (57, 1, 0))
+        self.check(index, metadata)
+        update(index, metadata, dict(metadata['n1'], trashed=False))
+        self.assertEqual(index.get(ROOT_ID), (257, 2, 1))
+        self.check(index, metadata)
+
+    def test_random_updates(self):
+        rng = random.Random(38)
+        nodes = make_nodes(800, seed=38)
+        metadata = make_file_data(nodes)['metadata']
+        folders = [node['id'] for node in nodes if is_folder(node)]
+        # Give some nodes a second parent
+        for node in rng.sample(nodes[1:], 60):
+            if 'parents' in node:
+                node['parents'] = node['parents'] + [rng.choice(folders)]
+        index = RollupIndex(metadata)
+        index.build()
+        self.check(index, metadata)
+        for _ in range(300):
+            node = dict(metadata[rng.choice(nodes[1:])['id']])
+            change = rng.randrange(3)
+            if change == 0:
+                node['trashed'] = not node.get('trashed')
+            elif change == 1 and 'parents' in node:
+                node['parents'] = [rng.choice(folders)]
+            elif not is_folder(node):
+                node['size'] = str(rng.randrange(1 << 20))
+            update(index, metadata, node)
+            self.check(index, metadata)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+""" Offline tests for the Drive Shell, against drivefake's stand-in
+service
+
+Started 2026-10-19
+
+Copyright (C) 2018-2026 Marc Donner
+
+Run with: python3 -m unittest discover -p 'test_*.py'
+
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import httplib2
+from googleapiclient import errors
+
+import drivefileraw
+import driveshell
+from drivefake import FakeDriveService
+from drivefake import make_nodes
+from drivefilecached import DriveFileCached
+
+
+class GetFailsService(FakeDriveService):
+    """A service on which every get fails."""
+
+    def do_get(self, fileId, fields=None, supportsAllDrives=False):
+        raise errors.HttpError(
+            httplib2.Response({'status': 500}),
+            b'{"error": {"message": "Backend Error"}}'
+            )
+
+
+class ParseSeparatorTest(unittest.TestCase):
+    """--separator is checked once, when the arguments are parsed."""
+
+    def test_accepted(self):
+        for separator in [driveshell.SEPARATOR, '', '== {n:03d} {command}',
+                          '{{literal}} {command!r}']:
+            self.assertEqual(driveshell.parse_separator(separator),
+                             separator)
+
+    def test_rejected(self):
+        for separator in ['{x}', '{0}', '{}', '{n', '}{', '{command[1]}',
+                          '{command.upper}', '{n:s}']:
+            with self.assertRaises(argparse.ArgumentTypeError,
+                                   msg=separator):
+                driveshell.parse_separator(separator)
+
+
+class ShellErrorsTest(unittest.TestCase):
+    """A Drive or file error is reported, and the shell carries on, in
+       interactive mode as in batch mode."""
+
+    def setUp(self):
+        self.service = GetFailsService(make_nodes(50, seed=43))
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.directory.name, 'cache.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_shell(self, argv, lines):
+        """Run the shell on the fake service, typing lines at it, and
+           check that it dumps the cache on the way out.
+           Returns: (exit status, what it printed)
+        """
+        args = driveshell.setup_parser().parse_args(
+            ['--cache', self.cache_path] + argv)
+        output = io.StringIO()
+        with mock.patch.object(
+                driveshell, 'DriveFileCached',
+                lambda debug: DriveFileCached(debug, self.service)), \
+             mock.patch('builtins.input', side_effect=lines + [EOFError]), \
+             mock.patch.object(DriveFileCached, 'dump_cache') as dump_cache, \
+             contextlib.redirect_stdout(output):
+            status = driveshell.drive_shell(drivefileraw.TestStats(), args)
+        dump_cache.assert_called_once_with()
+        return status, output.getvalue()
+
+    def test_interactive(self):
+        status, output = self.run_shell([], ['ls /', 'pwd'])
+        self.assertEqual(status, 0)
+        self.assertIn('Backend Error', output)
+        # The command after the failure ran
+        self.assertIn('pwd: /', output)
+
+    def test_batch(self):
+        commands = os.path.join(self.directory.name, 'commands')
+        with open(commands, 'w', encoding='utf-8') as command_file:
+            command_file.write('ls /\npwd\n')
+        status, output = self.run_shell(['-c', commands], [])
+        self.assertEqual(status, 1)
+        self.assertIn('# [1] failed: ', output)
+        self.assertIn('# [2] pwd', output)
+
+    def test_missing_commands(self):
+        # Refused when the arguments are parsed, before the cache is
+        # loaded
+        missing = os.path.join(self.directory.name, 'missing')
+        errors_out = io.StringIO()
+        with contextlib.redirect_stderr(errors_out), \
+             self.assertRaises(SystemExit) as context:
+            driveshell.setup_parser().parse_args(['-c', missing])
+        self.assertEqual(context.exception.code, 2)
+        self.assertIn("can't open", errors_out.getvalue())
+        self.assertIn(missing, errors_out.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
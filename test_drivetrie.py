@@ -0,0 +1,67 @@
+""" Offline tests for PathTrie
+
+Started 2026-10-19
+
+Copyright (C) 2018-2026 Marc Donner
+
+Run with: python3 -m unittest discover -p 'test_*.py'
+
+"""
+
+import json
+import unittest
+
+from drivefake import make_file_data
+from drivefake import make_nodes
+from drivetrie import PathTrie
+
+# Synthetic keys that hold the row delimiters, and the paths they
+# stand for
+AWKWARD_PATHS = {
+    '~"smith, j"@example.com/.../': '~"smith, j"@example.com/.../',
+    '~tab\there@example.com/.../': '~tab\there@example.com/.../',
+    '[bracketed]@example.com': '/[bracketed]',
+    }
+
+
+def round_trip(trie):
+    """Returns: PathTrie, read back from trie written as in the cache
+       file"""
+    return PathTrie(json.loads(json.dumps(trie.to_json())))
+
+
+class PathTrieRowsTest(unittest.TestCase):
+    """to_json() and reading the rows back."""
+
+    def setUp(self):
+        self.paths = make_file_data(make_nodes(500, seed=49))['path']
+        self.trie = PathTrie(dict(self.paths))
+
+    def test_round_trip(self):
+        self.assertEqual(dict(round_trip(self.trie)), dict(self.paths))
+
+    def test_awkward_ids(self):
+        for node_id, path in AWKWARD_PATHS.items():
+            self.trie[node_id] = path
+        # Two node_ids at one path, one of them awkward
+        self.trie['0PLAIN'] = '/[bracketed]'
+        expected = dict(self.paths, **AWKWARD_PATHS)
+        expected['0PLAIN'] = '/[bracketed]'
+        self.assertEqual(dict(round_trip(self.trie)), expected)
+
+    def test_awkward_components(self):
+        self.trie['0TABS'] = '/a\tb,c/[d]\te'
+        self.assertEqual(round_trip(self.trie)['0TABS'], '/a\tb,c/[d]\te')
+
+    def test_plain_rows(self):
+        # Rows with the node_ids joined by ',', as written before
+        trie = PathTrie(['-1\t\t', '0\troot\t/', '1\tA,B\tx'])
+        self.assertEqual(dict(trie), {'root': '/', 'A': '/x', 'B': '/x'})
+
+    def test_older_dict(self):
+        self.assertEqual(dict(PathTrie({'root': '/', 'A': '/x'})),
+                         {'root': '/', 'A': '/x'})
+
+
+if __name__ == '__main__':
+    unittest.main()
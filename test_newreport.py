@@ -0,0 +1,129 @@
+""" Offline tests for the owner and sharing summaries of newreport.py,
+against a cache built by drivefake
+
+Started 2026-10-19
+
+Copyright (C) 2018-2026 Marc Donner
+
+Run with: python3 -m unittest discover -p 'test_*.py'
+
+"""
+
+import os
+import unittest
+
+from drivefake import FOLDERMIMETYPE
+from drivefake import FakeDriveService
+from drivefake import make_file_data
+from drivefake import make_nodes
+from driveowners import NO_OWNER
+from driveowners import SECTIONS
+from driveowners import UNKNOWN_FOLDER
+from driveowners import top_folder
+from drivequery import node_size
+from drivetrie import PathTrie
+from newreport import DriveReport
+
+# A folder whose parent is not cached, and a file in it
+ORPHANS = [
+    {
+        'id': 'N9000001',
+        'name': 'stray',
+        'mimeType': FOLDERMIMETYPE,
+        'parents': ['0NOTCACHED'],
+        'owners': [{'emailAddress': 'me@example.com', 'me': True}],
+        'ownedByMe': True,
+        'shared': False,
+        'trashed': False,
+        },
+    {
+        'id': 'N9000002',
+        'name': 'stray.dat',
+        'mimeType': 'text/plain',
+        'size': '1000',
+        'parents': ['N9000001'],
+        'owners': [{'emailAddress': 'me@example.com', 'me': True}],
+        'ownedByMe': True,
+        'shared': True,
+        'trashed': False,
+        },
+    ]
+
+
+def expected_summary(nodes, paths, mine_only):
+    """Add up nodes the long way round, from the paths make_file_data()
+       gave them.
+       Returns: (dict of section => dict of key => counts, total)
+    """
+    tables = {section: {} for section in SECTIONS}
+    total = [0, 0, 0, 0]
+    for node in nodes:
+        if node['mimeType'] == FOLDERMIMETYPE or node['trashed']:
+            continue
+        if mine_only and not node['ownedByMe']:
+            continue
+        size = node_size(node) or 0
+        shared = 1 if node['shared'] else 0
+        path = paths.get(node['id'])
+        keys = {
+            'owner': node['owners'][0]['emailAddress'] \
+                if node.get('owners') else NO_OWNER,
+            'folder': top_folder(path) if path else UNKNOWN_FOLDER,
+            'mimeType': node['mimeType'],
+            }
+        for counts in [total] + [
+                tables[section].setdefault(key, [0, 0, 0, 0]) \
+                for section, key in keys.items()]:
+            counts[0] += 1
+            counts[1] += size
+            counts[2] += shared
+            counts[3] += size * shared
+    return tables, total
+
+
+class OwnerSummaryTest(unittest.TestCase):
+    """list_owner_summary() from the cache alone."""
+
+    def setUp(self):
+        self.nodes = make_nodes(600, seed=50)
+        file_data = make_file_data(self.nodes)
+        self.paths = dict(file_data['path'])
+        for node in ORPHANS:
+            file_data['metadata'][node['id']] = node
+            file_data['ref_count'][node['id']] = 1
+        # Leave every other path to be worked out from the metadata
+        for node in self.nodes[1::2]:
+            del file_data['path'][node['id']]
+        file_data['path'] = PathTrie(file_data['path'])
+        self.report = DriveReport(False, FakeDriveService(self.nodes))
+        self.report.df_set_output(os.devnull)
+        self.report.file_data = file_data
+
+    def check(self, mine_only):
+        """Compare list_owner_summary(mine_only) with the long way."""
+        paths_before = len(self.report.file_data['path'])
+        summary = self.report.list_owner_summary(mine_only)
+        tables, total = expected_summary(
+            self.nodes + ORPHANS, self.paths, mine_only)
+        for section in SECTIONS:
+            self.assertEqual(summary.tables[section], tables[section],
+                             section)
+        self.assertEqual(summary.total, total)
+        # Nothing was asked of the Drive, nor added to the cache
+        self.assertEqual(sum(self.report.call_count.values()), 0)
+        self.assertFalse(self.report.file_data['dirty'])
+        self.assertEqual(len(self.report.file_data['path']), paths_before)
+        return summary
+
+    def test_by_owner(self):
+        summary = self.check(False)
+        self.assertEqual(summary.tables['folder'][UNKNOWN_FOLDER],
+                         [1, 1000, 1, 1000])
+        self.assertIn('~', ''.join(summary.tables['folder']))
+
+    def test_sharing(self):
+        self.check(True)
+
+
+if __name__ == '__main__':
+    unittest.main()